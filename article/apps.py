@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class ArticleConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'article'
+
+    def ready(self):
+        from page.signal_handlers import connect_purge
+
+        connect_purge(self.get_model("Author"), self.get_model("ArticleCategory"))
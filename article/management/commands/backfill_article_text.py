@@ -0,0 +1,47 @@
+"""
+Fill in the word count, reading time and excerpt of existing articles.
+
+Articles work these out from their body when they are saved, see
+``ArticlePage.save``; this catches up the ones saved before that, or after
+the extraction in page/text.py changes. Pages are streamed with
+``.iterator()`` and written back in batches with ``bulk_update``, so memory
+use doesn't grow with the number of articles. Revisions are left alone.
+"""
+from django.core.management.base import BaseCommand
+
+from article.models import ArticlePage
+from page.cache import PAGE_CONTENT_NAMESPACES, bump_namespace
+
+FIELDS = ["word_count", "reading_time", "excerpt"]
+
+
+class Command(BaseCommand):
+    help = "Work out the word count, reading time and excerpt of every article."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=200)
+        parser.add_argument("--missing", action="store_true", help="Only articles without a word count")
+
+    def handle(self, *args, **options):
+        pages = ArticlePage.objects.only("pk", "body").order_by("pk")
+        if options["missing"]:
+            pages = pages.filter(word_count=0)
+
+        batch = []
+        updated = 0
+        for page in pages.iterator(chunk_size=options["batch_size"]):
+            page.update_text_stats()
+            batch.append(page)
+            if len(batch) >= options["batch_size"]:
+                updated += self.write(batch)
+                batch = []
+        if batch:
+            updated += self.write(batch)
+
+        if updated:
+            bump_namespace(*PAGE_CONTENT_NAMESPACES)
+        self.stdout.write("Updated {} articles".format(updated))
+
+    def write(self, batch):
+        ArticlePage.objects.bulk_update(batch, FIELDS)
+        return len(batch)
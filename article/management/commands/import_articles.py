@@ -0,0 +1,369 @@
+"""
+Bulk import articles, authors, categories, tags and images from JSONL or CSV.
+
+Each input record describes one article:
+
+    {
+        "title": "Hello world",
+        "slug": "hello-world",                  # optional
+        "date_published": "2023-06-24",         # optional
+        "image": "photos/hello.jpg",            # optional, relative to --image-root
+        "body": [{"type": "paragraph_block", "value": "<p>Hi</p>"}],
+        "tags": ["django", "wagtail"],
+        "categories": ["News"],
+        "authors": [
+            {"first_name": "John", "last_name": "Smith",
+             "email": "john@example.com", "image": "people/john.jpg"}
+        ]
+    }
+
+In CSV files the list columns (``body``, ``tags``, ``categories``,
+``authors``) hold JSON, or for ``tags``/``categories`` a ``;`` separated list.
+
+Pages are written straight into the tree under the given ArticleIndexPage
+in batches, without revisions or signals, so run ``update_index`` and
+``rebuild_references_index`` once the import has finished.
+"""
+import csv
+import json
+import os
+import time
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Lower
+from django.template.defaultfilters import slugify
+from django.utils import timezone
+
+from taggit.models import Tag
+
+from wagtail.images import get_image_model
+from wagtail.models import Page
+from wagtail.utils.file import hash_filelike
+
+from article.models import (
+    ArticleCategory,
+    ArticleIndexPage,
+    ArticlePage,
+    ArticlePageTag,
+    ArticlePeopleRelationship,
+    Author,
+)
+from article.utils import next_free_slug, bulk_create_with_unique_slugs
+
+
+class Command(BaseCommand):
+    help = "Bulk import articles from a JSONL or CSV file under an ArticleIndexPage."
+
+    def add_arguments(self, parser):
+        parser.add_argument("input", help="Path to a .jsonl or .csv file")
+        parser.add_argument(
+            "--parent", required=True,
+            help="ID or slug of the ArticleIndexPage to import under",
+        )
+        parser.add_argument("--format", choices=["jsonl", "csv"])
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--image-root", default=".",
+            help="Directory image paths in the input are relative to",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            help="File recording progress, so an interrupted import can resume",
+        )
+
+    def handle(self, *args, **options):
+        self.image_root = options["image_root"]
+        self.parent = self.get_parent(options["parent"])
+        input_format = options["format"] or (
+            "csv" if options["input"].endswith(".csv") else "jsonl"
+        )
+
+        checkpoint = self.load_checkpoint(options["checkpoint"], options["input"])
+        skip = checkpoint["processed"]
+        if skip:
+            self.stdout.write("Resuming after {} records".format(skip))
+
+        started = time.monotonic()
+        batch = []
+        position = 0
+        for position, record in enumerate(
+                self.read_records(options["input"], input_format), start=1):
+            if position <= skip:
+                continue
+            batch.append(record)
+            if len(batch) >= options["batch_size"]:
+                self.import_batch(batch, position, checkpoint, options)
+                batch = []
+        if batch:
+            self.import_batch(batch, position, checkpoint, options)
+
+        elapsed = time.monotonic() - started
+        imported = checkpoint["processed"] - skip
+        self.stdout.write(self.style.SUCCESS(
+            "Imported {} articles in {:.1f}s ({:.0f}/s). "
+            "Run update_index and rebuild_references_index next.".format(
+                imported, elapsed, imported / elapsed if elapsed else 0,
+            )
+        ))
+
+    def get_parent(self, value):
+        parents = ArticleIndexPage.objects.all()
+        lookup = {"pk": value} if value.isdigit() else {"slug": value}
+        try:
+            return parents.get(**lookup)
+        except ArticleIndexPage.DoesNotExist:
+            raise CommandError("No ArticleIndexPage matches {!r}".format(value))
+        except ArticleIndexPage.MultipleObjectsReturned:
+            raise CommandError("More than one ArticleIndexPage matches {!r}, use its ID".format(value))
+
+    def read_records(self, path, input_format):
+        # Records are streamed one at a time so memory only holds one batch.
+        with open(path, newline="", encoding="utf-8") as f:
+            if input_format == "csv":
+                for row in csv.DictReader(f):
+                    yield self.parse_csv_row(row)
+            else:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+
+    def parse_csv_row(self, row):
+        record = dict(row)
+        for key in ("body", "authors", "tags", "categories"):
+            value = (record.get(key) or "").strip()
+            if value.startswith("["):
+                record[key] = json.loads(value)
+            elif key in ("tags", "categories"):
+                record[key] = [v.strip() for v in value.split(";") if v.strip()]
+            else:
+                record[key] = []
+        return record
+
+    def load_checkpoint(self, path, input_path):
+        checkpoint = {"input": os.path.abspath(input_path), "processed": 0}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                saved = json.load(f)
+            if saved.get("input") != checkpoint["input"]:
+                raise CommandError("Checkpoint {} belongs to {}".format(path, saved.get("input")))
+            checkpoint = saved
+        checkpoint["path"] = path
+        return checkpoint
+
+    def save_checkpoint(self, checkpoint):
+        if not checkpoint["path"]:
+            return
+        tmp_path = checkpoint["path"] + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({k: v for k, v in checkpoint.items() if k != "path"}, f)
+        os.replace(tmp_path, checkpoint["path"])
+
+    def import_batch(self, records, position, checkpoint, options):
+        started = time.monotonic()
+        with transaction.atomic():
+            images = self.get_images(
+                [r.get("image") for r in records]
+                + [a.get("image") for r in records for a in r.get("authors") or []]
+            )
+            authors = self.get_authors(records, images)
+            categories = self.get_categories(records)
+            tags = self.get_tags(records)
+            pages = self.create_pages(records, images)
+
+            ArticlePeopleRelationship.objects.bulk_create([
+                ArticlePeopleRelationship(page_id=page.pk, author=authors[key], sort_order=order)
+                for page, record in zip(pages, records)
+                for order, key in enumerate(self.author_keys(record))
+                if key in authors
+            ])
+            ArticlePageTag.objects.bulk_create([
+                ArticlePageTag(content_object_id=page.pk, tag_id=tag_id)
+                for page, record in zip(pages, records)
+                for tag_id in {tags[name] for name in record.get("tags") or []}
+            ])
+            through = ArticlePage.categories.through
+            through.objects.bulk_create([
+                through(articlepage_id=page.pk, articlecategory_id=category_id)
+                for page, record in zip(pages, records)
+                for category_id in {categories[name].pk for name in record.get("categories") or []}
+            ])
+
+        # Only move the checkpoint on once the batch has been committed.
+        checkpoint["processed"] = position
+        self.save_checkpoint(checkpoint)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write("{} articles imported ({} in {:.2f}s, {:.0f}/s)".format(
+            position, len(records), elapsed, len(records) / elapsed if elapsed else 0,
+        ))
+
+    def get_images(self, paths):
+        """
+        Returns a dict of path -> Image. Files are hashed as a stream and
+        matched against `Image.file_hash`, so an image already in the library
+        (or repeated in the batch) is only stored once.
+        """
+        Image = get_image_model()
+        hashes = {}
+        for path in set(filter(None, paths)):
+            with open(os.path.join(self.image_root, path), "rb") as f:
+                hashes[path] = hash_filelike(f)
+
+        existing = {}
+        for image in Image.objects.filter(file_hash__in=set(hashes.values())).order_by("pk"):
+            existing.setdefault(image.file_hash, image)
+
+        images = {}
+        for path, file_hash in hashes.items():
+            if file_hash not in existing:
+                with open(os.path.join(self.image_root, path), "rb") as f:
+                    image = Image(
+                        title=os.path.basename(path),
+                        file=File(f, name=os.path.basename(path)),
+                        file_size=os.fstat(f.fileno()).st_size,
+                        file_hash=file_hash,
+                    )
+                    image.save()
+                existing[file_hash] = image
+            images[path] = existing[file_hash]
+        return images
+
+    def author_key(self, author):
+        if author.get("email"):
+            return author["email"].lower()
+        return "{} {}".format(author.get("first_name", ""), author.get("last_name", "")).lower()
+
+    def author_keys(self, record):
+        return [self.author_key(author) for author in record.get("authors") or []]
+
+    def get_authors(self, records, images):
+        wanted = {}
+        for record in records:
+            for author in record.get("authors") or []:
+                wanted.setdefault(self.author_key(author), author)
+
+        authors = {}
+        emails = [key for key in wanted if "@" in key]
+        for author in Author.objects.annotate(email_lower=Lower("email")).filter(email_lower__in=emails):
+            authors.setdefault(author.email_lower, author)
+        names = [(a.get("first_name", ""), a.get("last_name", "")) for k, a in wanted.items() if "@" not in k]
+        if names:
+            for author in Author.objects.filter(
+                    first_name__in={n[0] for n in names}, last_name__in={n[1] for n in names}):
+                authors.setdefault("{} {}".format(author.first_name, author.last_name).lower(), author)
+
+        new_authors = []
+        for key, data in wanted.items():
+            if key in authors:
+                continue
+            if not data.get("image"):
+                self.stderr.write("Skipping new author {!r}, an image is required".format(key))
+                continue
+            author = Author(
+                first_name=data.get("first_name", ""),
+                last_name=data.get("last_name", ""),
+                email=data.get("email", ""),
+                image=images[data["image"]],
+            )
+            authors[key] = author
+            new_authors.append(author)
+        bulk_create_with_unique_slugs(
+            new_authors, ["{}-{}".format(a.first_name, a.last_name) for a in new_authors]
+        )
+        return authors
+
+    def get_categories(self, records):
+        """
+        Returns a dict of name -> category. Names are matched
+        case-insensitively, like tags.
+        """
+        names = {name for record in records for name in record.get("categories") or []}
+        existing = {}
+        for category in ArticleCategory.objects.annotate(name_lower=Lower("name")).filter(
+                name_lower__in={name.lower() for name in names}).order_by("pk"):
+            existing.setdefault(category.name_lower, category)
+        new_categories = {}
+        for name in sorted(names):
+            if name.lower() not in existing:
+                new_categories.setdefault(name.lower(), ArticleCategory(name=name))
+        bulk_create_with_unique_slugs(
+            list(new_categories.values()), [c.name for c in new_categories.values()]
+        )
+        existing.update(new_categories)
+        return {name: existing[name.lower()] for name in names}
+
+    def get_tags(self, records):
+        """
+        Returns a dict of name -> tag id. Names are matched case-insensitively,
+        so "django" reuses an existing "Django", and new tags get unique slugs,
+        so "C++" and "C" can both be created.
+        """
+        names = {name for record in records for name in record.get("tags") or []}
+        existing = {}
+        for tag in Tag.objects.annotate(name_lower=Lower("name")).filter(
+                name_lower__in={name.lower() for name in names}).order_by("pk"):
+            existing.setdefault(tag.name_lower, tag)
+        new_tags = {}
+        for name in sorted(names):
+            if name.lower() not in existing:
+                new_tags.setdefault(name.lower(), Tag(name=name))
+        bulk_create_with_unique_slugs(list(new_tags.values()), [tag.name for tag in new_tags.values()])
+        existing.update(new_tags)
+        return {name: existing[name.lower()].pk for name in names}
+
+    def create_pages(self, records, images):
+        """
+        Allocates treebeard paths for the whole batch at once and inserts the
+        base Page rows and the ArticlePage rows with one bulk insert each.
+        """
+        parent = Page.objects.select_for_update().get(pk=self.parent.pk)
+        last_child = parent.get_last_child()
+        position = Page._str2int(last_child.path[-Page.steplen:]) if last_child else 0
+        taken = set(parent.get_children().values_list("slug", flat=True))
+        content_type = ContentType.objects.get_for_model(ArticlePage)
+        now = timezone.now()
+
+        pages = []
+        for record in records:
+            position += 1
+            slug = next_free_slug(slugify(record.get("slug") or record["title"]), taken, 255, "-")
+            taken.add(slug)
+            page = ArticlePage(
+                title=record["title"],
+                draft_title=record["title"],
+                slug=slug,
+                content_type=content_type,
+                path=Page._get_path(parent.path, parent.depth + 1, position),
+                depth=parent.depth + 1,
+                numchild=0,
+                url_path="{}{}/".format(parent.url_path, slug),
+                locale_id=parent.locale_id,
+                live=True,
+                has_unpublished_changes=False,
+                first_published_at=now,
+                last_published_at=now,
+                date_published=record.get("date_published") or None,
+                article_image=images.get(record.get("image")),
+                body=record.get("body") or [],
+            )
+            # save() isn't called, so work the listing text out here.
+            page.update_text_stats()
+            pages.append(page)
+
+        base_pages = Page.objects.bulk_create([
+            Page(**{f.attname: getattr(page, f.attname) for f in Page._meta.concrete_fields})
+            for page in pages
+        ])
+        for page, base_page in zip(pages, base_pages):
+            page.pk = page.id = page.page_ptr_id = base_page.pk
+        # bulk_create() refuses multi-table inherited models, so the
+        # ArticlePage rows go in through the same insert it uses internally.
+        ArticlePage._base_manager._insert(
+            pages, fields=ArticlePage._meta.local_concrete_fields
+        )
+        Page.objects.filter(pk=parent.pk).update(numchild=F("numchild") + len(pages))
+        return pages
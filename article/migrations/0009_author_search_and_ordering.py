@@ -0,0 +1,26 @@
+# Generated by Django 4.2.30 on 2026-10-19 04:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('article', '0008_alter_articlepage_body'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='author',
+            options={'ordering': ['last_name', 'first_name'], 'verbose_name': 'Author', 'verbose_name_plural': 'Authors'},
+        ),
+        migrations.AlterField(
+            model_name='author',
+            name='email',
+            field=models.EmailField(blank=True, db_index=True, max_length=254),
+        ),
+        migrations.AddIndex(
+            model_name='author',
+            index=models.Index(fields=['last_name', 'first_name'], name='article_aut_last_na_dba78b_idx'),
+        ),
+    ]
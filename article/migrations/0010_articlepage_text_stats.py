@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-19 04:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('article', '0009_author_search_and_ordering'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='articlepage',
+            name='excerpt',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='articlepage',
+            name='reading_time',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Reading time in minutes'),
+        ),
+        migrations.AddField(
+            model_name='articlepage',
+            name='word_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
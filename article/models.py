@@ -1,10 +1,10 @@
 
 """Blog listing and blog detail pages."""
 from django import forms
-from django.contrib import messages
 from django.db import models
-from django.shortcuts import render
+from django.shortcuts import redirect, render
 from django.template.defaultfilters import slugify
+from django.utils.http import urlencode
 
 from modelcluster.models import ClusterableModel
 from modelcluster.fields import ParentalKey, ParentalManyToManyField
@@ -18,21 +18,29 @@ from wagtail.admin.panels import (
     MultiFieldPanel,
 )
 from wagtail.fields import StreamField
+from wagtail.images.models import Filter
 from wagtail.models import Page, Orderable
 from wagtail.contrib.routable_page.models import RoutablePageMixin, route
+from wagtail.search import index
 from wagtail.snippets.models import register_snippet
 
-from .utils import unique_slugify
+from .utils import save_with_unique_slug
 
 from page.blocks import BaseStreamBlock
+from page.cache import get_or_compute, namespace_key
+from page.edge_cache import add_surrogate_keys, instance_key, model_key
+from page.renditions import generate_in_background
+from page.text import stream_text_stats
 
+AVATAR_FILTER = "fill-50x50"
 
-@register_snippet
-class Author(ClusterableModel):
+
+class Author(index.Indexed, ClusterableModel):
     """
     A Django model to store Author objects.
-    It uses the `@register_snippet` decorator to allow it to be accessible
-    via the Snippets UI (e.g. /admin/snippets/base/people/)
+    It is registered as a snippet with `AuthorViewSet` in
+    article/wagtail_hooks.py, so it is accessible via the Snippets UI
+    (e.g. /admin/snippets/article/author/)
 
     `Author` uses the `ClusterableModel`, which allows the relationship with
     another model to be stored locally to the 'parent' model (e.g. a PageModel)
@@ -43,7 +51,7 @@ class Author(ClusterableModel):
     """
     first_name = models.CharField("First name", max_length=254)
     last_name = models.CharField("Last name", max_length=254)
-    email = models.EmailField(blank=True)
+    email = models.EmailField(blank=True, db_index=True)
     slug = models.SlugField(
         max_length=255,
         unique=True,
@@ -69,13 +77,25 @@ class Author(ClusterableModel):
         FieldPanel("email"),
     ]
 
+    search_fields = [
+        index.SearchField("first_name"),
+        index.SearchField("last_name"),
+        index.SearchField("email"),
+        index.SearchField("slug"),
+        index.AutocompleteField("first_name"),
+        index.AutocompleteField("last_name"),
+        index.AutocompleteField("email"),
+    ]
+
     @property
     def thumb_image(self):
-        # Returns an empty string if there is no profile pic or the rendition
-        # file can't be found.
+        # Returns an empty string until the avatar rendition exists; a
+        # missing one is generated in the background rather than holding
+        # up the listing. Prefetch the renditions, see AuthorViewSet.
         try:
-            return self.image.get_rendition("fill-50x50").img_tag()
-        except:  # noqa: E722 FIXME: remove bare 'except:'
+            return self.image.find_existing_rendition(Filter(AVATAR_FILTER)).img_tag()
+        except self.image.get_rendition_model().DoesNotExist:
+            generate_in_background(self.image_id, AVATAR_FILTER)
             return ""
 
     def __str__(self):
@@ -85,12 +105,14 @@ class Author(ClusterableModel):
     def save(self, *args, **kwargs):
         if not self.slug:
             slug = slugify(f"{ self.first_name }-{ self.last_name }")
-            unique_slugify(self, slug)
+            return save_with_unique_slug(self, slug, super().save, *args, **kwargs)
         return super().save(*args, **kwargs)
 
     class Meta:
         verbose_name = "Author"
         verbose_name_plural = "Authors"
+        ordering = ["last_name", "first_name"]
+        indexes = [models.Index(fields=["last_name", "first_name"])]
 
 
 class ArticlePeopleRelationship(Orderable, models.Model):
@@ -143,7 +165,7 @@ class ArticleCategory(models.Model):
     # save model and create unique slug url
     def save(self, *args, **kwargs):
         if not self.slug:
-            unique_slugify(self, self.name)
+            return save_with_unique_slug(self, self.name, super().save, *args, **kwargs)
         return super().save(*args, **kwargs)
 
 
@@ -169,8 +191,9 @@ class ArticleIndexPage(RoutablePageMixin, Page):
     def get_context(self, request, *args, **kwargs):
         """Adding custom stuff to our context."""
         context = super().get_context(request, *args, **kwargs)
-        context["articles"] = ArticlePage.objects.live().public()
+        context["articles"] = ArticlePage.objects.live().public().defer("body")
         context["categories"] = ArticleCategory.objects.all()
+        context["missing_tag"] = request.GET.get("missing_tag")
         return context
 
     # This defines a Custom view that utilizes Tags. This view will return all
@@ -179,14 +202,21 @@ class ArticleIndexPage(RoutablePageMixin, Page):
     # http://docs.wagtail.io/en/latest/reference/contrib/routablepage.html
     @route(r"^tags/$")
     def all_article_tags(self, request):
-        tags = ArticlePageTag.objects.all().order_by("tag__name")
+        # One row per tag rather than per tagged article, cached in the "tags"
+        # namespace, which publishing a page bumps.
+        tags = get_or_compute(
+            namespace_key("tags", "index"),
+            lambda: list(Tag.objects.filter(pk__in=ArticlePageTag.objects.values("tag")).order_by("name")),
+            60 * 15,
+        )
+        add_surrogate_keys(request, model_key(Tag))
         context = {"tags": tags}
         return render(request, "article/article_tags_index_page.html", context)
 
     # Returns the child Article  Page objects for this Article Index Page.
     # If a tag is used then it will filter the articles by tag.
     def get_articles(self, tag=None):
-        articles = ArticlePage.objects.live().descendant_of(self)
+        articles = ArticlePage.objects.live().descendant_of(self).defer("body")
         if tag:
             articles = articles.filter(tags=tag)
         return articles
@@ -196,11 +226,14 @@ class ArticleIndexPage(RoutablePageMixin, Page):
         try:
             tag = Tag.objects.get(slug=tag)
         except Tag.DoesNotExist:
+            # Passed in the query string rather than as a message, which would
+            # need a session and make the index page uncacheable.
+            url = self.url
             if tag:
-                msg = 'There are no articles tagged with "{}"'.format(tag)
-                messages.add_message(request, messages.INFO, msg)
-            return redirect(self.url)
+                url += "?" + urlencode({"missing_tag": tag})
+            return redirect(url)
 
+        add_surrogate_keys(request, instance_key(tag))
         articles = self.get_articles(tag=tag)
         context = {"tag": tag, "articles": articles}
         return render(request, "article/article_tag_index_page.html", context)
@@ -236,6 +269,12 @@ class ArticlePage(Page):
 
     tags = ClusterTaggableManager(through=ArticlePageTag, blank=True)
 
+    # Worked out from the body whenever it is saved, so listings can show
+    # them without loading the body, see page/text.py.
+    word_count = models.PositiveIntegerField(default=0, editable=False)
+    reading_time = models.PositiveIntegerField("Reading time in minutes", default=0, editable=False)
+    excerpt = models.TextField(blank=True, editable=False)
+
     # Specifies that these pages can only be created with ArticleIndexPage types.
     parent_page_types = ['ArticleIndexPage']
 
@@ -261,5 +300,20 @@ class ArticlePage(Page):
 
     def get_context(self, request):
         context = super(ArticlePage, self).get_context(request)
-        context["tags"] = self.tags.all().order_by("name")
+        context["tags"] = list(self.tags.all().order_by("name"))
+        context["categories"] = list(self.categories.all())
+        add_surrogate_keys(request, *(instance_key(obj) for obj in context["tags"] + context["categories"]))
         return context
+
+    def update_text_stats(self):
+        self.word_count, self.reading_time, self.excerpt = stream_text_stats(self.body)
+
+    def save(self, *args, **kwargs):
+        # Saving a draft only updates the page's revision fields; the body
+        # is saved when it is published.
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or "body" in update_fields:
+            self.update_text_stats()
+            if update_fields is not None:
+                kwargs["update_fields"] = list(update_fields) + ["word_count", "reading_time", "excerpt"]
+        return super().save(*args, **kwargs)
@@ -1,5 +1,6 @@
 from django import template
 from article.models import Author
+from page.edge_cache import add_surrogate_keys, model_key
 
 register = template.Library()
 
@@ -7,6 +8,7 @@ register = template.Library()
 # Authors snippets
 @register.inclusion_tag('article/tags/authors.html', takes_context=True)
 def authors(context):
+    add_surrogate_keys(context['request'], model_key(Author))
     return {
         'authors': Author.objects.all(),
         'context': context,
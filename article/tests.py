@@ -1,3 +1,130 @@
-from django.test import TestCase
+import io
+import json
+import os
+import shutil
+import tempfile
 
-# Create your tests here.
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from taggit.models import Tag
+
+from wagtail.images import get_image_model
+from wagtail.images.tests.utils import get_test_image_file
+from wagtail.models import Page
+
+from .models import ArticleCategory, ArticleIndexPage, ArticlePage, Author
+from .utils import bulk_unique_slugify, unique_slugify
+
+
+class MediaRootMixin:
+    """
+    Stores uploads in a temporary directory on the local filesystem, whatever
+    storage the settings pick for production.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings = override_settings(
+            MEDIA_ROOT=self.media_root,
+            STORAGES={
+                "default": {"BACKEND": "page.storage.FileSystemStorage"},
+                "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+            },
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def create_author(self, first_name, last_name, **kwargs):
+        image = get_image_model().objects.create(title="avatar", file=get_test_image_file())
+        return Author.objects.create(first_name=first_name, last_name=last_name, image=image, **kwargs)
+
+
+class UniqueSlugifyTests(MediaRootMixin, TestCase):
+    def test_unique_slugify_skips_taken_slugs(self):
+        self.create_author("John", "Smith")
+        self.create_author("John", "Smith")
+        author = Author(first_name="John", last_name="Smith")
+        unique_slugify(author, "John Smith")
+        self.assertEqual(author.slug, "john-smith-3")
+
+    def test_unique_slugify_keeps_own_slug(self):
+        author = self.create_author("John", "Smith")
+        unique_slugify(author, "John Smith")
+        self.assertEqual(author.slug, "john-smith")
+
+    def test_unique_slugify_truncates_to_make_room_for_suffix(self):
+        value = "a" * 255
+        self.create_author("a", "b", slug=value)
+        author = Author(first_name="a", last_name="b")
+        unique_slugify(author, value)
+        self.assertEqual(author.slug, "a" * 253 + "-2")
+
+    def test_bulk_unique_slugify_within_batch(self):
+        self.create_author("John", "Smith")
+        authors = [Author(first_name="John", last_name="Smith") for _ in range(2)]
+        authors.append(Author(first_name="Jane", last_name="Doe"))
+        bulk_unique_slugify(authors, ["John Smith", "John Smith", "Jane Doe"])
+        self.assertEqual([a.slug for a in authors], ["john-smith-2", "john-smith-3", "jane-doe"])
+
+    def test_bulk_unique_slugify_requires_a_value_per_instance(self):
+        with self.assertRaises(ValueError):
+            bulk_unique_slugify([Author()], [])
+
+
+class ImportArticlesTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        root = Page.objects.get(depth=1)
+        self.index = root.add_child(instance=ArticleIndexPage(title="Articles", slug="articles-import"))
+
+    def import_records(self, *records):
+        path = os.path.join(self.media_root, "articles.jsonl")
+        with open(path, "w") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+        call_command("import_articles", path, parent=str(self.index.pk), stdout=io.StringIO())
+
+    def test_tags_with_clashing_slugs_are_all_created(self):
+        self.import_records({"title": "One", "tags": ["C++", "C"]})
+        page = ArticlePage.objects.get(title="One")
+        self.assertEqual(
+            sorted(page.tags.values_list("name", "slug")),
+            [("C", "c"), ("C++", "c-2")],
+        )
+
+    def test_tags_match_existing_names_case_insensitively(self):
+        django = Tag.objects.create(name="Django", slug="django")
+        self.import_records(
+            {"title": "One", "tags": ["django"]},
+            {"title": "Two", "tags": ["Django", "django"]},
+        )
+        self.assertEqual(Tag.objects.filter(name__iexact="django").count(), 1)
+        for title in ("One", "Two"):
+            page = ArticlePage.objects.get(title=title)
+            self.assertEqual(list(page.tags.all()), [django])
+
+    def test_categories_match_existing_names_case_insensitively(self):
+        news = ArticleCategory.objects.create(name="News", slug="news")
+        self.import_records(
+            {"title": "One", "categories": ["news"]},
+            {"title": "Two", "categories": ["News", "NEWS", "Events"]},
+        )
+        self.assertEqual(ArticleCategory.objects.filter(name__iexact="news").count(), 1)
+        self.assertEqual(list(ArticlePage.objects.get(title="One").categories.all()), [news])
+        self.assertEqual(
+            sorted(c.name for c in ArticlePage.objects.get(title="Two").categories.all()),
+            ["Events", "News"],
+        )
+
+    def test_authors_match_existing_emails_case_insensitively(self):
+        author = self.create_author("John", "Smith", email="john@example.com")
+        self.import_records({
+            "title": "One",
+            "authors": [{"first_name": "John", "last_name": "Smith", "email": "John@Example.com"}],
+        })
+        page = ArticlePage.objects.get(title="One")
+        self.assertEqual([r.author for r in page.article_person_relationship.all()], [author])
+        self.assertEqual(Author.objects.count(), 1)
@@ -1,8 +1,15 @@
 # https://djangosnippets.org/snippets/690/
 import re
+from django.db import IntegrityError, transaction
+from django.db.models import Q
 from django.template.defaultfilters import slugify
 
 
+# Room kept free at the end of a truncated slug for a '-<n>' suffix when
+# looking up existing slugs that share the same base.
+SUFFIX_RESERVE = 8
+
+
 def unique_slugify(instance, value, slug_field_name='slug', queryset=None,
                    slug_separator='-'):
     """
@@ -13,18 +20,14 @@ def unique_slugify(instance, value, slug_field_name='slug', queryset=None,
 
     ``queryset`` usually doesn't need to be explicitly provided - it'll default
     to using the ``.all()`` queryset from the model's default manager.
+
+    All existing slugs sharing the base slug are fetched in a single query and
+    the next free suffix is worked out in memory.
     """
     slug_field = instance._meta.get_field(slug_field_name)
-
-    slug = getattr(instance, slug_field.attname)
     slug_len = slug_field.max_length
 
-    # Sort out the initial slug, limiting its length if necessary.
-    slug = slugify(value)
-    if slug_len:
-        slug = slug[:slug_len]
-    slug = _slug_strip(slug, slug_separator)
-    original_slug = slug
+    original_slug = _base_slug(value, slug_len, slug_separator)
 
     # Create the queryset if one wasn't explicitly provided and exclude the
     # current instance from the queryset.
@@ -33,10 +36,127 @@ def unique_slugify(instance, value, slug_field_name='slug', queryset=None,
     if instance.pk:
         queryset = queryset.exclude(pk=instance.pk)
 
-    # Find a unique slug. If one matches, at '-2' to the end and try again
+    taken = _taken_slugs(queryset, slug_field_name, [original_slug], slug_len,
+                         slug_separator)
+    slug = next_free_slug(original_slug, taken, slug_len, slug_separator)
+
+    setattr(instance, slug_field.attname, slug)
+
+
+def bulk_unique_slugify(instances, values, slug_field_name='slug',
+                        queryset=None, slug_separator='-'):
+    """
+    Assigns unique slugs to a list of unsaved instances of the same model.
+
+    ``values`` is a list of strings, one per instance, to build the slugs
+    from. Existing slugs are fetched in one query for the whole batch, and
+    slugs handed out earlier in the batch are treated as taken, so two
+    "John Smith" authors in the same import get ``john-smith`` and
+    ``john-smith-2``.
+    """
+    instances = list(instances)
+    values = list(values)
+    if len(instances) != len(values):
+        raise ValueError("instances and values must be the same length")
+    if not instances:
+        return instances
+
+    model = instances[0].__class__
+    slug_field = model._meta.get_field(slug_field_name)
+    slug_len = slug_field.max_length
+
+    if queryset is None:
+        queryset = model._default_manager.all()
+    pks = [instance.pk for instance in instances if instance.pk]
+    if pks:
+        queryset = queryset.exclude(pk__in=pks)
+
+    bases = [_base_slug(value, slug_len, slug_separator) for value in values]
+    taken = _taken_slugs(queryset, slug_field_name, bases, slug_len,
+                         slug_separator)
+    for instance, base in zip(instances, bases):
+        slug = next_free_slug(base, taken, slug_len, slug_separator)
+        taken.add(slug)
+        setattr(instance, slug_field.attname, slug)
+    return instances
+
+
+def save_with_unique_slug(instance, value, save, *args, slug_field_name='slug',
+                          retries=3, **kwargs):
+    """
+    Slugifies ``instance`` and calls ``save(*args, **kwargs)``, retrying with
+    a fresh slug when a concurrent insert took the same one first.
+    """
+    for attempt in range(retries):
+        unique_slugify(instance, value, slug_field_name)
+        try:
+            with transaction.atomic():
+                return save(*args, **kwargs)
+        except IntegrityError:
+            if attempt == retries - 1 or not _slug_conflicts(
+                    instance, slug_field_name):
+                raise
+
+
+def bulk_create_with_unique_slugs(instances, values, slug_field_name='slug',
+                                  batch_size=None, retries=3):
+    """
+    Assigns unique slugs with :func:`bulk_unique_slugify` and bulk creates
+    the instances, retrying the whole batch with fresh slugs if another
+    process inserted a clashing slug in the meantime.
+    """
+    instances = list(instances)
+    if not instances:
+        return instances
+    manager = instances[0].__class__._default_manager
+    for attempt in range(retries):
+        bulk_unique_slugify(instances, values, slug_field_name)
+        try:
+            with transaction.atomic():
+                return manager.bulk_create(instances, batch_size=batch_size)
+        except IntegrityError:
+            if attempt == retries - 1:
+                raise
+
+
+def _base_slug(value, slug_len, slug_separator):
+    # Sort out the initial slug, limiting its length if necessary.
+    slug = slugify(value)
+    if slug_len:
+        slug = slug[:slug_len]
+    return _slug_strip(slug, slug_separator)
+
+
+def _taken_slugs(queryset, slug_field_name, bases, slug_len, slug_separator):
+    """
+    Returns the set of existing slugs that could clash with any of ``bases``
+    or their suffixed variants, using a single query.
+    """
+    prefixes = set()
+    for base in bases:
+        prefix = base
+        if slug_len and len(base) + SUFFIX_RESERVE > slug_len:
+            prefix = _slug_strip(base[:slug_len - SUFFIX_RESERVE],
+                                 slug_separator)
+        prefixes.add(prefix)
+    # An empty prefix matches everything, so there is nothing to narrow by.
+    if '' in prefixes:
+        lookup = queryset
+    else:
+        query = None
+        for prefix in sorted(prefixes):
+            q = Q(**{'%s__startswith' % slug_field_name: prefix})
+            query = q if query is None else query | q
+        lookup = queryset.filter(query)
+    return set(lookup.values_list(slug_field_name, flat=True))
+
+
+def next_free_slug(original_slug, taken, slug_len, slug_separator):
+    # Find a unique slug. If one matches, add '-2' to the end and try again
     # (then '-3', etc).
+    slug = original_slug
     next = 2
-    while not slug or queryset.filter(**{slug_field_name: slug}):
+    while not slug or slug in taken:
         slug = original_slug
         end = '%s%s' % (slug_separator, next)
         if slug_len and len(slug) + len(end) > slug_len:
@@ -44,8 +164,16 @@ def unique_slugify(instance, value, slug_field_name='slug', queryset=None,
             slug = _slug_strip(slug, slug_separator)
         slug = '%s%s' % (slug, end)
         next += 1
+    return slug
 
-    setattr(instance, slug_field.attname, slug)
+
+def _slug_conflicts(instance, slug_field_name):
+    slug = getattr(instance, slug_field_name)
+    queryset = instance.__class__._default_manager.filter(
+        **{slug_field_name: slug})
+    if instance.pk:
+        queryset = queryset.exclude(pk=instance.pk)
+    return queryset.exists()
 
 
 def _slug_strip(value, separator='-'):
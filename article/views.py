@@ -1,3 +1,28 @@
-from django.shortcuts import render
+from django.db.models import Prefetch
 
-# Create your views here.
+from wagtail.admin.ui.tables import Column
+from wagtail.images import get_image_model
+from wagtail.snippets.views.snippets import SnippetViewSet
+
+from .models import AVATAR_FILTER, Author
+
+
+class AuthorViewSet(SnippetViewSet):
+    """
+    Snippet listing and chooser for authors, built for thousands of them:
+    both are ordered by the indexed name and searched through the search
+    index (name, email and slug), and the listing fetches its page of avatar
+    renditions in one query.
+    """
+
+    model = Author
+    icon = "user"
+    list_display = ["__str__", Column("thumb_image", label="Avatar"), "email", "slug"]
+    list_per_page = 50
+    chooser_per_page = 20
+
+    def get_queryset(self, request):
+        renditions = get_image_model().get_rendition_model().objects.filter(filter_spec=AVATAR_FILTER)
+        return Author.objects.select_related("image").prefetch_related(
+            Prefetch("image__renditions", queryset=renditions, to_attr="prefetched_renditions")
+        )
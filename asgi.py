@@ -0,0 +1,37 @@
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "settings")
+os.environ.setdefault("ASYNC_PAGE_SERVING", "True")
+
+django_application = get_asgi_application()
+
+from page.asgi_static import StaticFilesApplication  # noqa: E402
+from page.cache import require_shared_cache  # noqa: E402
+from page.middleware import PAGE_CACHE_SKIP_PREFIXES  # noqa: E402
+from page.preload import static_preload_links  # noqa: E402
+
+require_shared_cache()
+
+# Static files are answered before Django's middleware, see page/asgi_static.py
+static_application = StaticFilesApplication(django_application)
+
+EARLY_HINT = "http.response.early_hint"
+
+
+async def application(scope, receive, send):
+    """
+    Sends a 103 Early Hints response with the stylesheet and script preloads
+    before Django handles a page request, on servers offering the ASGI early
+    hints extension. page/views.py sends the hero image the same way.
+    """
+    if (
+        scope["type"] == "http"
+        and scope["method"] == "GET"
+        and EARLY_HINT in scope.get("extensions", {})
+        and not scope["path"].startswith(PAGE_CACHE_SKIP_PREFIXES + ("/static/", "/media/"))
+    ):
+        await send({"type": EARLY_HINT, "links": [link.encode() for link in static_preload_links()]})
+        scope["early_hints"] = send
+    await static_application(scope, receive, send)
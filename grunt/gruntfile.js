@@ -39,6 +39,24 @@ module.exports = function (grunt) {
                 }]
             }
         },
+        // Above the fold CSS for each page template, inlined by the
+        // stylesheets tag in page/templatetags/asset_tags.py. critical pulls
+        // in a headless Chrome, so it isn't part of package.json. Needs the
+        // site running with content:
+        //   npm install --no-save critical@^5.1.1
+        //   grunt critical --base=http://localhost:8000 --article=/articles/some-article/ --tag=/articles/tags/some-tag/
+        critical: {
+            css: ['../static/vendor/bootstrap/css/bootstrap.min.css', '../static/css/base.min.css'],
+            dimensions: [{width: 375, height: 812}, {width: 1300, height: 900}],
+            pages: {
+                standard_page: grunt.option('standard') || '/about/',
+                article_page: grunt.option('article') || '/articles/',
+                article_index_page: grunt.option('articles') || '/articles/',
+                article_tag_index_page: grunt.option('tag') || '/articles/tags/',
+                article_tags_index_page: '/articles/tags/',
+            },
+            dest: '../static/css/critical'
+        },
         watch: {
             scripts: {
                 files: 'src/*.*',
@@ -57,6 +75,32 @@ module.exports = function (grunt) {
     grunt.loadNpmTasks('grunt-contrib-cssmin');
     grunt.loadNpmTasks('grunt-contrib-watch');
 
+    grunt.registerTask('critical', 'Extract critical CSS for each page template', function () {
+        const done = this.async();
+        const options = grunt.config('critical');
+        const base = (grunt.option('base') || 'http://localhost:8000').replace(/\/$/, '');
+
+        // critical is published as an ES module
+        import('critical').then(function ({generate}) {
+            return Object.keys(options.pages).reduce(function (previous, template) {
+                return previous.then(function () {
+                    grunt.log.writeln('Critical CSS for ' + template + ' from ' + options.pages[template]);
+                    return generate({
+                        src: base + options.pages[template],
+                        css: options.css,
+                        dimensions: options.dimensions,
+                        inline: false
+                    }).then(function (result) {
+                        grunt.file.write(options.dest + '/' + template + '.css', result.css);
+                    });
+                });
+            }, Promise.resolve());
+        }).then(function () { done(); }, function (error) {
+            grunt.log.error(error);
+            done(false);
+        });
+    });
+
     // Default task(s).
 
     grunt.registerTask('default', ['concat', 'uglify', 'sass', 'cssmin', 'watch']);
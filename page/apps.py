@@ -1,6 +1,25 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class PageConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'page'
+
+    def ready(self):
+        from wagtail.admin.forms.models import register_form_field_override
+        from wagtail.fields import StreamField
+
+        from . import memory, metrics
+        from .block_definitions import CachedBlockField
+        from .db.routers import replica_aliases, replica_lag
+        from .signal_handlers import register_signal_handlers
+        from .startup import memory_stats
+
+        register_signal_handlers()
+        register_form_field_override(StreamField, override={"form_class": CachedBlockField})
+        metrics.register_collector(memory_stats)
+        if settings.MEMORY_PROFILING:
+            memory.start()
+        if replica_aliases():
+            metrics.register_collector(replica_lag)
@@ -0,0 +1,70 @@
+"""
+Static files for asgi.py, served in front of Django with WhiteNoise.
+
+WhiteNoiseMiddleware only has a synchronous code path, so inside Django's
+ASGI middleware chain every request, static or not, would be handed to a
+thread and back. Here static requests are answered before Django is
+reached: the file index, headers, compressed variants, ranges and
+conditional requests are WhiteNoise's, configured from the same settings as
+the middleware, and files are read in a thread chunk by chunk. Everything
+else goes straight to the Django application.
+"""
+from asgiref.sync import sync_to_async
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+CHUNK_SIZE = 64 * 1024
+
+
+def request_headers(scope):
+    # StaticFile.get_response reads headers the way a WSGI environ has them.
+    headers = {}
+    for name, value in scope["headers"]:
+        key = "HTTP_" + name.decode("latin-1").upper().replace("-", "_")
+        headers[key] = value.decode("latin-1")
+    return headers
+
+
+class StaticFilesApplication:
+    def __init__(self, application):
+        self.application = application
+        self.whitenoise = WhiteNoiseMiddleware()
+
+    def find_file(self, path):
+        if self.whitenoise.autorefresh:
+            # Only under DEBUG: looks for the file on disk on every request.
+            return self.whitenoise.find_file(path)
+        return self.whitenoise.files.get(path)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            static_file = self.find_file(scope["path"])
+            if static_file is not None:
+                await self.serve(static_file, scope, send)
+                return
+        await self.application(scope, receive, send)
+
+    async def serve(self, static_file, scope, send):
+        response = await sync_to_async(static_file.get_response, thread_sensitive=False)(
+            scope["method"], request_headers(scope)
+        )
+        await send({
+            "type": "http.response.start",
+            "status": int(response.status),
+            "headers": [
+                (name.lower().encode("latin-1"), value.encode("latin-1"))
+                for name, value in response.headers
+            ],
+        })
+        if response.file is None:
+            await send({"type": "http.response.body", "body": b""})
+            return
+        read = sync_to_async(response.file.read, thread_sensitive=False)
+        try:
+            while True:
+                chunk = await read(CHUNK_SIZE)
+                more_body = len(chunk) == CHUNK_SIZE
+                await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+                if not more_body:
+                    break
+        finally:
+            response.file.close()
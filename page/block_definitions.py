@@ -0,0 +1,61 @@
+"""
+Smaller, cached StreamField block definitions for the page editor.
+
+The editor receives every block definition as telepath JSON, which already
+writes an object used twice only once and refers back to it. The column
+blocks hold up to four BaseStreamBlock columns each, ten in all, that share
+the same child blocks but each build their own child list, defaults and
+strings; ``ColumnAdapter`` hands every column with the same children the
+same objects, so they are written once. ``CachedBlockField``, used for every
+StreamField in the admin, packs each field's definition once per process
+and language instead of on every edit view.
+"""
+import json
+
+from django.utils.translation import get_language
+
+from wagtail.blocks import BlockField, BlockWidget
+from wagtail.blocks.stream_block import StreamBlockAdapter
+from wagtail.telepath import JSContext, register
+
+from .blocks import BaseStreamBlock
+
+_shared_args = {}
+_packed = {}
+
+
+class ColumnAdapter(StreamBlockAdapter):
+    def js_args(self, block):
+        name, grouped, defaults, meta = super().js_args(block)
+        key = (tuple(map(id, block.child_blocks.values())), get_language())
+        if key not in _shared_args:
+            # grouped_child_blocks is a one-off iterator, keep it as lists.
+            grouped = [[group, list(blocks)] for group, blocks in grouped]
+            _shared_args[key] = (grouped, defaults, meta["strings"])
+        grouped, defaults, meta["strings"] = _shared_args[key]
+        return [name, grouped, defaults, meta]
+
+
+register(ColumnAdapter(), BaseStreamBlock)
+
+
+def pack(block):
+    """The telepath context and JSON of ``block`` in the active language."""
+    key = (id(block), get_language())
+    if key not in _packed:
+        context = JSContext()
+        # Holding on to the block keeps its id from being reused.
+        _packed[key] = (block, context, json.dumps(context.pack(block)))
+    return _packed[key][1:]
+
+
+class CachedBlockWidget(BlockWidget):
+    def _build_block_json(self):
+        self._js_context, self._block_json = pack(self.block_def)
+
+
+class CachedBlockField(BlockField):
+    def __init__(self, block=None, **kwargs):
+        if block is not None and "widget" not in kwargs:
+            kwargs["widget"] = CachedBlockWidget(block)
+        super().__init__(block=block, **kwargs)
@@ -0,0 +1,274 @@
+"""
+Two-tier cache: a small per-process LRU in front of a shared backend.
+
+Configured as the default cache in settings.py, with the shared tier
+(Redis, Memcached, or a local stand-in) under its own alias. Local copies
+live for at most LOCAL_TIMEOUT seconds, so a value changed by another
+process or replica is picked up within that time.
+
+Keys that depend on page content are grouped in versioned namespaces, see
+``namespace_key`` and ``bump_namespace``. Bumps only reach other processes
+through the shared tier, so outside DEBUG it has to be a real shared cache,
+see ``require_shared_cache``. ``get_or_compute`` keeps an
+expensive key from being rebuilt by every worker at once when it expires.
+"""
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.exceptions import ImproperlyConfigured
+
+from . import metrics
+
+NAMESPACE_VERSION_KEY = "ns:{}"
+# When a namespace was last bumped, see page/db/routers.py
+NAMESPACE_BUMPED_KEY = "ns-bumped"
+# Namespaces holding values derived from page content, invalidated together
+# whenever a page is published, unpublished, moved or deleted.
+PAGE_CONTENT_NAMESPACES = ("page", "navigation", "tags", "sites")
+
+_MISSING = object()
+
+
+class TieredCache(BaseCache):
+    """
+    OPTIONS:
+        SHARED: alias of the shared cache, "shared" by default.
+        LOCAL_MAX_ENTRIES: size of the per-process LRU, 500 by default.
+        LOCAL_TIMEOUT: seconds a value is served from the LRU, 5 by default.
+    """
+
+    def __init__(self, location, params):
+        options = params.get("OPTIONS", {})
+        self.shared_alias = options.get("SHARED", "shared")
+        self.local_max_entries = int(options.get("LOCAL_MAX_ENTRIES", 500))
+        self.local_timeout = float(options.get("LOCAL_TIMEOUT", 5))
+        super().__init__(params)
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias]
+
+    # The shared cache applies its own KEY_PREFIX and VERSION, so keys are
+    # passed through unchanged. The local tier keys them by the version they
+    # were stored under, the shared cache's VERSION unless one is passed.
+
+    def _local_key(self, key, version):
+        return (self.shared.version if version is None else version), key
+
+    def _local_get(self, key, version=None):
+        key = self._local_key(key, version)
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return _MISSING
+            expires, pickled = entry
+            if expires < time.monotonic():
+                del self._local[key]
+                return _MISSING
+            self._local.move_to_end(key)
+        # Stored pickled, like LocMemCache, so callers can't mutate the copy
+        # other requests get.
+        return pickle.loads(pickled)
+
+    def _local_set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        timeout = self.get_backend_timeout(timeout)
+        local_timeout = self.local_timeout if timeout is None else min(timeout, self.local_timeout)
+        if local_timeout <= 0:
+            self._local_delete(key, version)
+            return
+        key = self._local_key(key, version)
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._local[key] = (time.monotonic() + local_timeout, pickled)
+            self._local.move_to_end(key)
+            while len(self._local) > self.local_max_entries:
+                self._local.popitem(last=False)
+
+    def _local_delete(self, key, version=None):
+        key = self._local_key(key, version)
+        with self._lock:
+            self._local.pop(key, None)
+
+    def get(self, key, default=None, version=None):
+        value = self._local_get(key, version)
+        if value is not _MISSING:
+            metrics.inc("cache_requests_total", tier="local", result="hit")
+            return value
+        value = self.shared.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            metrics.inc("cache_requests_total", tier="shared", result="miss")
+            return default
+        metrics.inc("cache_requests_total", tier="shared", result="hit")
+        self._local_set(key, value, version=version)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version=version)
+        self._local_set(key, value, timeout, version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, timeout, version=version)
+        if added:
+            self._local_set(key, value, timeout, version)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self._local_delete(key, version)
+        return self.shared.delete(key, version=version)
+
+    def has_key(self, key, version=None):
+        return self._local_get(key, version) is not _MISSING or self.shared.has_key(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        self._local_delete(key, version)
+        return self.shared.incr(key, delta, version=version)
+
+    def get_many(self, keys, version=None):
+        found = {}
+        missing = []
+        for key in keys:
+            value = self._local_get(key, version)
+            if value is _MISSING:
+                missing.append(key)
+            else:
+                found[key] = value
+        metrics.inc("cache_requests_total", len(found), tier="local", result="hit")
+        if missing:
+            shared = self.shared.get_many(missing, version=version)
+            for key, value in shared.items():
+                self._local_set(key, value, version=version)
+            found.update(shared)
+            metrics.inc("cache_requests_total", len(shared), tier="shared", result="hit")
+            metrics.inc("cache_requests_total", len(missing) - len(shared), tier="shared", result="miss")
+        return found
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout, version=version)
+        for key, value in data.items():
+            if key not in failed:
+                self._local_set(key, value, timeout, version)
+        return failed
+
+    def delete_many(self, keys, version=None):
+        for key in keys:
+            self._local_delete(key, version)
+        self.shared.delete_many(keys, version=version)
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+        self.shared.clear()
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
+
+
+def require_shared_cache():
+    """
+    Raises ImproperlyConfigured outside DEBUG unless CACHE_URL is set. With
+    a per-process shared tier a bumped namespace only reaches the process
+    that bumped it, and every other worker and replica keeps its pages,
+    menus, redirects and document restrictions. ``locmem://`` opts in to
+    that for single-process setups. Called by wsgi.py and asgi.py.
+    """
+    if not settings.DEBUG and not settings.CACHE_URL:
+        raise ImproperlyConfigured(
+            "Set CACHE_URL to a cache shared by all processes, e.g. redis://host:6379/0, "
+            "or to locmem:// when only one process serves the site."
+        )
+
+
+def initial_version():
+    # Taken from the clock rather than starting at 1, so a version lost to a
+    # flush or restart of the shared cache doesn't come back as one that
+    # processes still hold data for.
+    return int(time.time() * 1000)
+
+
+def namespace_version(namespace):
+    key = NAMESPACE_VERSION_KEY.format(namespace)
+    version = cache.get(key)
+    if version is None:
+        # Store the initial version, so the local tier serves it too rather
+        # than every lookup missing through to the shared tier.
+        version = initial_version()
+        if not cache.add(key, version, None):
+            return cache.get(key, version)
+    return version
+
+
+async def anamespace_version(namespace):
+    key = NAMESPACE_VERSION_KEY.format(namespace)
+    version = await cache.aget(key)
+    if version is None:
+        version = initial_version()
+        if not await cache.aadd(key, version, None):
+            return await cache.aget(key, version)
+    return version
+
+
+def namespace_key(namespace, key, version=None):
+    if version is None:
+        version = namespace_version(namespace)
+    return "{}:{}:{}".format(namespace, version, key)
+
+
+def bump_namespace(*namespaces):
+    # Changing the version orphans every key in the namespace at once; the
+    # old entries simply expire.
+    for namespace in namespaces:
+        key = NAMESPACE_VERSION_KEY.format(namespace)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, initial_version(), None)
+    cache.set(NAMESPACE_BUMPED_KEY, time.time(), None)
+
+
+def get_or_compute(key, compute, timeout, lock_timeout=30, grace=None):
+    """
+    Returns the cached value for ``key``, calling ``compute`` to fill it.
+
+    Values are kept for ``grace`` seconds past ``timeout`` (another
+    ``timeout`` by default). Once stale, one caller takes a lock and
+    recomputes while the others keep getting the stale value, so an expiring
+    key costs one rebuild rather than one per worker.
+    """
+    if grace is None:
+        grace = timeout
+    lock_key = "lock:{}".format(key)
+    entry = cache.get(key)
+    now = time.time()
+    if entry is not None and entry[0] > now:
+        return entry[1]
+
+    locked = cache.add(lock_key, 1, lock_timeout)
+    if not locked:
+        if entry is not None:
+            metrics.inc("cache_stale_total")
+            return entry[1]
+        # Nothing to serve yet: wait briefly for whoever holds the lock.
+        deadline = time.monotonic() + min(lock_timeout, 5)
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            entry = cache.get(key)
+            if entry is not None:
+                return entry[1]
+
+    try:
+        value = compute()
+        cache.set(key, (time.time() + timeout, value), timeout + grace)
+    finally:
+        if locked:
+            cache.delete(lock_key)
+    return value
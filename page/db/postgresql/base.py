@@ -0,0 +1,110 @@
+"""
+PostgreSQL backend that takes its connections from a psycopg3 pool.
+
+Enabled by DATABASE_POOL=True in settings.py. Each process keeps one pool per
+database alias, shared by its threads; Django hands connections back to the
+pool where it would otherwise close them, so CONN_MAX_AGE should be 0.
+Without psycopg_pool installed this is the stock backend.
+"""
+import atexit
+import os
+import threading
+
+from django.db.backends.postgresql.base import DatabaseWrapper as PostgresDatabaseWrapper
+from django.utils.asyncio import async_unsafe
+
+from page import metrics
+
+try:
+    from psycopg import IsolationLevel
+    from psycopg_pool import ConnectionPool
+except ImportError:
+    ConnectionPool = None
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def close_pools():
+    # Called when a worker exits, e.g. after uWSGI's --max-requests, so the
+    # server sees the connections go instead of waiting for them to time out,
+    # and by the uWSGI master before it forks, see page/startup.py. The next
+    # query in a process opens a new pool.
+    for pid, pool in list(_pools.values()):
+        if pid == os.getpid():
+            pool.close()
+    _pools.clear()
+
+
+def pool_stats():
+    for alias, (pid, pool) in list(_pools.items()):
+        if pid != os.getpid():
+            continue
+        for name, value in pool.get_stats().items():
+            yield "db_pool_{}".format(name), value, {"alias": alias}
+
+
+class DatabaseWrapper(PostgresDatabaseWrapper):
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop("pool", None)
+        return params
+
+    @property
+    def connection_pool(self):
+        options = self.settings_dict["OPTIONS"].get("pool")
+        if ConnectionPool is None or not options:
+            return None
+
+        pid = os.getpid()
+        entry = _pools.get(self.alias)
+        if entry is not None and entry[0] == pid:
+            return entry[1]
+
+        with _pools_lock:
+            entry = _pools.get(self.alias)
+            # A pool inherited from the uWSGI master shares its sockets with
+            # the parent and has lost its worker threads, so start afresh
+            # rather than closing it.
+            if entry is None or entry[0] != pid:
+                if not any(p == pid for p, _ in _pools.values()):
+                    atexit.register(close_pools)
+                    metrics.register_collector(pool_stats)
+                pool = ConnectionPool(
+                    kwargs=self.get_connection_params(),
+                    min_size=options.get("min_size", 1),
+                    max_size=options.get("max_size", 4),
+                    timeout=options.get("timeout", 10),
+                    max_idle=options.get("max_idle", 600),
+                    max_lifetime=options.get("max_lifetime", 3600),
+                    check=ConnectionPool.check_connection,
+                    name=self.alias,
+                    open=True,
+                )
+                entry = _pools[self.alias] = (pid, pool)
+        return entry[1]
+
+    @async_unsafe
+    def get_new_connection(self, conn_params):
+        pool = self.connection_pool
+        if pool is None:
+            return super().get_new_connection(conn_params)
+
+        connection = pool.getconn()
+        options = self.settings_dict["OPTIONS"]
+        try:
+            self.isolation_level = IsolationLevel(options["isolation_level"])
+        except KeyError:
+            self.isolation_level = IsolationLevel.READ_COMMITTED
+        else:
+            connection.isolation_level = self.isolation_level
+        return connection
+
+    def _close(self):
+        pool = self.connection_pool
+        if self.connection is None or pool is None:
+            return super()._close()
+        # The pool rolls back any open transaction and checks the connection
+        # before handing it out again.
+        with self.wrap_database_errors:
+            pool.putconn(self.connection)
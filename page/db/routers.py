@@ -0,0 +1,95 @@
+"""
+Routes the reads of anonymous public requests to a read replica.
+
+Enabled by DATABASE_REPLICA_URLS in settings.py. ``replica_middleware``
+picks one replica per anonymous GET/HEAD request and every read in it goes
+there, until the request writes anything, after which it stays on the
+primary. Everything else (admin, previews, logged in visitors, forms,
+management commands, background threads) uses the primary, as do all
+requests for DATABASE_REPLICA_PIN_SECONDS after a cache namespace is bumped,
+so the caches a publish invalidated aren't rebuilt from a replica that
+hasn't caught up yet.
+"""
+import contextvars
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connections
+
+from page.cache import NAMESPACE_BUMPED_KEY
+
+_replica = contextvars.ContextVar("db_replica", default=None)
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias.startswith("replica_")]
+
+
+def _choose(aliases, bumped):
+    if time.time() - bumped < settings.DATABASE_REPLICA_PIN_SECONDS:
+        return None
+    return random.choice(aliases)
+
+
+def choose_replica():
+    """A replica for this request, or None if it should use the primary."""
+    aliases = replica_aliases()
+    if not aliases:
+        return None
+    return _choose(aliases, cache.get(NAMESPACE_BUMPED_KEY, 0))
+
+
+async def achoose_replica():
+    aliases = replica_aliases()
+    if not aliases:
+        return None
+    return _choose(aliases, await cache.aget(NAMESPACE_BUMPED_KEY, 0))
+
+
+def use_replica(alias):
+    """Sends reads to ``alias``; returns a token for ``reset_replica``."""
+    return _replica.set(alias)
+
+
+def reset_replica(token):
+    _replica.reset(token)
+
+
+def replica_lag():
+    # The time since the last replayed transaction only means lag while
+    # there is WAL left to replay, an idle primary would look like lag.
+    for alias in replica_aliases():
+        connection = connections[alias]
+        if connection.vendor != "postgresql":
+            continue
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+                )
+                lag = cursor.fetchone()[0]
+        except DatabaseError:
+            yield "db_replica_up", 0, {"alias": alias}
+            continue
+        yield "db_replica_up", 1, {"alias": alias}
+        yield "db_replica_lag_seconds", float(lag or 0), {"alias": alias}
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _replica.get() or "default"
+
+    def db_for_write(self, model, **hints):
+        # Read your own writes for the rest of the request.
+        _replica.set(None)
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == "default"
@@ -0,0 +1,148 @@
+"""
+Document downloads without streaming them through Django.
+
+Wagtail's serve view reads the document and its collection's view
+restrictions from the database and, with S3 storage, either streams the
+file through the worker or redirects. Here the document's name and
+collection, and the set of collections under a view restriction, are kept
+in the "documents" cache namespace. A public document costs no queries and
+is redirected to its storage URL; a restricted one goes through wagtail's
+before_serve_document hooks first and is redirected to a URL signed for
+DOCUMENT_URL_EXPIRY seconds. With DOCUMENT_ACCEL_REDIRECT set, the file is
+handed to the proxy in front of us with X-Accel-Redirect instead. Either
+way range requests are answered by S3 or the proxy, and document_served is
+sent as wagtail's view sends it.
+
+Uploads are public-read, which would let anyone with a restricted
+document's plain storage URL download it. ``update_file_acls`` makes a
+file private while only documents in restricted collections use it; it
+runs after a document is saved and after a collection's view restrictions
+change, see page/signal_handlers.py.
+"""
+import logging
+
+from django.conf import settings
+from django.db import router
+from django.http import Http404, HttpResponse
+from django.shortcuts import redirect
+from django.utils.encoding import filepath_to_uri
+
+from wagtail import hooks
+from wagtail.documents import get_document_model
+from wagtail.documents.models import document_served
+from wagtail.documents.views.serve import serve as wagtail_serve
+from wagtail.models import Collection, CollectionViewRestriction
+
+from .cache import get_or_compute, namespace_key
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_CACHE_TIMEOUT = 60 * 60
+
+
+def build_restricted_collections():
+    restricted = set()
+    for restriction in CollectionViewRestriction.objects.select_related("collection"):
+        restricted.update(
+            restriction.collection.get_descendants(inclusive=True).values_list("id", flat=True)
+        )
+    return restricted
+
+
+def restricted_collections():
+    key = namespace_key("documents", "restricted_collections")
+    return get_or_compute(key, build_restricted_collections, DOCUMENT_CACHE_TIMEOUT)
+
+
+def find_document(document_id):
+    """
+    Returns the Document ``document_id``, built from its cached fields, or
+    None.
+    """
+    Document = get_document_model()
+
+    def build():
+        names = [field.attname for field in Document._meta.concrete_fields]
+        return Document.objects.filter(id=document_id).values(*names).first()
+
+    key = namespace_key("documents", "document:{}".format(document_id))
+    fields = get_or_compute(key, build, DOCUMENT_CACHE_TIMEOUT)
+    if fields is None:
+        return None
+    return Document.from_db(router.db_for_read(Document), list(fields), list(fields.values()))
+
+
+def update_file_acls(documents):
+    """
+    Makes the files of ``documents`` private while only documents in
+    restricted collections use them, and public-read otherwise. Identical
+    uploads share a file, see page/storage.py, so a file stays public as
+    long as one public document uses it.
+    """
+    Document = get_document_model()
+    storage = Document._meta.get_field("file").storage
+    if not hasattr(storage, "set_public"):
+        return
+    restricted = build_restricted_collections()
+    for name in {document.file.name for document in documents if document.file}:
+        public = Document.objects.filter(file=name).exclude(collection_id__in=restricted).exists()
+        try:
+            storage.set_public(name, public)
+        except Exception:
+            logger.warning("Could not update the ACL of %s", name, exc_info=True)
+
+
+def update_collection_file_acls(collection_id):
+    """Runs update_file_acls for the documents under ``collection_id``."""
+    collection = Collection.objects.filter(id=collection_id).first()
+    if collection is None:
+        return
+    documents = get_document_model().objects.filter(
+        collection__in=collection.get_descendants(inclusive=True)
+    ).only("file")
+    update_file_acls(documents.iterator())
+
+
+def accel_redirect(document):
+    response = HttpResponse(content_type=document.content_type)
+    response["X-Accel-Redirect"] = settings.DOCUMENT_ACCEL_REDIRECT + filepath_to_uri(document.file.name)
+    response["Content-Disposition"] = document.content_disposition
+    return response
+
+
+def serve(request, document_id, document_filename):
+    document = find_document(int(document_id))
+    if document is None or document.filename != document_filename:
+        raise Http404("This document does not match the given filename.")
+
+    restricted = document.collection_id in restricted_collections()
+    if restricted:
+        # Wagtail's own hook asks for a login or password here.
+        for fn in hooks.get_hooks("before_serve_document"):
+            result = fn(document, request)
+            if isinstance(result, HttpResponse):
+                return result
+
+    storage = document.file.storage
+    if settings.DOCUMENT_ACCEL_REDIRECT:
+        response = accel_redirect(document)
+    else:
+        try:
+            storage.path(document.file.name)
+        except NotImplementedError:
+            pass
+        else:
+            # Files on local disk, as in development: let wagtail send them,
+            # and document_served.
+            return wagtail_serve(request, document_id, document_filename)
+
+        if restricted and hasattr(storage, "signed_url"):
+            response = redirect(storage.signed_url(document.file.name, expire=settings.DOCUMENT_URL_EXPIRY, parameters={
+                "ResponseContentDisposition": document.content_disposition,
+                "ResponseContentType": document.content_type,
+            }))
+        else:
+            response = redirect(document.file.url)
+
+    document_served.send(sender=type(document), instance=document, request=request)
+    return response
@@ -0,0 +1,199 @@
+"""
+Cache-Control and Surrogate-Key headers for edge caches, and key purges.
+
+Anonymous 200 responses get the Cache-Control policy in EDGE_CACHE_CONTROL
+for their page type and a Surrogate-Key header listing what they were built
+from: the page ("page-<id>"), its ancestors and itself ("tree-<id>"), the
+menu ("navigation") and every snippet, tag and image rendered, see
+``add_surrogate_keys``. Policies can use a long s-maxage because publishing
+a page or saving a snippet purges its keys at the edge: ``purge`` collects
+keys until the transaction commits, then a background thread sends them in
+batches to the backend configured in EDGE_PURGE.
+"""
+import logging
+import threading
+import time
+import urllib.request
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from . import metrics
+from .cache import get_or_compute, namespace_key
+
+logger = logging.getLogger(__name__)
+
+ANCESTORS_CACHE_TIMEOUT = 60 * 60
+
+# Seconds to collect keys before sending them.
+PURGE_DELAY = 1
+
+_pending = set()
+_pending_lock = threading.Lock()
+_dispatcher = None
+_backend = None
+
+
+def instance_key(instance):
+    """The key of a page showing ``instance``, e.g. "author-3"."""
+    return "{}-{}".format(instance._meta.model_name, instance.pk)
+
+
+def model_key(model):
+    """The key of a page listing all instances of ``model``, e.g. "author"."""
+    return model._meta.model_name
+
+
+def add_surrogate_keys(request, *keys):
+    """Records that the response to ``request`` depends on ``keys``."""
+    if request is None:
+        return
+    if not hasattr(request, "surrogate_keys"):
+        request.surrogate_keys = set()
+    request.surrogate_keys.update(keys)
+
+
+def ancestor_ids(page):
+    # Cached with the page, so serving it doesn't query the tree.
+    key = namespace_key("page", "ancestors:{}".format(page.pk))
+    return get_or_compute(
+        key, lambda: list(page.get_ancestors().values_list("id", flat=True)), ANCESTORS_CACHE_TIMEOUT
+    )
+
+
+def page_keys(page):
+    return ["page-{}".format(page.pk)] + ["tree-{}".format(pk) for pk in ancestor_ids(page) + [page.pk]]
+
+
+def cache_control_for(page):
+    policies = settings.EDGE_CACHE_CONTROL
+    return policies.get(page._meta.label_lower, policies["default"])
+
+
+def add_edge_cache_headers(request, response):
+    if response.status_code != 200 or response.cookies or response.has_header("Cache-Control"):
+        return response
+    response["Cache-Control"] = getattr(request, "cache_control", settings.EDGE_CACHE_CONTROL["default"])
+    keys = getattr(request, "surrogate_keys", None)
+    if keys:
+        response["Surrogate-Key"] = " ".join(sorted(keys))
+    return response
+
+
+class BaseBackend:
+    def __init__(self, params):
+        self.batch_size = int(params.get("BATCH_SIZE", 256))
+
+    def purge(self, keys):
+        raise NotImplementedError
+
+
+class HTTPBackend(BaseBackend):
+    """
+    Sends a request to LOCATION with the keys in a header, the way Fastly's
+    purge API and Varnish's xkey module take them.
+
+    OPTIONS:
+        LOCATION: URL the purge request is sent to.
+        METHOD: "PURGE" by default.
+        HEADER: header carrying the space separated keys, "Surrogate-Key"
+            by default.
+        HEADERS: any other headers to send, e.g. an API token.
+        TIMEOUT: seconds, 10 by default.
+    """
+
+    def __init__(self, params):
+        super().__init__(params)
+        self.location = params["LOCATION"]
+        self.method = params.get("METHOD", "PURGE")
+        self.header = params.get("HEADER", "Surrogate-Key")
+        self.headers = params.get("HEADERS", {})
+        self.timeout = float(params.get("TIMEOUT", 10))
+
+    def purge(self, keys):
+        headers = dict(self.headers, **{self.header: " ".join(keys)})
+        request = urllib.request.Request(self.location, method=self.method, headers=headers)
+        with urllib.request.urlopen(request, timeout=self.timeout):
+            pass
+
+
+class LogBackend(BaseBackend):
+    """Only logs the keys, for development."""
+
+    def purge(self, keys):
+        logger.info("Purging %s", " ".join(keys))
+
+
+def get_backend():
+    global _backend
+    if _backend is None and settings.EDGE_PURGE:
+        params = settings.EDGE_PURGE
+        _backend = import_string(params["BACKEND"])(params)
+    return _backend
+
+
+def send_purge(keys):
+    backend = get_backend()
+    for start in range(0, len(keys), backend.batch_size):
+        batch = keys[start:start + backend.batch_size]
+        try:
+            backend.purge(batch)
+        except Exception:
+            metrics.inc("edge_purges_total", result="error")
+            logger.warning("Could not purge %s", " ".join(batch), exc_info=True)
+        else:
+            metrics.inc("edge_purges_total", result="ok")
+            metrics.inc("edge_purged_keys_total", len(batch))
+
+
+def _dispatch():
+    # Waits a moment so keys purged by the same publish, and by anything
+    # committed right after it, go out in one request.
+    global _dispatcher
+    time.sleep(PURGE_DELAY)
+    with _pending_lock:
+        keys = sorted(_pending)
+        _pending.clear()
+        _dispatcher = None
+    send_purge(keys)
+
+
+def _queue(keys):
+    global _dispatcher
+    with _pending_lock:
+        _pending.update(keys)
+        if _dispatcher is None:
+            _dispatcher = threading.Thread(target=_dispatch, daemon=True)
+            _dispatcher.start()
+
+
+def purge(*keys):
+    """
+    Purges ``keys`` at the edge once the current transaction commits.
+    Nothing is sent if it rolls back.
+    """
+    if not settings.EDGE_PURGE or not keys:
+        return
+    transaction.on_commit(lambda: _queue(keys))
+
+
+def purge_instance(instance):
+    # Listings carry the model key, pages showing this instance its own key.
+    purge(instance_key(instance), model_key(type(instance)))
+
+
+def purge_page(page):
+    # The page itself, and the listings and menus of its ancestors.
+    keys = ["page-{}".format(pk) for pk in page.get_ancestors().values_list("id", flat=True)]
+    keys.append("page-{}".format(page.pk))
+    # Menus show the titles of the pages in them, and drop pages taken out.
+    if page.show_in_menus or getattr(page, "was_in_menus", False):
+        keys.append("navigation")
+    purge(*keys)
+
+
+def purge_tree(page):
+    purge("tree-{}".format(page.pk), "navigation", *(
+        "page-{}".format(pk) for pk in page.get_ancestors().values_list("id", flat=True)
+    ))
@@ -0,0 +1,133 @@
+"""
+404 and 500 pages rendered without touching the database.
+
+The header and footer of each site are rendered ahead of time into a
+snapshot, kept in memory, in the cache and in ERROR_PAGE_SNAPSHOT on disk.
+Error pages are put together from the newest of these, so a scan of missing
+URLs costs no navigation queries and a database outage still gets a styled
+500 page. Snapshots are rebuilt in the background once older than
+ERROR_PAGE_SNAPSHOT_MAX_AGE seconds and after every publish.
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.http import HttpResponse
+from django.template import loader
+from django.test import RequestFactory
+
+from wagtail.models import Site
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_CACHE_KEY = "error_page_snapshot"
+DEFAULT_SITE = "*"
+
+_snapshot = {"created": 0, "sites": {}}
+_refresh_lock = threading.Lock()
+_last_attempt = 0
+
+
+def build_snapshot():
+    sites = {}
+    factory = RequestFactory()
+    for site in Site.objects.select_related("root_page"):
+        request = factory.get("/", HTTP_HOST=site.hostname, SERVER_PORT=site.port)
+        request._wagtail_site = site
+        context = {"request": request, "current_site": site, "self": None, "page": None}
+        chrome = {
+            "site_name": site.site_name,
+            "header": loader.render_to_string("includes/header.html", context),
+            "footer": loader.render_to_string("includes/footer.html", context),
+        }
+        sites[site.hostname] = chrome
+        if site.is_default_site:
+            sites[DEFAULT_SITE] = chrome
+    return {"created": time.time(), "sites": sites}
+
+
+def save_snapshot(snapshot):
+    global _snapshot
+    _snapshot = snapshot
+    try:
+        cache.set(SNAPSHOT_CACHE_KEY, snapshot, None)
+    except Exception:
+        logger.warning("Could not cache the error page snapshot", exc_info=True)
+    path = settings.ERROR_PAGE_SNAPSHOT
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with tempfile.NamedTemporaryFile("w", dir=os.path.dirname(path), delete=False) as f:
+            json.dump(snapshot, f)
+        os.replace(f.name, path)
+    except OSError:
+        logger.warning("Could not write %s", path, exc_info=True)
+
+
+def refresh_snapshot():
+    """Rebuilds and stores the snapshot. Skipped if a refresh is running."""
+    global _last_attempt
+    if not _refresh_lock.acquire(blocking=False):
+        return
+    try:
+        _last_attempt = time.time()
+        save_snapshot(build_snapshot())
+    except Exception:
+        # Most likely the database is down; keep serving the old snapshot.
+        logger.warning("Could not refresh the error page snapshot", exc_info=True)
+    finally:
+        _refresh_lock.release()
+
+
+def _refresh_in_background():
+    def run():
+        try:
+            refresh_snapshot()
+        finally:
+            close_old_connections()
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+def load_snapshot():
+    global _snapshot, _last_attempt
+    newest = _snapshot
+    try:
+        cached = cache.get(SNAPSHOT_CACHE_KEY)
+    except Exception:
+        cached = None
+    if cached and cached["created"] > newest["created"]:
+        newest = cached
+    if not newest["sites"]:
+        try:
+            with open(settings.ERROR_PAGE_SNAPSHOT) as f:
+                newest = json.load(f)
+        except (OSError, ValueError):
+            pass
+    _snapshot = newest
+
+    max_age = settings.ERROR_PAGE_SNAPSHOT_MAX_AGE
+    now = time.time()
+    if now - newest["created"] > max_age and now - _last_attempt > max_age:
+        _last_attempt = now
+        _refresh_in_background()
+    return newest
+
+
+def error_response(request, template_name, status):
+    sites = load_snapshot()["sites"]
+    hostname = request.META.get("HTTP_HOST", "").split(":")[0]
+    chrome = sites.get(hostname) or sites.get(DEFAULT_SITE) or {}
+    # Rendered without the request so no context processor runs; the user,
+    # messages and CSRF token could all need the database.
+    content = loader.render_to_string(template_name, {
+        "site_name": chrome.get("site_name") or settings.WAGTAIL_SITE_NAME,
+        "header": chrome.get("header", ""),
+        "footer": chrome.get("footer", ""),
+    })
+    return HttpResponse(content, status=status)
@@ -0,0 +1,50 @@
+"""
+Render URLs in-process, through the same middleware as a real request.
+
+Used by the static export and by warm_cache. Requests are built with
+RequestFactory and run by a plain BaseHandler, like uWSGI's WSGIHandler:
+an exception in a view becomes an error response, logged as usual, instead
+of being raised, and nothing of the request is kept afterwards. The
+handler is shared by all threads, as it is under uWSGI.
+"""
+import functools
+
+from django.conf import settings
+from django.core import signals
+from django.core.handlers.base import BaseHandler
+from django.test import RequestFactory
+from django.urls import set_urlconf
+
+
+class Handler(BaseHandler):
+    def __init__(self):
+        super().__init__()
+        self.load_middleware()
+
+    def __call__(self, request):
+        set_urlconf(settings.ROOT_URLCONF)
+        signals.request_started.send(sender=self.__class__, environ=request.META)
+        return self.get_response(request)
+
+
+@functools.lru_cache(maxsize=None)
+def get_handler():
+    return Handler()
+
+
+def render(host, path, secure=False, page_cache=True):
+    """
+    GETs ``path`` (which may include a query string) as an anonymous
+    visitor of ``host``. Returns the response and its body. Without
+    ``page_cache`` the response is neither read from nor stored in the page
+    cache.
+    """
+    request = RequestFactory().get(path, HTTP_HOST=host, secure=secure)
+    request.skip_page_cache = not page_cache
+    response = get_handler()(request)
+    try:
+        content = b"".join(response) if response.streaming else response.content
+    finally:
+        # Sends request_finished, as the WSGI server would.
+        response.close()
+    return response, content
@@ -0,0 +1,80 @@
+"""Helpers for finding and merging images that share the same file contents."""
+import hashlib
+import re
+
+from wagtail.blocks import ListBlock, RichTextBlock, StreamBlock, StructBlock
+from wagtail.images import get_image_model
+from wagtail.images.blocks import ImageChooserBlock
+from wagtail.utils.file import HASH_READ_SIZE, hash_filelike
+
+
+IMAGE_EMBED_RE = re.compile(r'(<embed\b[^>]*\bembedtype="image"[^>]*\bid=")(\d+)(")')
+
+
+def stream_file_hash(image):
+    """
+    Returns the SHA-1 of an image's file, matching `Image.file_hash`.
+
+    On S3 the object body is hashed chunk by chunk as it downloads, rather
+    than being spooled to a temporary file first.
+    """
+    storage = image.file.storage
+    if hasattr(storage, "bucket"):
+        body = storage.bucket.Object(storage._normalize_name(image.file.name)).get()["Body"]
+        hasher = hashlib.sha1()
+        for chunk in body.iter_chunks(HASH_READ_SIZE):
+            hasher.update(chunk)
+        return hasher.hexdigest()
+    with image.open_file() as f:
+        return hash_filelike(f)
+
+
+def find_duplicate(image):
+    """
+    Returns the oldest other image with the same file hash, or None.
+    """
+    if not image.file_hash:
+        return None
+    return (
+        get_image_model().objects.filter(file_hash=image.file_hash)
+        .exclude(pk=image.pk)
+        .order_by("pk")
+        .first()
+    )
+
+
+def replace_image_ids(block, value, mapping):
+    """
+    Swaps image IDs found in ``mapping`` inside the raw (JSON-ish) ``value``
+    of ``block``, including images embedded in rich text. Returns the new
+    raw value.
+    """
+    if isinstance(block, ImageChooserBlock):
+        return mapping.get(value, value)
+    if isinstance(block, RichTextBlock):
+        if not value:
+            return value
+        return IMAGE_EMBED_RE.sub(
+            lambda m: "{}{}{}".format(m.group(1), mapping.get(int(m.group(2)), m.group(2)), m.group(3)),
+            value,
+        )
+    if isinstance(block, StreamBlock):
+        for child in value or []:
+            if child.get("type") in block.child_blocks:
+                child["value"] = replace_image_ids(
+                    block.child_blocks[child["type"]], child.get("value"), mapping
+                )
+        return value
+    if isinstance(block, ListBlock):
+        for i, item in enumerate(value or []):
+            if isinstance(item, dict) and item.get("type") == "item" and "value" in item:
+                item["value"] = replace_image_ids(block.child_block, item["value"], mapping)
+            else:
+                value[i] = replace_image_ids(block.child_block, item, mapping)
+        return value
+    if isinstance(block, StructBlock):
+        for name, child_block in block.child_blocks.items():
+            if value and name in value:
+                value[name] = replace_image_ids(child_block, value[name], mapping)
+        return value
+    return value
@@ -0,0 +1,138 @@
+"""
+Measure the page editor on a large StandardPage.
+
+Builds a page of column sections, each column holding headings, paragraphs
+and tables, and reports the size of the block definitions and of the edit
+view, how long the edit view takes to render and how long a draft save
+(validating the StreamField and saving a revision) takes. Everything it
+creates is rolled back.
+"""
+import json
+import re
+import statistics
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client
+from django.urls import reverse
+
+from wagtail.models import Site
+from wagtail.telepath import JSContext
+
+from page.block_definitions import pack
+from page.blocks import BaseStreamBlock
+from page.models import StandardPage
+
+SECTION_TYPES = ["single_column", "two_columns", "three_columns", "four_columns"]
+TEXT = "Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor incididunt. "
+
+ATTRIBUTE_RE = re.compile(r'data-(block|value)="([^"]*)"')
+
+
+def column_child(i):
+    kind = i % 3
+    if kind == 0:
+        value = {"type": "heading_block", "value": {"heading_text": "Heading {}".format(i), "size": "h2", "alignment": "start"}}
+    elif kind == 1:
+        value = {"type": "paragraph_block", "value": "<p>{}</p>".format(TEXT * 3)}
+    else:
+        value = {"type": "table", "value": {
+            "data": [["Name", "Value"], ["a", "1"], ["b", "2"]],
+            "first_row_is_table_header": True, "first_col_is_header": False, "table_caption": "",
+        }}
+    value["id"] = str(uuid.uuid4())
+    return value
+
+
+def large_body(sections, blocks):
+    body = []
+    stream_block = StandardPage._meta.get_field("body").stream_block
+    for i in range(sections):
+        block_type = SECTION_TYPES[i % len(SECTION_TYPES)]
+        value = {"alignment": "start"}
+        for name, child in stream_block.child_blocks[block_type].child_blocks.items():
+            if isinstance(child, BaseStreamBlock):
+                value[name] = [column_child(j) for j in range(blocks)]
+        body.append({"type": block_type, "value": value, "id": str(uuid.uuid4())})
+    return body
+
+
+def timed(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - started)
+    return result, timings
+
+
+class Command(BaseCommand):
+    help = "Report block definition size, edit view size and latency, and save latency for a large page."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sections", type=int, default=40, help="Column sections on the page")
+        parser.add_argument("--blocks", type=int, default=6, help="Blocks in each column")
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--host", default="localhost", help="Host the admin is requested on")
+
+    def handle(self, *args, **options):
+        repeat = options["repeat"]
+        stream_block = StandardPage._meta.get_field("body").stream_block
+
+        definition, timings = timed(lambda: json.dumps(JSContext().pack(stream_block)), repeat)
+        self.report("pack definitions", timings)
+        pack(stream_block)
+        _, timings = timed(lambda: pack(stream_block), repeat)
+        self.report("cached definitions", timings)
+        self.stdout.write("block definitions: {} bytes".format(len(definition)))
+
+        with transaction.atomic():
+            self.run(options)
+            transaction.set_rollback(True)
+
+    def run(self, options):
+        repeat = options["repeat"]
+        user = get_user_model().objects.filter(is_superuser=True).first()
+        if user is None:
+            user = get_user_model().objects.create(username="editor-benchmark", is_staff=True, is_superuser=True)
+        root = Site.objects.get(is_default_site=True).root_page
+        page = root.add_child(instance=StandardPage(
+            title="Editor benchmark",
+            slug="editor-benchmark-{}".format(uuid.uuid4().hex[:8]),
+            body=large_body(options["sections"], options["blocks"]),
+            live=False,
+        ))
+
+        client = Client(SERVER_NAME=options["host"])
+        client.force_login(user)
+        url = reverse("wagtailadmin_pages:edit", args=[page.pk])
+        response, timings = timed(lambda: client.get(url), repeat)
+        if response.status_code != 200:
+            self.stderr.write("{} returned {}".format(url, response.status_code))
+            return
+        self.report("edit view", timings)
+
+        content = response.content.decode()
+        sizes = {"block": 0, "value": 0}
+        for kind, attribute in ATTRIBUTE_RE.findall(content):
+            sizes[kind] += len(attribute)
+        self.stdout.write("edit view: {} bytes, block definitions {} bytes, values {} bytes".format(
+            len(content), sizes["block"], sizes["value"],
+        ))
+
+        stream_block = StandardPage._meta.get_field("body").stream_block
+
+        def save():
+            page.body = stream_block.clean(page.body)
+            page.save_revision(user=user)
+
+        _, timings = timed(save, repeat)
+        self.report("draft save", timings)
+
+    def report(self, name, timings):
+        self.stdout.write("{}: mean={:.1f}ms min={:.1f}ms max={:.1f}ms".format(
+            name, statistics.mean(timings) * 1000, min(timings) * 1000, max(timings) * 1000,
+        ))
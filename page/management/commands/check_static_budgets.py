@@ -0,0 +1,53 @@
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management.base import BaseCommand, CommandError
+
+
+def compressed_size(path):
+    for suffix in (".br", ".gz"):
+        if os.path.exists(path + suffix):
+            return os.path.getsize(path + suffix), suffix[1:]
+    return os.path.getsize(path), "raw"
+
+
+class Command(BaseCommand):
+    help = (
+        "Report the sizes of collected static files and fail if an asset in "
+        "STATIC_ASSET_BUDGETS is over budget. Run after collectstatic."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top", type=int, default=10, help="Number of largest files to list")
+
+    def handle(self, *args, **options):
+        hashed_files = staticfiles_storage.hashed_files
+        if not hashed_files:
+            raise CommandError("No staticfiles manifest found, run collectstatic first")
+
+        sizes = []
+        for name, hashed_name in hashed_files.items():
+            path = staticfiles_storage.path(hashed_name)
+            if os.path.exists(path):
+                sizes.append((name, os.path.getsize(path), *compressed_size(path)))
+        sizes.sort(key=lambda size: size[2], reverse=True)
+
+        self.stdout.write("Largest files (served size, encoding, uncompressed size):")
+        for name, raw, compressed, encoding in sizes[:options["top"]]:
+            self.stdout.write("  {:>10,} {:<4} {:>10,}  {}".format(compressed, encoding, raw, name))
+
+        over = []
+        self.stdout.write("Budgets:")
+        by_name = {size[0]: size for size in sizes}
+        for name, budget in settings.STATIC_ASSET_BUDGETS.items():
+            if name not in by_name:
+                raise CommandError("{} is in STATIC_ASSET_BUDGETS but was not collected".format(name))
+            _, raw, compressed, encoding = by_name[name]
+            status = "ok" if compressed <= budget else "OVER"
+            self.stdout.write("  {:<4} {:>9,} / {:>9,} {:<4} {}".format(status, compressed, budget, encoding, name))
+            if compressed > budget:
+                over.append(name)
+
+        if over:
+            raise CommandError("Over budget: {}".format(", ".join(over)))
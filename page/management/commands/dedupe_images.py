@@ -0,0 +1,153 @@
+"""
+Merge images that share the same file contents.
+
+Missing file hashes are filled in by streaming each file, then every group
+of identical images is collapsed onto its oldest image: foreign keys,
+StreamField blocks (including rich text embeds) and the latest draft
+revisions are repointed, and the duplicates are deleted along with their
+files and renditions.
+"""
+import json
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from wagtail.fields import StreamField
+from wagtail.images import get_image_model
+from wagtail.models import Page, Revision
+
+from page.images import replace_image_ids, stream_file_hash
+
+
+class Command(BaseCommand):
+    help = "Find images with identical files and merge them into one."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true")
+        parser.add_argument("--batch-size", type=int, default=200)
+
+    def handle(self, *args, **options):
+        self.dry_run = options["dry_run"]
+        Image = get_image_model()
+
+        hashed = 0
+        for image in Image.objects.filter(file_hash="").only("pk", "file").iterator(
+                chunk_size=options["batch_size"]):
+            try:
+                file_hash = stream_file_hash(image)
+            except (OSError, ValueError) as e:
+                self.stderr.write("Could not hash image {}: {}".format(image.pk, e))
+                continue
+            Image.objects.filter(pk=image.pk).update(file_hash=file_hash)
+            hashed += 1
+        self.stdout.write("Hashed {} images".format(hashed))
+
+        mapping = {}
+        groups = (
+            Image.objects.exclude(file_hash="")
+            .values("file_hash")
+            .annotate(count=Count("pk"))
+            .filter(count__gt=1)
+        )
+        for group in groups.iterator():
+            pks = list(
+                Image.objects.filter(file_hash=group["file_hash"])
+                .order_by("pk")
+                .values_list("pk", flat=True)
+            )
+            for pk in pks[1:]:
+                mapping[pk] = pks[0]
+        self.stdout.write("Found {} duplicate images".format(len(mapping)))
+        if not mapping or self.dry_run:
+            return
+
+        with transaction.atomic():
+            self.repoint_foreign_keys(Image, mapping)
+            self.repoint_stream_fields(mapping)
+            self.repoint_revisions(Image, mapping)
+
+        duplicates = list(mapping)
+        for start in range(0, len(duplicates), options["batch_size"]):
+            Image.objects.filter(pk__in=duplicates[start:start + options["batch_size"]]).delete()
+
+        self.stdout.write(self.style.SUCCESS(
+            "Merged {} duplicate images. Run rebuild_references_index next.".format(len(mapping))
+        ))
+
+    def by_canonical(self, mapping):
+        canonical = {}
+        for duplicate, original in mapping.items():
+            canonical.setdefault(original, []).append(duplicate)
+        return canonical
+
+    def repoint_foreign_keys(self, Image, mapping):
+        Rendition = Image.get_rendition_model()
+        # Hidden relations are included, as most image foreign keys use
+        # related_name="+".
+        for rel in Image._meta.get_fields(include_hidden=True):
+            if not (rel.auto_created and not rel.concrete and (rel.one_to_many or rel.one_to_one)):
+                continue
+            if rel.related_model is Rendition:
+                continue
+            manager = rel.related_model._base_manager
+            for original, duplicates in self.by_canonical(mapping).items():
+                updated = manager.filter(**{"{}__in".format(rel.field.name): duplicates}).update(
+                    **{rel.field.name: original}
+                )
+                if updated:
+                    self.stdout.write("Repointed {} {}.{}".format(
+                        updated, rel.related_model._meta.label, rel.field.name
+                    ))
+
+    def stream_fields(self):
+        for model in apps.get_models():
+            fields = [
+                f for f in model._meta.get_fields()
+                if isinstance(f, StreamField) and f.model is model
+            ]
+            if fields:
+                yield model, fields
+
+    def repoint_stream_fields(self, mapping):
+        for model, fields in self.stream_fields():
+            names = [f.name for f in fields]
+            for obj in model._base_manager.only("pk", *names).iterator():
+                changed = {}
+                for field in fields:
+                    raw = field.stream_block.get_prep_value(getattr(obj, field.name))
+                    before = json.dumps(raw)
+                    raw = replace_image_ids(field.stream_block, raw, mapping)
+                    if json.dumps(raw) != before:
+                        changed[field.name] = raw
+                if changed:
+                    for name, raw in changed.items():
+                        setattr(obj, name, raw)
+                    model._base_manager.filter(pk=obj.pk).update(
+                        **{name: getattr(obj, name) for name in changed}
+                    )
+                    self.stdout.write("Repointed images in {} {}".format(model._meta.label, obj.pk))
+
+    def repoint_revisions(self, Image, mapping):
+        # Only drafts can bring a deleted image back, so just rewrite the
+        # latest revision of pages with unpublished changes.
+        revisions = Revision.objects.filter(
+            pk__in=Page.objects.filter(has_unpublished_changes=True).values("latest_revision")
+        )
+        for revision in revisions.iterator():
+            model = revision.content_type.model_class()
+            if model is None:
+                continue
+            content = revision.content
+            before = json.dumps(content, sort_keys=True)
+            for field in model._meta.get_fields():
+                if field.name not in content:
+                    continue
+                if field.many_to_one and field.related_model is Image:
+                    content[field.name] = mapping.get(content[field.name], content[field.name])
+                elif isinstance(field, StreamField) and content[field.name]:
+                    raw = json.loads(content[field.name])
+                    content[field.name] = json.dumps(replace_image_ids(field.stream_block, raw, mapping))
+            if json.dumps(content, sort_keys=True) != before:
+                Revision.objects.filter(pk=revision.pk).update(content=content)
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from wagtail.models import Page, Site
+
+from page.static_export import StaticExporter
+
+
+class Command(BaseCommand):
+    help = "Render the public site to static files and upload the ones that changed."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", help="Directory to write to, defaults to STATIC_EXPORT_ROOT")
+        parser.add_argument("--workers", type=int, help="Render processes, defaults to the CPU count")
+        parser.add_argument("--no-upload", action="store_true", help="Only write files locally")
+        parser.add_argument(
+            "--page", type=int,
+            help="Only re-export the pages affected by this page ID",
+        )
+
+    def handle(self, *args, **options):
+        exporter = StaticExporter(output=options["output"], workers=options["workers"])
+        upload = not options["no_upload"]
+
+        if options["page"]:
+            try:
+                page = Page.objects.get(pk=options["page"])
+            except Page.DoesNotExist:
+                raise CommandError("Page {} does not exist".format(options["page"]))
+            results = exporter.export_page(page, upload=upload)
+        else:
+            results = {
+                site.hostname: exporter.export_site(site, upload=upload)
+                for site in Site.objects.select_related("root_page")
+            }
+
+        failures = 0
+        for hostname, (changed, removed, failed) in results.items():
+            self.stdout.write("{}: {} files changed, {} removed, {} failed".format(
+                hostname, len(changed), len(removed), len(failed)
+            ))
+            for path, status in failed.items():
+                self.stderr.write("  {} {}{}".format(status, hostname, path))
+            failures += len(failed)
+        if failures:
+            raise CommandError("{} pages failed to export".format(failures))
@@ -0,0 +1,91 @@
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Fire concurrent GET requests at a running server and report latency. "
+        "Run it against the uWSGI and the ASGI server in turn to compare them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("urls", nargs="+", help="URLs to request, used round robin")
+        parser.add_argument("--concurrency", type=int, default=50)
+        parser.add_argument("--requests", type=int, default=1000)
+        parser.add_argument(
+            "--slow-client", type=float, default=0,
+            help="Seconds to wait between reading 4KB chunks, to simulate slow clients",
+        )
+        parser.add_argument("--timeout", type=float, default=30)
+
+    def handle(self, *args, **options):
+        results = asyncio.run(self.run(options))
+        latencies = sorted(r for r in results if r is not None)
+        errors = len(results) - len(latencies)
+        if not latencies:
+            self.stderr.write("All {} requests failed".format(errors))
+            return
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+        self.stdout.write(
+            "requests={} errors={} concurrency={} rps={:.1f}\n"
+            "latency ms: mean={:.1f} p50={:.1f} p95={:.1f} p99={:.1f} max={:.1f}".format(
+                len(results), errors, options["concurrency"], len(results) / self.elapsed,
+                statistics.mean(latencies) * 1000, percentile(0.5), percentile(0.95),
+                percentile(0.99), latencies[-1] * 1000,
+            )
+        )
+
+    async def run(self, options):
+        queue = asyncio.Queue()
+        for i in range(options["requests"]):
+            queue.put_nowait(options["urls"][i % len(options["urls"])])
+        results = []
+
+        async def worker():
+            while not queue.empty():
+                url = queue.get_nowait()
+                try:
+                    results.append(await asyncio.wait_for(
+                        self.fetch(url, options["slow_client"]), options["timeout"]
+                    ))
+                except (OSError, asyncio.TimeoutError, ValueError):
+                    results.append(None)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(options["concurrency"])))
+        self.elapsed = time.perf_counter() - started
+        return results
+
+    async def fetch(self, url, slow_client):
+        parts = urlsplit(url)
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        started = time.perf_counter()
+        reader, writer = await asyncio.open_connection(
+            parts.hostname, port, ssl=parts.scheme == "https"
+        )
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        writer.write(
+            "GET {} HTTP/1.0\r\nHost: {}\r\n\r\n".format(path, parts.netloc).encode()
+        )
+        await writer.drain()
+        status_line = await reader.readline()
+        while await reader.read(4096):
+            if slow_client:
+                await asyncio.sleep(slow_client)
+        writer.close()
+        parts = status_line.split()
+        if len(parts) < 2:
+            raise ValueError("No response")
+        status = int(parts[1])
+        if status >= 500:
+            raise ValueError(status)
+        return time.perf_counter() - started
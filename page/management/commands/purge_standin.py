@@ -0,0 +1,40 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Listen for surrogate key purges and print them, standing in for the "
+        "CDN. Point EDGE_PURGE_URL at it, e.g. http://127.0.0.1:8099/."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--port", type=int, default=8099)
+        parser.add_argument("--header", default="Surrogate-Key", help="Header carrying the keys")
+
+    def handle(self, *args, **options):
+        stdout = self.stdout
+        header = options["header"]
+
+        class Handler(BaseHTTPRequestHandler):
+            def handle_purge(self):
+                keys = self.headers.get(header, "").split()
+                stdout.write("{} {} {} keys: {}".format(self.command, self.path, len(keys), " ".join(keys)))
+                stdout.flush()
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            do_PURGE = do_POST = handle_purge
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", options["port"]), Handler)
+        self.stdout.write("Listening for purges on http://127.0.0.1:{}/".format(options["port"]))
+        self.stdout.flush()
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,165 @@
+"""
+Warm the shared caches and renditions after a deploy.
+
+Renders every page in the sitemap, or with --tree every live public page,
+in this process and through the whole middleware stack, --concurrency
+pages at a time. That fills the page cache, the navigation, tag and site
+caches, and generates the renditions and placeholders the pages use, so
+the first visitors after a rollout don't pay for them. It then reports
+the page and object cache hit rates of the run and the slowest pages,
+and fails if any page returned a server error.
+
+Pages are rendered by page/handler.py, with the page cache on. Only
+shared state is warmed: the cache behind CACHE_URL, renditions and their
+files. With a local memory cache the run would only fill this process, so
+the command refuses to start. Each worker process warms itself before it
+forks when PRELOAD_APP is set, see page/startup.py. Run this as the Job in
+kube/prod/prod-warm-job.yaml once a rollout has finished.
+"""
+import queue
+import threading
+import time
+from urllib.parse import urlsplit
+from xml.etree import ElementTree
+
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from wagtail.models import Page, Site
+
+from page import metrics
+from page.handler import render
+from page.renditions import wait_for_background
+
+SITEMAP_NS = "{http://www.sitemaps.org/schemas/sitemap/0.9}"
+
+
+def split_url(url):
+    parts = urlsplit(url)
+    path = parts.path or "/"
+    if parts.query:
+        path += "?" + parts.query
+    return parts.netloc, path, parts.scheme == "https"
+
+
+def hit_rate(hits, total):
+    return "{:.1f}%".format(100 * hits / total) if total else "n/a"
+
+
+class Command(BaseCommand):
+    help = "Render every page in-process to fill the caches and renditions, then report hit rates."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sitemap", default="/sitemap.xml", help="Path of the sitemap to walk")
+        parser.add_argument("--host", help="Host to request the sitemap from, the default site's by default")
+        parser.add_argument("--tree", action="store_true", help="Walk the live public pages instead of the sitemap")
+        parser.add_argument("--concurrency", type=int, default=4)
+        parser.add_argument("--limit", type=int, help="Render at most this many pages")
+        parser.add_argument("--slowest", type=int, default=10, help="How many of the slowest pages to list")
+
+    def handle(self, *args, **options):
+        # TieredCache keeps its shared tier under another alias.
+        default = caches["default"]
+        if isinstance(getattr(default, "shared", default), LocMemCache):
+            raise CommandError(
+                "The shared cache is in local memory, so warming would only fill this process. "
+                "Set CACHE_URL to the cache the site uses, e.g. redis://host:6379/0."
+            )
+        urls = self.tree_urls() if options["tree"] else self.sitemap_urls(options)
+        urls = list(dict.fromkeys(urls))[:options["limit"]]
+        if not urls:
+            raise CommandError("No pages to warm")
+
+        page_cache = metrics.counter_values("page_cache_requests_total")
+        object_cache = metrics.counter_values("cache_requests_total")
+        started = time.perf_counter()
+        results = self.render(urls, options["concurrency"])
+        # Listings and placeholders queue what they miss instead of waiting.
+        wait_for_background()
+        elapsed = time.perf_counter() - started
+        page_cache = self.delta(page_cache, metrics.counter_values("page_cache_requests_total"))
+        object_cache = self.delta(object_cache, metrics.counter_values("cache_requests_total"))
+
+        failed = [result for result in results if result[2] >= 500]
+        self.stdout.write("rendered={} failed={} concurrency={} elapsed={:.1f}s".format(
+            len(results), len(failed), options["concurrency"], elapsed,
+        ))
+        hits = page_cache.get((("result", "hit"),), 0)
+        misses = page_cache.get((("result", "miss"),), 0)
+        self.stdout.write("page cache: {:.0f} hits, {:.0f} misses, hit rate {}".format(
+            hits, misses, hit_rate(hits, hits + misses),
+        ))
+        local = object_cache.get((("result", "hit"), ("tier", "local")), 0)
+        shared = object_cache.get((("result", "hit"), ("tier", "shared")), 0)
+        misses = object_cache.get((("result", "miss"), ("tier", "shared")), 0)
+        self.stdout.write("object cache: {:.0f} local hits, {:.0f} shared hits, {:.0f} misses, hit rate {}".format(
+            local, shared, misses, hit_rate(local + shared, local + shared + misses),
+        ))
+        self.stdout.write("slowest pages:")
+        for duration, url, status in sorted(results, reverse=True)[:options["slowest"]]:
+            self.stdout.write("  {:8.1f}ms {} {}".format(duration * 1000, status, url))
+
+        if failed:
+            raise CommandError("{} pages failed: {}".format(len(failed), " ".join(url for _, url, _ in failed)))
+
+    def sitemap_urls(self, options):
+        host = options["host"]
+        if not host:
+            site = Site.objects.get(is_default_site=True)
+            host = site.hostname if site.port in (80, 443) else "{}:{}".format(site.hostname, site.port)
+        return self.read_sitemap(host, options["sitemap"], False)
+
+    def read_sitemap(self, host, path, secure):
+        response, content = render(host, path, secure)
+        if response.status_code != 200:
+            raise CommandError("{} returned {}".format(path, response.status_code))
+        root = ElementTree.fromstring(content)
+        urls = [loc.text.strip() for loc in root.iter(SITEMAP_NS + "loc")]
+        if root.tag != SITEMAP_NS + "sitemapindex":
+            return urls
+        pages = []
+        for url in urls:
+            host, path, secure = split_url(url)
+            pages += self.read_sitemap(host, path, secure)
+        return pages
+
+    def tree_urls(self):
+        pages = Page.objects.live().public().specific().defer_streamfields()
+        return [url for url in (page.get_full_url() for page in pages.iterator()) if url]
+
+    def render(self, urls, concurrency):
+        work = queue.Queue()
+        for url in urls:
+            work.put(url)
+        results = []
+
+        def worker():
+            try:
+                while True:
+                    try:
+                        url = work.get_nowait()
+                    except queue.Empty:
+                        return
+                    host, path, secure = split_url(url)
+                    started = time.perf_counter()
+                    try:
+                        status = render(host, path, secure)[0].status_code
+                    except Exception as e:
+                        self.stderr.write("{}: {}".format(url, e))
+                        status = 500
+                    results.append((time.perf_counter() - started, url, status))
+            finally:
+                # Close the connections this thread opened.
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker) for _ in range(max(1, concurrency))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def delta(self, before, after):
+        return {labels: value - before.get(labels, 0) for labels, value in after.items()}
@@ -0,0 +1,115 @@
+"""
+Opt-in memory instrumentation, enabled by MEMORY_PROFILING=True.
+
+Every request records how much the worker's RSS grew while serving it,
+per route (the page model for wagtail pages, the URL name otherwise). RSS
+belongs to the process, so with two threads per worker this also counts
+whatever the other thread allocated meanwhile: the numbers are approximate,
+only telling over many requests. Every
+MEMORY_SAMPLE_INTERVAL seconds a request also samples the RSS and, in a
+background thread, takes a tracemalloc snapshot; the first one is kept as
+the baseline. ``report`` compares the latest snapshot to the baseline and
+is served to staff at /memory, for the worker that happens to answer.
+
+tracemalloc slows allocations down and holds a traceback per block, so
+leave this off unless you are looking for a leak. Workers are recycled by
+uWSGI's --reload-on-rss whether this is on or not, see the Dockerfile.
+"""
+import collections
+import os
+import threading
+import time
+import tracemalloc
+
+from django.conf import settings
+
+from . import metrics
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+REPORT_LIMIT = 25
+
+_lock = threading.Lock()
+_routes = {}
+_rss_samples = collections.deque(maxlen=100)
+_last_sample = 0
+_baseline = None
+_latest = None
+_snapshot_lock = threading.Lock()
+
+
+def rss():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * PAGE_SIZE
+
+
+def start():
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(settings.MEMORY_TRACE_FRAMES)
+
+
+def take_snapshot():
+    global _baseline, _latest
+    # Snapshots of a big heap take a while; skip this one if another is
+    # still being taken.
+    if not _snapshot_lock.acquire(blocking=False):
+        return
+    try:
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        ))
+        with _lock:
+            if _baseline is None:
+                _baseline = snapshot
+            _latest = snapshot
+    finally:
+        _snapshot_lock.release()
+
+
+def record(route, delta):
+    metrics.inc("route_rss_growth_approx_bytes_total", max(delta, 0), route=route)
+    with _lock:
+        stats = _routes.setdefault(route, [0, 0, 0])
+        stats[0] += 1
+        stats[1] += delta
+        stats[2] = max(stats[2], delta)
+
+
+def sample():
+    global _last_sample
+    now = time.monotonic()
+    with _lock:
+        if now - _last_sample < settings.MEMORY_SAMPLE_INTERVAL:
+            return
+        _last_sample = now
+    value = rss()
+    _rss_samples.append((time.time(), value))
+    metrics.set_gauge("memory_sampled_rss_bytes", value)
+    if tracemalloc.is_tracing():
+        threading.Thread(target=take_snapshot, daemon=True).start()
+
+
+def _mib(value):
+    return "{:.1f} MiB".format(value / 1024 / 1024)
+
+
+def report():
+    lines = ["pid {} rss {}".format(os.getpid(), _mib(rss())), "", "RSS samples:"]
+    for at, value in list(_rss_samples):
+        lines.append("  {} {}".format(time.strftime("%H:%M:%S", time.localtime(at)), _mib(value)))
+
+    lines += ["", "Routes by approximate RSS growth, other threads included (requests, total, largest):"]
+    with _lock:
+        routes = sorted(_routes.items(), key=lambda item: item[1][1], reverse=True)
+        baseline, latest = _baseline, _latest
+    for route, (count, total, largest) in routes[:REPORT_LIMIT]:
+        lines.append("  {:>7} {:>12} {:>12}  {}".format(count, _mib(total), _mib(largest), route))
+
+    lines += ["", "Allocations grown since the first snapshot:"]
+    if baseline is None or latest is baseline:
+        lines.append("  Not enough snapshots yet.")
+    else:
+        for stat in latest.compare_to(baseline, "lineno")[:REPORT_LIMIT]:
+            lines.append("  {}".format(stat))
+    return "\n".join(lines) + "\n"
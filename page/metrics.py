@@ -0,0 +1,91 @@
+"""
+A small in-process metrics registry rendered in the Prometheus text format.
+
+Values are per process: each uWSGI worker or ASGI process keeps its own
+registry, so scrape every pod and aggregate in the monitoring backend.
+Collectors registered with ``register_collector`` are called at scrape time
+for values that are cheaper to read than to track, such as pool sizes.
+"""
+import threading
+from collections import defaultdict
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_lock = threading.Lock()
+_counters = defaultdict(float)
+_gauges = {}
+_histograms = {}
+_collectors = []
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, value=1, **labels):
+    with _lock:
+        _counters[_key(name, labels)] += value
+
+
+def set_gauge(name, value, **labels):
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def observe(name, value, buckets=LATENCY_BUCKETS, **labels):
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {"buckets": buckets, "counts": [0] * len(buckets), "sum": 0.0, "count": 0}
+        for i, bound in enumerate(histogram["buckets"]):
+            if value <= bound:
+                histogram["counts"][i] += 1
+        histogram["sum"] += value
+        histogram["count"] += 1
+
+
+def counter_values(name):
+    """This process's values of the counter ``name``, keyed by their labels."""
+    with _lock:
+        return {labels: value for (key, labels), value in _counters.items() if key == name}
+
+
+def register_collector(collector):
+    """
+    Registers a callable returning an iterable of (name, value, labels)
+    gauges, called every time the metrics are rendered.
+    """
+    if collector not in _collectors:
+        _collectors.append(collector)
+
+
+def _labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(k, str(v).replace('"', '\\"')) for k, v in items) + "}"
+
+
+def render():
+    lines = []
+    gauges = dict(_gauges)
+    for collector in list(_collectors):
+        for name, value, labels in collector():
+            gauges[_key(name, labels)] = value
+
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted(_histograms.items())
+
+    for (name, labels), value in counters:
+        lines.append("{}{} {}".format(name, _labels(labels), value))
+    for (name, labels), value in sorted(gauges.items()):
+        lines.append("{}{} {}".format(name, _labels(labels), value))
+    for (name, labels), histogram in histograms:
+        for bound, count in zip(histogram["buckets"], histogram["counts"]):
+            lines.append("{}_bucket{} {}".format(name, _labels(labels, [("le", bound)]), count))
+        lines.append("{}_bucket{} {}".format(name, _labels(labels, [("le", "+Inf")]), histogram["count"]))
+        lines.append("{}_sum{} {}".format(name, _labels(labels), histogram["sum"]))
+        lines.append("{}_count{} {}".format(name, _labels(labels), histogram["count"]))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,358 @@
+import threading
+import time
+from urllib.parse import urlparse
+
+from asgiref.sync import iscoroutinefunction
+from django import http
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import DisallowedHost
+from django.utils.cache import patch_cache_control
+from django.utils.decorators import sync_and_async_middleware
+from django.utils.encoding import escape_uri_path
+
+from wagtail.contrib.redirects.middleware import RedirectMiddleware
+from wagtail.contrib.redirects.models import Redirect
+from wagtail.models import Site
+
+from . import memory, metrics
+from .db.routers import achoose_replica, choose_replica, reset_replica, use_replica
+from .edge_cache import add_edge_cache_headers
+from .cache import anamespace_version, namespace_key, namespace_version
+from .redirects import find_redirect
+from .sites import afind_site_for_request, find_site_for_request
+
+PAGE_CACHE_SKIP_COOKIES = ("sessionid", "messages", "csrftoken")
+# /_util/ holds wagtail's login and password forms for restricted pages.
+PAGE_CACHE_SKIP_PREFIXES = ("/admin/", "/django-admin/", "/documents/", "/metrics", "/memory", "/_util/")
+# Query parameters that pages read. Requests carrying one skip the page
+# cache; any other parameter (utm_source, fbclid, ...) is left out of the
+# key, so it can't add entries.
+PAGE_CACHE_SKIP_PARAMS = ("missing_tag",)
+
+
+def is_anonymous_request(request):
+    """
+    GET/HEAD requests for public pages without a session, messages or CSRF
+    cookie. Their responses don't depend on who is asking.
+    """
+    if request.method not in ("GET", "HEAD"):
+        return False
+    if request.path.startswith(PAGE_CACHE_SKIP_PREFIXES):
+        return False
+    return not any(name in request.COOKIES for name in PAGE_CACHE_SKIP_COOKIES)
+
+
+def is_cacheable_request(request):
+    """
+    Anonymous requests can be answered from the page cache, unless they
+    come from the static export, see page/handler.py, or carry a query
+    parameter the page reads.
+    """
+    if getattr(request, "skip_page_cache", False):
+        return False
+    if any(name in request.GET for name in PAGE_CACHE_SKIP_PARAMS):
+        return False
+    return bool(settings.PAGE_CACHE_TIMEOUT) and is_anonymous_request(request)
+
+
+def is_cacheable_response(response):
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        and "private" not in response.get("Cache-Control", "")
+    )
+
+
+def page_cache_key(request, version):
+    # The path only, see PAGE_CACHE_SKIP_PARAMS.
+    return namespace_key("page", "{}:{}".format(request.get_host(), escape_uri_path(request.path)), version)
+
+
+@sync_and_async_middleware
+def page_cache_middleware(get_response):
+    """
+    Caches whole responses for anonymous visitors for PAGE_CACHE_TIMEOUT
+    seconds. Publishing a page bumps the "page" cache namespace.
+    """
+    timeout = settings.PAGE_CACHE_TIMEOUT
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            if not is_cacheable_request(request):
+                return await get_response(request)
+            key = page_cache_key(request, await anamespace_version("page"))
+            response = await cache.aget(key)
+            if response is not None:
+                metrics.inc("page_cache_requests_total", result="hit")
+                return response
+            metrics.inc("page_cache_requests_total", result="miss")
+            response = await get_response(request)
+            if is_cacheable_response(response):
+                await cache.aset(key, response, timeout)
+            return response
+    else:
+        def middleware(request):
+            if not is_cacheable_request(request):
+                return get_response(request)
+            key = page_cache_key(request, namespace_version("page"))
+            response = cache.get(key)
+            if response is not None:
+                metrics.inc("page_cache_requests_total", result="hit")
+                return response
+            metrics.inc("page_cache_requests_total", result="miss")
+            response = get_response(request)
+            if is_cacheable_response(response):
+                cache.set(key, response, timeout)
+            return response
+
+    return middleware
+
+
+def _make_shareable(request, response):
+    if not is_anonymous_request(request):
+        return response
+    if response.cookies:
+        # A view did set a cookie, e.g. a CSRF token for a form. Keep it, and
+        # keep the response out of shared caches.
+        patch_cache_control(response, private=True)
+        metrics.inc("anonymous_responses_total", shareable="false")
+        return response
+    # Without a session cookie nothing was loaded, so a session read (the
+    # userbar checking request.user) can't have changed the response.
+    vary = [header.strip() for header in response.get("Vary", "").split(",") if header.strip()]
+    vary = [header for header in vary if header.lower() != "cookie"]
+    if vary:
+        response["Vary"] = ", ".join(vary)
+    elif response.has_header("Vary"):
+        del response["Vary"]
+    metrics.inc("anonymous_responses_total", shareable="true")
+    return response
+
+
+def _add_edge_cache_headers(request, response):
+    if is_anonymous_request(request):
+        add_edge_cache_headers(request, response)
+    return response
+
+
+@sync_and_async_middleware
+def edge_cache_middleware(get_response):
+    """
+    Adds the Cache-Control and Surrogate-Key headers of page/edge_cache.py to
+    anonymous responses. Sits inside the page cache so cached responses keep
+    them, and outside anonymous_middleware so private responses are skipped.
+    """
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            return _add_edge_cache_headers(request, await get_response(request))
+    else:
+        def middleware(request):
+            return _add_edge_cache_headers(request, get_response(request))
+
+    return middleware
+
+
+@sync_and_async_middleware
+def anonymous_middleware(get_response):
+    """
+    Keeps responses to anonymous requests free of Vary: Cookie, so shared
+    caches and the CDN can store them. Sits outside the session, CSRF, auth
+    and messages middleware, which only read or write anything once asked.
+    """
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            return _make_shareable(request, await get_response(request))
+    else:
+        def middleware(request):
+            return _make_shareable(request, get_response(request))
+
+    return middleware
+
+
+@sync_and_async_middleware
+def replica_middleware(get_response):
+    """
+    Sends the reads of anonymous requests to a read replica, see
+    page/db/routers.py.
+    """
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            alias = await achoose_replica() if is_anonymous_request(request) else None
+            metrics.inc("db_routed_requests_total", target="replica" if alias else "primary")
+            token = use_replica(alias)
+            try:
+                return await get_response(request)
+            finally:
+                reset_replica(token)
+    else:
+        def middleware(request):
+            alias = choose_replica() if is_anonymous_request(request) else None
+            metrics.inc("db_routed_requests_total", target="replica" if alias else "primary")
+            token = use_replica(alias)
+            try:
+                return get_response(request)
+            finally:
+                reset_replica(token)
+
+    return middleware
+
+
+@sync_and_async_middleware
+def site_middleware(get_response):
+    """
+    Resolves the wagtail Site from the process-wide map in page/sites.py and
+    stores it where Site.find_for_request looks first.
+    """
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            try:
+                request._wagtail_site = await afind_site_for_request(request)
+            except DisallowedHost:
+                pass
+            return await get_response(request)
+    else:
+        def middleware(request):
+            try:
+                request._wagtail_site = find_site_for_request(request)
+            except DisallowedHost:
+                pass
+            return get_response(request)
+
+    return middleware
+
+
+def _add_preload_links(request, response):
+    links = getattr(request, "preload_links", None)
+    if links and response.status_code == 200 and not response.has_header("Link"):
+        response["Link"] = ", ".join(links)
+    return response
+
+
+@sync_and_async_middleware
+def preload_middleware(get_response):
+    """
+    Sends the preload links collected while serving a page, see
+    page/preload.py, as a Link header. Sits inside the page cache so cached
+    responses keep the header.
+    """
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            return _add_preload_links(request, await get_response(request))
+    else:
+        def middleware(request):
+            return _add_preload_links(request, get_response(request))
+
+    return middleware
+
+
+def _record(request, response, started):
+    status = "{}xx".format(response.status_code // 100)
+    metrics.inc("http_requests_total", method=request.method, status=status)
+    metrics.observe("http_request_duration_seconds", time.perf_counter() - started)
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    """Counts requests and records their latency, see page/metrics.py."""
+    in_flight = 0
+    in_flight_lock = threading.Lock()
+
+    def track(delta):
+        # uWSGI runs two threads per worker.
+        nonlocal in_flight
+        with in_flight_lock:
+            in_flight += delta
+            metrics.set_gauge("http_requests_in_flight", in_flight)
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            started = time.perf_counter()
+            track(1)
+            try:
+                response = await get_response(request)
+            finally:
+                track(-1)
+            _record(request, response, started)
+            return response
+    else:
+        def middleware(request):
+            started = time.perf_counter()
+            track(1)
+            try:
+                response = get_response(request)
+            finally:
+                track(-1)
+            _record(request, response, started)
+            return response
+
+    return middleware
+
+
+def _memory_route(request):
+    page_model = getattr(request, "page_model", None)
+    if page_model:
+        return page_model
+    match = getattr(request, "resolver_match", None)
+    # No match means the page cache answered before URL resolution.
+    return match.view_name if match else "unresolved"
+
+
+@sync_and_async_middleware
+def memory_middleware(get_response):
+    """
+    Records roughly how much each request grew the worker's RSS when
+    MEMORY_PROFILING is on, see page/memory.py.
+    """
+    if not settings.MEMORY_PROFILING:
+        return get_response
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            before = memory.rss()
+            response = await get_response(request)
+            memory.record(_memory_route(request), memory.rss() - before)
+            memory.sample()
+            return response
+    else:
+        def middleware(request):
+            before = memory.rss()
+            response = get_response(request)
+            memory.record(_memory_route(request), memory.rss() - before)
+            memory.sample()
+            return response
+
+    return middleware
+
+
+class CachedRedirectMiddleware(RedirectMiddleware):
+    """
+    wagtail's RedirectMiddleware, looking paths up in the per-site maps of
+    page/redirects.py instead of querying on every 404.
+    """
+
+    def process_response(self, request, response):
+        if response.status_code != 404:
+            return response
+
+        site = Site.find_for_request(request)
+        site_id = site.pk if site else None
+        path = Redirect.normalise_path(request.get_full_path())
+        redirect = find_redirect(site_id, path)
+        if redirect is None:
+            path_without_query = urlparse(path).path
+            if path == path_without_query:
+                metrics.inc("redirect_lookups_total", result="miss")
+                return response
+            redirect = find_redirect(site_id, path_without_query)
+            if redirect is None:
+                metrics.inc("redirect_lookups_total", result="miss")
+                return response
+
+        metrics.inc("redirect_lookups_total", result="hit")
+        if redirect.link is None:
+            return response
+        if redirect.is_permanent:
+            return http.HttpResponsePermanentRedirect(redirect.link)
+        return http.HttpResponseRedirect(redirect.link)
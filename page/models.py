@@ -15,7 +15,7 @@ class StandardPage(Page):
         ('three_columns', ThreeColumnBlock(group='COLUMNS')),
         ('four_columns', FourColumnBlock(group='COLUMNS')),
         ('image_grid', ImageGridBlock(icon='image', min_num=2, max_num=4, help_text='Minimum 2 blocks and a maximum of 4 blocks')),
-    ], use_json_field=True, default='')
+    ], use_json_field=True, default='', collapsed=True)
 
     content_panels = Page.content_panels + [
         FieldPanel('body'),
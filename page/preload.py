@@ -0,0 +1,58 @@
+"""
+Preload links for the assets every page needs first: the stylesheets, the
+Bootstrap bundle and the hero image, which is usually the largest
+contentful paint.
+
+The links are sent as a ``Link`` header on the page response and, when the
+ASGI server supports the early hints extension, as a 103 Early Hints
+response before the page is rendered. See page/wagtail_hooks.py.
+"""
+import functools
+
+from django.core.cache import cache
+from django.templatetags.static import static
+
+from .cache import namespace_key
+from .renditions import webp_filter_spec
+from .templatetags.asset_tags import STYLESHEETS
+
+# Same rendition as the <source> in blocks/hero_image_block.html and
+# article/article_page.html
+HERO_FILTER = webp_filter_spec("fill-2400x658-c100")
+SCRIPTS = ["vendor/bootstrap/js/bootstrap.bundle.min.js"]
+
+
+@functools.lru_cache(maxsize=None)
+def static_preload_links():
+    # Hashed names never change while the process runs.
+    return tuple(
+        ["<{}>; rel=preload; as=style".format(static(name)) for name in STYLESHEETS]
+        + ["<{}>; rel=preload; as=script".format(static(name)) for name in SCRIPTS]
+    )
+
+
+def hero_image(page):
+    """The image of the hero at the top of ``page``, if it has one."""
+    if hasattr(page, "article_image"):
+        return page.article_image
+    body = getattr(page, "body", None)
+    if body and body[0].block_type == "hero_image":
+        return body[0].value["hero_image"]
+    return None
+
+
+def hero_preload_links(page):
+    # Cached with the page, so the rendition lookup only happens once per
+    # publish.
+    key = namespace_key("page", "preload:{}".format(page.pk))
+    links = cache.get(key)
+    if links is None:
+        image = hero_image(page)
+        links = []
+        if image is not None:
+            rendition = image.get_rendition(HERO_FILTER)
+            links.append(
+                "<{}>; rel=preload; as=image; type=image/webp; fetchpriority=high".format(rendition.url)
+            )
+        cache.set(key, links)
+    return links
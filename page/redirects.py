@@ -0,0 +1,78 @@
+"""
+In-memory redirect lookup for the redirect middleware.
+
+Every redirect that applies to a site is loaded into one dict per site and
+process, so a 404 for a path with no redirect, like most bot scans, is a dict
+lookup rather than a query. The maps are rebuilt when the "redirects" cache
+namespace is bumped on redirect save or delete.
+"""
+import threading
+
+from django.db.models import Q
+from django.utils.encoding import uri_to_iri
+
+from wagtail.contrib.redirects.models import Redirect
+
+from .cache import get_or_compute, namespace_key, namespace_version
+
+REDIRECT_MAP_TIMEOUT = 60 * 60
+
+_maps = {}
+_maps_lock = threading.Lock()
+
+
+def build_redirect_map(site_id):
+    redirects = Redirect.objects.filter(site__isnull=True)
+    if site_id:
+        redirects = Redirect.objects.filter(Q(site_id=site_id) | Q(site__isnull=True))
+
+    redirect_map = {}
+    # A site-specific redirect wins over a site-ambivalent one for the same
+    # path, as in wagtail's get_redirect.
+    for redirect in redirects.values(
+        "old_path", "site_id", "is_permanent", "redirect_page_id",
+        "redirect_page_route_path", "redirect_link",
+    ):
+        if redirect["site_id"] is None and redirect["old_path"] in redirect_map:
+            continue
+        entry = (
+            redirect["is_permanent"], redirect["redirect_page_id"],
+            redirect["redirect_page_route_path"], redirect["redirect_link"],
+        )
+        redirect_map[redirect["old_path"]] = entry
+        redirect_map.setdefault(uri_to_iri(redirect["old_path"]), entry)
+    return redirect_map
+
+
+def redirect_map(site_id):
+    version = namespace_version("redirects")
+    cached = _maps.get(site_id)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    key = namespace_key("redirects", "site:{}".format(site_id), version)
+    mapping = get_or_compute(key, lambda: build_redirect_map(site_id), REDIRECT_MAP_TIMEOUT)
+    with _maps_lock:
+        _maps[site_id] = (version, mapping)
+    return mapping
+
+
+def find_redirect(site_id, path):
+    """
+    Returns an unsaved Redirect for ``path``, or None. Only a hit touches the
+    database, to resolve the target page's URL.
+    """
+    if "\0" in path:
+        return None
+    entry = redirect_map(site_id).get(path)
+    if entry is None:
+        entry = redirect_map(site_id).get(uri_to_iri(path))
+    if entry is None:
+        return None
+    is_permanent, redirect_page_id, redirect_page_route_path, redirect_link = entry
+    return Redirect(
+        old_path=path,
+        is_permanent=is_permanent,
+        redirect_page_id=redirect_page_id,
+        redirect_page_route_path=redirect_page_route_path,
+        redirect_link=redirect_link,
+    )
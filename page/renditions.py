@@ -0,0 +1,113 @@
+"""Rendition helpers shared by the picture tag, page preloading and listings."""
+import base64
+import logging
+import threading
+from urllib.parse import quote
+
+from django.core.cache import cache
+from django.db import connections
+
+from wagtail.images import get_image_model
+
+logger = logging.getLogger(__name__)
+
+_pending = set()
+_pending_lock = threading.Lock()
+_worker = None
+
+# A tiny webp of the whole image, scaled up and blurred by the browser until
+# the real rendition arrives.
+PLACEHOLDER_FILTER = "width-24|format-webp|webpquality-30"
+PLACEHOLDER_SVG = (
+    "<svg xmlns='http://www.w3.org/2000/svg' viewBox='0 0 {width} {height}'>"
+    "<filter id='b' color-interpolation-filters='sRGB'><feGaussianBlur stdDeviation='1'/></filter>"
+    "<image preserveAspectRatio='none' filter='url(#b)' width='{width}' height='{height}' "
+    "href='data:image/webp;base64,{data}'/></svg>"
+)
+
+
+def webp_filter_spec(filter_spec):
+    # jpegquality only applies to the jpeg fallback, leave it out so the
+    # webp shares its rendition with other users of the same size. A spec
+    # that already picks a format is used as it is.
+    operations = [op for op in filter_spec.split("|") if not op.startswith("jpegquality-")]
+    if any(op.startswith("format-") for op in operations):
+        return filter_spec
+    return "|".join(operations + ["format-webp"])
+
+
+def placeholder_key(image):
+    # Keyed by the file hash so a replaced file gets a new placeholder.
+    return "placeholder:{}:{}".format(image.pk, image.file_hash or image.file.name)
+
+
+def build_placeholder(image):
+    """
+    Generates the blurred placeholder of ``image`` and caches its data URI
+    for good. The tiny rendition is stored like any other.
+    """
+    rendition = image.get_rendition(PLACEHOLDER_FILTER)
+    with rendition.file.open("rb") as f:
+        data = base64.b64encode(f.read()).decode()
+    svg = PLACEHOLDER_SVG.format(width=rendition.width, height=rendition.height, data=data)
+    uri = "data:image/svg+xml;charset=utf-8," + quote(svg)
+    cache.set(placeholder_key(image), uri, None)
+    return uri
+
+
+def placeholder_data_uri(image):
+    """
+    Returns the blurred placeholder of ``image`` as a data URI, or "" while
+    it hasn't been generated. Placeholders are generated in the background
+    when an image is saved, see page/signal_handlers.py, or when one is
+    first missed here, so rendering never reads from storage.
+    """
+    uri = cache.get(placeholder_key(image))
+    if uri is None:
+        generate_in_background(image.pk, PLACEHOLDER_FILTER)
+        return ""
+    return uri
+
+
+def _generate():
+    global _worker
+    try:
+        while True:
+            with _pending_lock:
+                if not _pending:
+                    _worker = None
+                    return
+                image_id, filter_spec = _pending.pop()
+            try:
+                image = get_image_model().objects.get(pk=image_id)
+                if filter_spec == PLACEHOLDER_FILTER:
+                    build_placeholder(image)
+                else:
+                    image.get_rendition(filter_spec)
+            except Exception:
+                logger.warning("Could not generate %s of image %s", filter_spec, image_id, exc_info=True)
+    finally:
+        # Close the connections this thread opened.
+        connections.close_all()
+
+
+def generate_in_background(image_id, filter_spec):
+    """
+    Generates a rendition in a background thread, for listings that show
+    whatever renditions exist rather than waiting for missing ones, and
+    placeholders when given PLACEHOLDER_FILTER. A rendition already queued
+    isn't queued again.
+    """
+    global _worker
+    with _pending_lock:
+        _pending.add((image_id, filter_spec))
+        if _worker is None:
+            _worker = threading.Thread(target=_generate, daemon=True)
+            _worker.start()
+
+
+def wait_for_background():
+    """Waits until the renditions queued so far have been generated."""
+    worker = _worker
+    if worker is not None:
+        worker.join()
@@ -0,0 +1,157 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+
+from wagtail.contrib.redirects.models import Redirect
+from wagtail.documents import get_document_model
+from wagtail.images import get_image_model
+from wagtail.models import Collection, CollectionViewRestriction, Page, Site, get_page_models
+from wagtail.signals import page_published, page_unpublished, post_page_move
+from wagtail.utils.file import hash_filelike
+
+from taggit.models import Tag
+
+from .cache import PAGE_CONTENT_NAMESPACES, bump_namespace
+from .documents import update_collection_file_acls, update_file_acls
+from .edge_cache import purge, purge_instance, purge_page, purge_tree
+from .errors import refresh_snapshot
+from .images import find_duplicate
+from .renditions import PLACEHOLDER_FILTER, generate_in_background, placeholder_key
+
+
+def pre_save_deduplicate_image(instance, raw=False, **kwargs):
+    # Reuse the stored file of an identical image instead of uploading a
+    # second copy of it.
+    if raw or not getattr(settings, "WAGTAILIMAGES_DEDUPLICATE_UPLOADS", False):
+        return
+    if not instance._state.adding or not instance.file or instance.file._committed:
+        return
+
+    if not instance.file_hash:
+        instance.file_hash = hash_filelike(instance.file)
+    existing = find_duplicate(instance)
+    if existing is None:
+        return
+
+    # Marking the file as committed stops FileField.pre_save from uploading it.
+    instance.file.name = existing.file.name
+    instance.file._committed = True
+    instance.width = existing.width
+    instance.height = existing.height
+    instance.file_size = existing.file_size
+
+
+def post_save_generate_placeholder(instance, raw=False, **kwargs):
+    # The picture tag only reads placeholders from the cache.
+    if raw or not instance.file or cache.get(placeholder_key(instance)) is not None:
+        return
+    transaction.on_commit(lambda: generate_in_background(instance.pk, PLACEHOLDER_FILTER))
+
+
+def page_published_static_export(instance, **kwargs):
+    if getattr(settings, "STATIC_EXPORT_ON_PUBLISH", False):
+        from .static_export import export_page_on_commit
+
+        export_page_on_commit(instance)
+
+
+def invalidate_page_cache(**kwargs):
+    bump_namespace(*PAGE_CONTENT_NAMESPACES)
+
+
+def refresh_error_page_snapshot(**kwargs):
+    # The menu may have changed, refresh the header used by error pages.
+    transaction.on_commit(refresh_snapshot)
+
+
+def invalidate_redirects(**kwargs):
+    bump_namespace("redirects")
+
+
+def invalidate_sites(**kwargs):
+    bump_namespace("sites")
+
+
+def purge_published_page(instance, **kwargs):
+    purge_page(instance)
+
+
+def purge_moved_page(instance, **kwargs):
+    purge_tree(instance)
+
+
+def purge_deleted_page(instance, **kwargs):
+    purge("page-{}".format(instance.pk))
+
+
+def remember_menu_state(instance, raw=False, update_fields=None, **kwargs):
+    # Publishing saves every field of the page; until then the row still has
+    # the live version's show_in_menus, so purge_page can tell when a page
+    # leaves the menus. Draft saves only touch the revision fields.
+    if raw or instance.pk is None or (update_fields is not None and "show_in_menus" not in update_fields):
+        return
+    instance.was_in_menus = Page.objects.filter(pk=instance.pk, show_in_menus=True).exists()
+
+
+def purge_saved_instance(instance, raw=False, **kwargs):
+    if not raw:
+        purge_instance(instance)
+
+
+def connect_purge(*models):
+    """Purges the edge keys of instances of ``models`` when they are saved or deleted."""
+    for model in models:
+        post_save.connect(purge_saved_instance, sender=model)
+        post_delete.connect(purge_saved_instance, sender=model)
+
+
+def invalidate_documents(**kwargs):
+    bump_namespace("documents")
+
+
+def update_document_acl(instance, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(lambda: update_file_acls([instance]))
+
+
+def update_restricted_document_acls(instance, **kwargs):
+    transaction.on_commit(lambda: update_collection_file_acls(instance.collection_id))
+
+
+def register_signal_handlers():
+    Image = get_image_model()
+    Document = get_document_model()
+
+    pre_save.connect(pre_save_deduplicate_image, sender=Image)
+    post_save.connect(post_save_generate_placeholder, sender=Image)
+    page_published.connect(page_published_static_export)
+    page_unpublished.connect(page_published_static_export)
+    page_published.connect(invalidate_page_cache)
+    page_unpublished.connect(invalidate_page_cache)
+    post_page_move.connect(invalidate_page_cache)
+    page_published.connect(refresh_error_page_snapshot)
+    page_unpublished.connect(refresh_error_page_snapshot)
+    post_page_move.connect(refresh_error_page_snapshot)
+    post_delete.connect(invalidate_page_cache, sender=Page)
+    post_save.connect(invalidate_sites, sender=Site)
+    post_delete.connect(invalidate_sites, sender=Site)
+    post_save.connect(invalidate_redirects, sender=Redirect)
+    post_delete.connect(invalidate_redirects, sender=Redirect)
+    post_save.connect(invalidate_documents, sender=Document)
+    post_delete.connect(invalidate_documents, sender=Document)
+    post_save.connect(invalidate_documents, sender=CollectionViewRestriction)
+    post_delete.connect(invalidate_documents, sender=CollectionViewRestriction)
+    post_save.connect(invalidate_documents, sender=Collection)
+    post_delete.connect(invalidate_documents, sender=Collection)
+    post_save.connect(update_document_acl, sender=Document)
+    post_save.connect(update_restricted_document_acls, sender=CollectionViewRestriction)
+    post_delete.connect(update_restricted_document_acls, sender=CollectionViewRestriction)
+    page_published.connect(purge_published_page)
+    page_unpublished.connect(purge_published_page)
+    post_page_move.connect(purge_moved_page)
+    post_delete.connect(purge_deleted_page, sender=Page)
+    for model in get_page_models():
+        pre_save.connect(remember_menu_state, sender=model)
+    # Snippets are connected by the apps defining them, see article/apps.py.
+    connect_purge(Tag, Image)
@@ -0,0 +1,61 @@
+"""
+Process-wide hostname to Site map, so resolving the site for a request
+costs no queries once a process has seen the host.
+
+Site.find_for_request already memoises the site on the request; the
+middleware in page/middleware.py fills that memo from here. Entries are
+dropped when the "sites" cache namespace is bumped, which happens when a
+site is saved or deleted and when pages, root pages included, are
+published or moved. ALLOWED_HOSTS bounds the number of entries.
+"""
+from asgiref.sync import sync_to_async
+from django.http.request import split_domain_port
+
+from wagtail.models import Site
+from wagtail.models.sites import get_site_for_hostname
+
+from .cache import anamespace_version, namespace_version
+
+_MISSING = object()
+_sites = {}
+_sites_version = None
+
+
+def _lookup(key, version):
+    global _sites, _sites_version
+    if version != _sites_version:
+        _sites = {}
+        _sites_version = version
+    return _sites.get(key, _MISSING)
+
+
+def _resolve(key, version):
+    try:
+        site = get_site_for_hostname(*key)
+    except Site.DoesNotExist:
+        site = None
+    if version == _sites_version:
+        _sites[key] = site
+    return site
+
+
+def _site_key(request):
+    return split_domain_port(request.get_host())[0], request.get_port()
+
+
+def find_site_for_request(request):
+    key = _site_key(request)
+    version = namespace_version("sites")
+    site = _lookup(key, version)
+    if site is _MISSING:
+        site = _resolve(key, version)
+    return site
+
+
+async def afind_site_for_request(request):
+    key = _site_key(request)
+    version = await anamespace_version("sites")
+    site = _lookup(key, version)
+    if site is _MISSING:
+        site = await sync_to_async(_resolve)(key, version)
+    return site
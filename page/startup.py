@@ -0,0 +1,129 @@
+"""
+Preloading the app in the uWSGI master so workers start warm.
+
+With PRELOAD_APP=True, wsgi.py calls ``warm_up`` once in the master before
+uWSGI forks: it loads the URL resolvers, compiles the project's templates,
+packs the editor's StreamField block definitions and fills the site,
+redirect, menu and error page caches, then closes every connection and
+connection pool the master opened. wsgi.py then calls gc.freeze(), so
+the garbage collector never touches, and so never copies, the pages
+workers share with the master. A worker recycled after --max-requests is a fresh fork of that
+master and serves its first request without importing or compiling
+anything.
+
+``memory_stats`` reports how much of a worker's memory is its own.
+"""
+import logging
+import os
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.template import TemplateDoesNotExist, TemplateSyntaxError, loader
+from django.test import RequestFactory
+from django.urls import get_resolver
+
+from wagtail.fields import StreamField
+from wagtail.models import Site
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def load_urls():
+    get_resolver().url_patterns
+    get_resolver()._populate()
+
+
+def compile_templates():
+    for directory in settings.TEMPLATES[0]["DIRS"]:
+        for root, _, files in os.walk(directory):
+            for name in files:
+                if not name.endswith((".html", ".txt", ".xml")):
+                    continue
+                template_name = os.path.relpath(os.path.join(root, name), directory)
+                try:
+                    loader.get_template(template_name)
+                except (TemplateDoesNotExist, TemplateSyntaxError):
+                    logger.warning("Could not compile %s", template_name, exc_info=True)
+
+
+def build_blocks():
+    from .block_definitions import pack
+
+    for model in apps.get_models():
+        for field in model._meta.get_fields():
+            if isinstance(field, StreamField):
+                pack(field.stream_block)
+
+
+def load_images():
+    from PIL import Image
+
+    Image.init()
+
+
+def warm_caches():
+    from .errors import refresh_snapshot
+    from .preload import static_preload_links
+    from .redirects import redirect_map
+    from .sites import find_site_for_request
+    from .templatetags.navigation_tags import menu_tree
+
+    # Synchronously: load_snapshot would refresh in a thread, and the
+    # master must not have threads running when it forks.
+    refresh_snapshot()
+    redirect_map(None)
+    factory = RequestFactory()
+    for site in Site.objects.select_related("root_page"):
+        find_site_for_request(factory.get("/", HTTP_HOST=site.hostname, SERVER_PORT=site.port))
+        redirect_map(site.pk)
+        menu_tree(site.root_page)
+    static_preload_links()
+
+
+def warm_up(started):
+    """Runs each step, carrying on if one fails, e.g. with the database down."""
+    for step in (load_urls, compile_templates, build_blocks, load_images, warm_caches):
+        try:
+            step()
+        except Exception:
+            logger.warning("Preloading step %s failed", step.__name__, exc_info=True)
+
+    # Workers must not share the master's sockets. With DATABASE_POOL the
+    # pool's connections and threads go too; each worker opens its own pool
+    # on its first query.
+    connections.close_all()
+    if settings.DATABASE_POOL:
+        from .db.postgresql.base import close_pools
+
+        close_pools()
+    caches["default"].close()
+
+    elapsed = time.perf_counter() - started
+    metrics.set_gauge("app_startup_seconds", elapsed)
+    logger.info("App preloaded in %.2fs", elapsed)
+
+
+def memory_stats():
+    """
+    Resident, proportional and unique (private) memory of this process, from
+    /proc/self/smaps_rollup. Unique memory is what a worker costs on top of
+    the pages it shares with the master and its siblings.
+    """
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            lines = f.readlines()
+    except OSError:
+        return
+    fields = {}
+    for line in lines:
+        parts = line.split()
+        if len(parts) == 3 and parts[2] == "kB":
+            fields[parts[0].rstrip(":")] = int(parts[1]) * 1024
+    yield "process_resident_memory_bytes", fields.get("Rss", 0), {}
+    yield "process_proportional_memory_bytes", fields.get("Pss", 0), {}
+    yield "process_unique_memory_bytes", fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0), {}
@@ -0,0 +1,278 @@
+"""
+Render the public site to static files and sync them to object storage.
+
+Every live page, the article tag routes and the sitemap are rendered through
+the normal middleware, bypassing the page cache (see page/handler.py),
+written under ``STATIC_EXPORT_ROOT/<hostname>/`` and uploaded to
+``STATIC_EXPORT_BUCKET`` when their contents changed since the last upload.
+A page that fails to render is reported and keeps its previous file.
+"""
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from wagtail.models import Page, Revision, Site
+
+from .handler import render
+
+MANIFEST_NAME = "manifest.json"
+
+logger = logging.getLogger(__name__)
+
+
+def _init_worker():
+    # Forked workers must not share the parent's database connections.
+    connections.close_all()
+
+
+def _render(hostname, port, path):
+    try:
+        response, content = render(hostname, path, secure=port == 443, page_cache=False)
+    except Exception:
+        logger.warning("Could not export %s%s", hostname, path, exc_info=True)
+        return path, 500, "", b""
+    return path, response.status_code, response.get("Content-Type", ""), content
+
+
+def export_path(path):
+    """Returns the file a URL path is written to, e.g. /a/b/ -> a/b/index.html."""
+    path = path.lstrip("/")
+    if not path or path.endswith("/"):
+        return path + "index.html"
+    return path
+
+
+def page_paths(page, site):
+    """Returns the paths to export for a page, including its routable routes."""
+    url = page.get_url(current_site=site)
+    if url is None or "://" in url:
+        return []
+    paths = [url]
+    specific = page.specific
+    if hasattr(specific, "get_articles"):
+        from article.models import ArticlePageTag
+
+        paths.append(url + "tags/")
+        tags = (
+            ArticlePageTag.objects.filter(content_object__in=specific.get_articles())
+            .values_list("tag__slug", flat=True)
+            .distinct()
+        )
+        paths.extend("{}tags/{}/".format(url, slug) for slug in tags)
+    return paths
+
+
+def site_paths(site):
+    paths = ["/sitemap.xml"]
+    for page in site.root_page.get_descendants(inclusive=True).live().public().specific():
+        paths.extend(page_paths(page, site))
+    return paths
+
+
+def page_tag_slugs(page):
+    """
+    Returns the slugs of the tags ``page`` has and had in its previous
+    revision. Archives of tags it lost no longer list it, and aren't found
+    through the live articles when no other article has the tag.
+    """
+    from article.models import ArticlePageTag
+
+    slugs = set(ArticlePageTag.objects.filter(content_object_id=page.pk).values_list("tag__slug", flat=True))
+    revision = page.live_revision or page.latest_revision
+    if revision is not None:
+        try:
+            previous = revision.get_previous()
+        except Revision.DoesNotExist:
+            previous = None
+        tags = getattr(previous.as_object(), "tags", None) if previous else None
+        if tags is not None:
+            slugs.update(tag.slug for tag in tags.all())
+    return slugs
+
+
+def affected_paths(page, site):
+    """
+    Returns the paths that change when ``page`` is published or unpublished:
+    the page, its ancestors (which list it), their tag archives, including
+    those of the tags it had before, and the sitemap.
+    """
+    paths = ["/sitemap.xml"]
+    url = page.get_url(current_site=site)
+    if url and "://" not in url:
+        # Included even when unpublished, so its file gets removed.
+        paths.append(url)
+    tag_slugs = None
+    for ancestor in page.get_ancestors(inclusive=True).live().public().specific():
+        if ancestor.is_descendant_of(site.root_page) or ancestor.pk == site.root_page_id:
+            paths.extend(page_paths(ancestor, site))
+            if hasattr(ancestor, "get_articles"):
+                if tag_slugs is None:
+                    tag_slugs = page_tag_slugs(page)
+                ancestor_url = ancestor.get_url(current_site=site)
+                paths.extend("{}tags/{}/".format(ancestor_url, slug) for slug in sorted(tag_slugs))
+    return paths
+
+
+class StaticExporter:
+    def __init__(self, output=None, workers=None, bucket=None, prefix=None):
+        self.output = output or settings.STATIC_EXPORT_ROOT
+        self.workers = workers or os.cpu_count()
+        self.bucket = bucket if bucket is not None else settings.STATIC_EXPORT_BUCKET
+        self.prefix = prefix if prefix is not None else settings.STATIC_EXPORT_PREFIX
+
+    def site_dir(self, site):
+        return os.path.join(self.output, site.hostname)
+
+    def render(self, site, paths):
+        """Renders ``paths`` in a process pool, yielding (path, status, content type, body)."""
+        paths = list(dict.fromkeys(paths))
+        if self.workers <= 1 or len(paths) < self.workers * 2:
+            for path in paths:
+                yield _render(site.hostname, site.port, path)
+            return
+        connections.close_all()
+        with ProcessPoolExecutor(self.workers, initializer=_init_worker) as pool:
+            yield from pool.map(
+                _render,
+                [site.hostname] * len(paths),
+                [site.port] * len(paths),
+                paths,
+                chunksize=8,
+            )
+
+    def load_manifest(self, site):
+        try:
+            with open(os.path.join(self.site_dir(site), MANIFEST_NAME)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def save_manifest(self, site, manifest):
+        path = os.path.join(self.site_dir(site), MANIFEST_NAME)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "w") as f:
+            json.dump(manifest, f, sort_keys=True)
+        os.replace(path + ".tmp", path)
+
+    def export(self, site, paths, full=False):
+        """
+        Renders and writes ``paths`` for ``site``. With ``full`` any file
+        that is no longer part of the site is removed. Returns a dict of
+        file name -> content type for the files that changed, a list of
+        removed file names and a dict of path -> status for the paths that
+        failed to render, whose files are left as they were.
+        """
+        manifest = self.load_manifest(site)
+        seen = set()
+        changed = {}
+        removed = []
+        failed = {}
+        for path, status, content_type, content in self.render(site, paths):
+            name = export_path(path)
+            if status in (404, 410) and name in manifest:
+                removed.append(name)
+                continue
+            if status >= 500:
+                failed[path] = status
+                seen.add(name)
+                continue
+            if status != 200:
+                continue
+            seen.add(name)
+            digest = hashlib.md5(content).hexdigest()
+            if manifest.get(name, {}).get("md5") == digest:
+                continue
+            file_path = os.path.join(self.site_dir(site), name)
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(file_path, "wb") as f:
+                f.write(content)
+            manifest[name] = {"md5": digest, "content_type": content_type}
+            changed[name] = content_type
+
+        if full:
+            removed.extend(name for name in manifest if name not in seen)
+        for name in removed:
+            del manifest[name]
+            try:
+                os.remove(os.path.join(self.site_dir(site), name))
+            except FileNotFoundError:
+                pass
+        self.save_manifest(site, manifest)
+        return changed, removed, failed
+
+    def upload(self, site, changed, removed):
+        if not self.bucket:
+            return
+        client = s3_client()
+        key_prefix = "{}{}/".format(self.prefix, site.hostname)
+        for name, content_type in changed.items():
+            with open(os.path.join(self.site_dir(site), name), "rb") as f:
+                client.put_object(
+                    Bucket=self.bucket,
+                    Key=key_prefix + name,
+                    Body=f,
+                    ContentType=content_type or mimetypes.guess_type(name)[0] or "text/html",
+                    CacheControl=settings.STATIC_EXPORT_CACHE_CONTROL,
+                    ACL=settings.AWS_DEFAULT_ACL,
+                )
+        for start in range(0, len(removed), 1000):
+            client.delete_objects(
+                Bucket=self.bucket,
+                Delete={"Objects": [{"Key": key_prefix + name} for name in removed[start:start + 1000]]},
+            )
+
+    def export_site(self, site, upload=True):
+        changed, removed, failed = self.export(site, site_paths(site), full=True)
+        if upload:
+            self.upload(site, changed, removed)
+        return changed, removed, failed
+
+    def export_page(self, page, upload=True):
+        """Returns hostname -> (changed, removed, failed) for each site of ``page``."""
+        results = {}
+        for site in Site.objects.select_related("root_page"):
+            if not page.is_descendant_of(site.root_page) and page.pk != site.root_page_id:
+                continue
+            changed, removed, failed = self.export(site, affected_paths(page, site))
+            if upload:
+                self.upload(site, changed, removed)
+            results[site.hostname] = changed, removed, failed
+        return results
+
+
+def s3_client():
+    import boto3
+
+    return boto3.client(
+        "s3",
+        aws_access_key_id=settings.AWS_S3_ACCESS_KEY_ID,
+        aws_secret_access_key=settings.AWS_S3_SECRET_ACCESS_KEY,
+        region_name=settings.AWS_S3_REGION_NAME,
+        endpoint_url=settings.AWS_S3_ENDPOINT_URL,
+    )
+
+
+def _export_page(page_id):
+    try:
+        results = StaticExporter(workers=1).export_page(Page.objects.get(pk=page_id))
+        for hostname, (changed, removed, failed) in results.items():
+            for path, status in failed.items():
+                logger.warning("Could not export %s%s: status %s", hostname, path, status)
+    finally:
+        # Close the connections this thread opened.
+        connections.close_all()
+
+
+def export_page_on_commit(page):
+    # Export once the publish has been committed, and off the request
+    # thread so the editor isn't kept waiting.
+    transaction.on_commit(
+        lambda: threading.Thread(target=_export_page, args=(page.pk,), daemon=True).start()
+    )
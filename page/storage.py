@@ -0,0 +1,201 @@
+"""
+S3 storage that avoids round trips on save and on url().
+
+Stock S3Boto3Storage with AWS_S3_FILE_OVERWRITE = False sends a HEAD per
+candidate name to find a free one, then uploads. Here every saved file gets
+a short hash of its contents in its name instead, so names can't collide
+and nothing is probed; two saves of identical content under the same name
+simply write the same object. Uploads and deletes go through one boto3
+client per process, which is thread-safe and keeps a connection pool, with
+large files sent as parallel multipart uploads. Objects are public-read,
+so URLs are plain strings built without signing; the files of restricted
+documents are made private afterwards, see page/documents.py.
+
+Since identical uploads share a name, and deduplicated images share their
+file too, a name is only deleted once no row refers to it any more, see
+``is_referenced``. ``FileSystemStorage`` applies the same check to the
+media directory used under DEBUG.
+
+Point AWS_S3_ENDPOINT_URL at MinIO or another S3 stand-in to run it locally.
+"""
+import functools
+import hashlib
+import os
+import threading
+
+from botocore.config import Config
+from boto3.s3.transfer import TransferConfig
+from django.apps import apps
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.base import File
+from django.core.files.storage import FileSystemStorage as BaseFileSystemStorage
+from django.db import models, router
+from django.utils.encoding import filepath_to_uri
+from storages.backends.s3boto3 import S3Boto3Storage
+from storages.utils import clean_name, setting
+
+HASH_LENGTH = 12
+HASH_READ_SIZE = 64 * 1024
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def content_hash(content):
+    hasher = hashlib.sha1()
+    content.seek(0)
+    for chunk in content.chunks(HASH_READ_SIZE):
+        hasher.update(chunk if isinstance(chunk, bytes) else chunk.encode())
+    content.seek(0)
+    return hasher.hexdigest()[:HASH_LENGTH]
+
+
+@functools.lru_cache(maxsize=None)
+def file_fields():
+    return [
+        (model, field)
+        for model in apps.get_models()
+        for field in model._meta.concrete_fields
+        if isinstance(field, models.FileField)
+    ]
+
+
+def is_referenced(name):
+    """
+    Returns whether any row still stores ``name`` in a file field. Files
+    are deleted after their row is deleted or given a new file, e.g. by
+    wagtail's image form on a new upload, so only other rows are left.
+    Asks the primary, which a replica may not have caught up with.
+    """
+    return any(
+        model._base_manager.using(router.db_for_write(model)).filter(**{field.name: name}).exists()
+        for model, field in file_fields()
+    )
+
+
+class FileSystemStorage(BaseFileSystemStorage):
+    def delete(self, name):
+        if is_referenced(name):
+            return
+        super().delete(name)
+
+    def set_public(self, name, public):
+        # Documents on local disk are always sent by wagtail's serve view,
+        # which checks view restrictions itself.
+        pass
+
+
+class HashedS3Storage(S3Boto3Storage):
+    # Objects are uploaded public-read, so URLs don't need signing.
+    querystring_auth = False
+
+    def __init__(self, **settings):
+        super().__init__(**settings)
+        self.transfer_config = TransferConfig(
+            multipart_threshold=setting("AWS_S3_MULTIPART_THRESHOLD", 16 * 1024 * 1024),
+            multipart_chunksize=setting("AWS_S3_MULTIPART_CHUNKSIZE", 8 * 1024 * 1024),
+            max_concurrency=setting("AWS_S3_MAX_CONCURRENCY", 4),
+        )
+
+    @property
+    def client(self):
+        # Keyed by pid: a client inherited over uWSGI's fork shares its
+        # connection pool with the parent.
+        key = (os.getpid(), self.bucket_name, self.endpoint_url)
+        client = _clients.get(key)
+        if client is None:
+            with _clients_lock:
+                client = _clients.get(key)
+                if client is None:
+                    config = Config(max_pool_connections=setting("AWS_S3_MAX_POOL_CONNECTIONS", 20))
+                    if self.client_config:
+                        config = self.client_config.merge(config)
+                    client = _clients[key] = self._create_session().client(
+                        "s3",
+                        region_name=self.region_name,
+                        use_ssl=self.use_ssl,
+                        endpoint_url=self.endpoint_url,
+                        config=config,
+                        verify=self.verify,
+                    )
+        return client
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+        return super().save(self.hashed_name(name, content, max_length), content, max_length)
+
+    def hashed_name(self, name, content, max_length=None):
+        dir_name, file_name = os.path.split(name)
+        root, ext = os.path.splitext(file_name)
+        digest = content_hash(content)
+        if root.endswith("." + digest):
+            return name
+        suffix = ".{}{}".format(digest, ext)
+        if max_length is not None:
+            # Shorten the original name rather than cutting into the hash.
+            available = max_length - len(suffix) - (len(dir_name) + 1 if dir_name else 0)
+            if available < 1:
+                raise SuspiciousFileOperation(
+                    'Storage can not find an available filename for "{}".'.format(name)
+                )
+            root = root[:available]
+        return os.path.join(dir_name, root + suffix)
+
+    def get_available_name(self, name, max_length=None):
+        # Names are content addressed, see hashed_name.
+        return clean_name(name)
+
+    def _save(self, name, content):
+        cleaned_name = clean_name(name)
+        key = self._normalize_name(cleaned_name)
+        params = self._get_write_parameters(key, content)
+        content.seek(0)
+        # s3transfer closes the file it's given, but Django still needs it.
+        original_close = content.close
+        content.close = lambda: None
+        try:
+            self.client.upload_fileobj(
+                content, self.bucket_name, key, ExtraArgs=params, Config=self.transfer_config
+            )
+        finally:
+            content.close = original_close
+        return cleaned_name
+
+    def delete(self, name):
+        if is_referenced(name):
+            return
+        self.client.delete_object(Bucket=self.bucket_name, Key=self._normalize_name(clean_name(name)))
+
+    def set_public(self, name, public):
+        """Makes ``name`` public-read or private."""
+        self.client.put_object_acl(
+            Bucket=self.bucket_name,
+            Key=self._normalize_name(clean_name(name)),
+            ACL="public-read" if public else "private",
+        )
+
+    def url(self, name, parameters=None, expire=None, http_method=None):
+        if self.custom_domain or parameters or self.querystring_auth:
+            return super().url(name, parameters, expire, http_method)
+        return self.url_prefix + filepath_to_uri(self._normalize_name(clean_name(name)))
+
+    def signed_url(self, name, expire=None, parameters=None):
+        """A URL for ``name`` that is only valid for ``expire`` seconds."""
+        params = dict(parameters or {}, Bucket=self.bucket_name, Key=self._normalize_name(clean_name(name)))
+        return self.client.generate_presigned_url(
+            "get_object", Params=params, ExpiresIn=expire or self.querystring_expire
+        )
+
+    @property
+    def url_prefix(self):
+        # Let botocore work out the addressing style once, then reuse it.
+        prefix = getattr(self, "_url_prefix", None)
+        if prefix is None:
+            url = self.unsigned_connection.meta.client.generate_presigned_url(
+                "get_object", Params={"Bucket": self.bucket_name, "Key": "key"}
+            )
+            prefix = self._url_prefix = url.split("?")[0][:-len("key")]
+        return prefix
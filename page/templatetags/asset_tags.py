@@ -0,0 +1,44 @@
+import functools
+import os
+
+from django import template
+from django.conf import settings
+from django.contrib.staticfiles import finders
+
+
+register = template.Library()
+
+# Loaded on every page, in this order
+STYLESHEETS = ["vendor/bootstrap/css/bootstrap.min.css", "css/base.min.css"]
+
+# Without critical CSS these still block rendering, so the page isn't laid
+# out unstyled first. The others are loaded asynchronously either way.
+BLOCKING_STYLESHEETS = ["vendor/bootstrap/css/bootstrap.min.css"]
+
+
+@functools.lru_cache(maxsize=None)
+def _read_critical_css(name):
+    path = finders.find("css/critical/{}.css".format(name))
+    if not path:
+        return ""
+    with open(path) as f:
+        return f.read()
+
+
+def critical_css(name):
+    if settings.DEBUG:
+        _read_critical_css.cache_clear()
+    return _read_critical_css(name)
+
+
+# Inlines the critical CSS extracted by `grunt critical` for the template
+# being rendered and loads the full stylesheets without blocking rendering.
+# Templates without critical CSS block on Bootstrap only.
+@register.inclusion_tag('tags/stylesheets.html', takes_context=True)
+def stylesheets(context):
+    name = os.path.splitext(os.path.basename(context.template.name or ''))[0]
+    return {
+        'critical_css': critical_css(name) if name else '',
+        'stylesheets': STYLESHEETS,
+        'blocking_stylesheets': BLOCKING_STYLESHEETS,
+    }
@@ -0,0 +1,43 @@
+from django import template
+
+from page.edge_cache import add_surrogate_keys, instance_key
+from page.renditions import placeholder_data_uri, webp_filter_spec
+
+
+register = template.Library()
+
+
+# Renders an image as a <picture> with a webp source and a fallback <img>,
+# both sized from their renditions so the layout doesn't shift. Images load
+# lazily unless loading="eager" is passed. The first hero=True image on a
+# request is the likely largest contentful paint and is fetched eagerly at
+# high priority instead.
+@register.inclusion_tag('tags/picture.html', takes_context=True)
+def picture(context, image, filter_spec, css_class='', alt=None, hero=False,
+            loading='lazy', placeholder=False):
+    if not image:
+        return {'image': None}
+
+    webp_spec = webp_filter_spec(filter_spec)
+    renditions = image.get_renditions(filter_spec, webp_spec)
+    fallback = renditions[filter_spec]
+    # A spec with its own format- operation gets no webp source.
+    webp = renditions[webp_spec] if webp_spec != filter_spec else None
+
+    priority = False
+    request = context.get('request')
+    add_surrogate_keys(request, instance_key(image))
+    if hero and request is not None and not getattr(request, 'hero_rendered', False):
+        request.hero_rendered = True
+        priority = True
+
+    return {
+        'image': image,
+        'webp': webp,
+        'fallback': fallback,
+        'css_class': css_class,
+        'alt': fallback.alt if alt is None else alt,
+        'priority': priority,
+        'loading': loading,
+        'placeholder': placeholder_data_uri(image) if placeholder else '',
+    }
@@ -3,6 +3,11 @@ from django import template
 
 from wagtail.models import Page, Site
 
+from page.cache import get_or_compute, namespace_key
+from page.edge_cache import add_surrogate_keys
+
+MENU_CACHE_TIMEOUT = 60 * 15
+
 
 register = template.Library()
 # https://docs.djangoproject.com/en/3.2/howto/custom-template-tags/
@@ -33,14 +38,30 @@ def is_active(page, current_page):
     return (current_page.url_path.startswith(page.url_path) if current_page else False)
 
 
+def menu_tree(parent):
+    # The menu is the same on every page, so build it once and share it
+    # through the cache. Publishing, moving or deleting a page bumps the
+    # "navigation" namespace.
+    def build():
+        menuitems = list(parent.get_children().live().in_menu())
+        for menuitem in menuitems:
+            menuitem.children = list(menuitem.get_children().live().in_menu())
+            menuitem.show_dropdown = bool(menuitem.children)
+            for child in menuitem.children:
+                child.has_dropdown = has_menu_children(child)
+        return menuitems
+
+    return get_or_compute(namespace_key("navigation", "menu:{}".format(parent.pk)), build, MENU_CACHE_TIMEOUT)
+
+
 # Retrieves the top menu items - the immediate children of the parent page
 # The has_menu_children method is necessary because the Foundation menu requires
 # a dropdown class to be applied to a parent
 @register.inclusion_tag('tags/top_menu.html', takes_context=True)
 def top_menu(context, parent, calling_page=None):
-    menuitems = parent.get_children().live().in_menu()
+    menuitems = menu_tree(parent)
+    add_surrogate_keys(context['request'], 'navigation')
     for menuitem in menuitems:
-        menuitem.show_dropdown = has_menu_children(menuitem)
         # We don't directly check if calling_page is None since the template
         # engine can pass an empty string to calling_page
         # if the variable passed as calling_page does not exist.
@@ -57,19 +78,22 @@ def top_menu(context, parent, calling_page=None):
 # Retrieves the children of the top menu items for the drop downs
 @register.inclusion_tag('tags/top_menu_children.html', takes_context=True)
 def top_menu_children(context, parent, calling_page=None):
-    menuitems_children = parent.get_children()
-    menuitems_children = menuitems_children.live().in_menu()
+    # Items from menu_tree() already carry their children
+    menuitems_children = getattr(parent, 'children', None)
+    if menuitems_children is None:
+        menuitems_children = parent.get_children()
+        menuitems_children = menuitems_children.live().in_menu()
+        for menuitem in menuitems_children:
+            menuitem.has_dropdown = has_menu_children(menuitem)
     for menuitem in menuitems_children:
-        menuitem.has_dropdown = has_menu_children(menuitem)
         # We don't directly check if calling_page is None since the template
         # engine can pass an empty string to calling_page
         # if the variable passed as calling_page does not exist.
         menuitem.active = (calling_page.url_path.startswith(menuitem.url_path)
                            if calling_page else False)
-        menuitem.children = menuitem.get_children().live().in_menu()
     return {
         'parent': parent,
         'menuitems_children': menuitems_children,
         # required by the pageurl tag that we want to use within this template
         'request': context['request'],
-    }
\ No newline at end of file
+    }
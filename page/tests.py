@@ -1,3 +1,820 @@
-from django.test import TestCase
+import io
+import os
+import shutil
+import tempfile
+import time
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings as django_settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.exceptions import ImproperlyConfigured, SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from wagtail.contrib.redirects.models import Redirect
+from wagtail.documents import get_document_model
+from wagtail.documents.models import document_served
+from wagtail.images import get_image_model
+from wagtail.images.forms import get_image_form
+from wagtail.images.tests.utils import get_test_image_file
+from wagtail.models import Collection, CollectionViewRestriction, Page, Site
+
+from article.models import ArticlePage
+from article.tests import MediaRootMixin
+
+from . import edge_cache, errors, metrics
+from .asgi_static import StaticFilesApplication
+from .cache import (
+    NAMESPACE_BUMPED_KEY, PAGE_CONTENT_NAMESPACES, TieredCache, bump_namespace, namespace_key, namespace_version,
+    require_shared_cache,
+)
+from .db.routers import ReplicaRouter, achoose_replica, choose_replica, reset_replica, use_replica
+from .edge_cache import add_edge_cache_headers
+from .middleware import anonymous_middleware, replica_middleware
+from .models import StandardPage
+from .redirects import find_redirect
+from .static_export import StaticExporter
+from .storage import HashedS3Storage, content_hash
+from .templatetags.navigation_tags import menu_tree
+from .text import stream_text_stats
+
+
+class SiteMixin:
+    """
+    Serves a home page and one child page as the default site, on the
+    host name the test client uses.
+    """
+
+    def setUp(self):
+        super().setUp()
+        # Without collectstatic there is no manifest to look names up in.
+        settings = override_settings(STORAGES=dict(django_settings.STORAGES, staticfiles={
+            "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+        }))
+        settings.enable()
+        self.addCleanup(settings.disable)
+        root = Page.objects.get(depth=1)
+        self.home = root.add_child(instance=StandardPage(title="Home", slug="home-tests"))
+        self.about = self.home.add_child(instance=StandardPage(title="About", slug="about"))
+        site = Site.objects.get(is_default_site=True)
+        site.hostname = "testserver"
+        site.root_page = self.home
+        site.save()
+        self.site = site
+        # The cache outlives each test's transaction.
+        bump_namespace(*PAGE_CONTENT_NAMESPACES)
+        # Error pages refresh their snapshot in a thread, outside the test's
+        # transaction.
+        patcher = mock.patch("page.errors._refresh_in_background")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class StreamTextStatsTests(SimpleTestCase):
+    def stream(self, data):
+        stream_block = ArticlePage._meta.get_field("body").stream_block
+        return stream_block.to_python([{"type": block_type, "value": value} for block_type, value in data])
+
+    def test_counts_words_and_excerpts_prose(self):
+        body = self.stream([
+            ("heading_block", {"heading_text": "A heading", "size": "h2", "alignment": "start"}),
+            ("paragraph_block", "<p>One two</p><p>three &amp; four</p>"),
+            ("code_block", {"code": {"language": "python", "code": "print(1)"}}),
+        ])
+        words, reading_time, excerpt = stream_text_stats(body)
+        self.assertEqual(words, 8)
+        self.assertEqual(reading_time, 1)
+        self.assertEqual(excerpt, "One two three & four")
+
+    def test_reading_time_rounds_up(self):
+        body = self.stream([("paragraph_block", "<p>{}</p>".format("word " * 231))])
+        words, reading_time, excerpt = stream_text_stats(body)
+        self.assertEqual(words, 231)
+        self.assertEqual(reading_time, 2)
+        self.assertLessEqual(len(excerpt), 300)
+
+    def test_empty_body(self):
+        self.assertEqual(stream_text_stats(self.stream([])), (0, 0, ""))
+
+
+class HashedS3StorageTests(TestCase):
+    def setUp(self):
+        self.storage = HashedS3Storage(bucket_name="test")
+        self.content = ContentFile(b"hello")
+        self.digest = content_hash(self.content)
+
+    def test_hash_is_added_before_the_extension(self):
+        name = self.storage.hashed_name("images/photo.jpg", self.content)
+        self.assertEqual(name, "images/photo.{}.jpg".format(self.digest))
+
+    def test_hashed_names_are_left_alone(self):
+        name = "images/photo.{}.jpg".format(self.digest)
+        self.assertEqual(self.storage.hashed_name(name, self.content), name)
+
+    def test_long_names_are_truncated_before_the_hash(self):
+        name = self.storage.hashed_name("images/" + "a" * 100 + ".jpg", self.content, max_length=40)
+        self.assertEqual(len(name), 40)
+        self.assertTrue(name.endswith(".{}.jpg".format(self.digest)))
+        self.assertTrue(name.startswith("images/aaa"))
+
+    def test_no_room_for_the_name_raises(self):
+        with self.assertRaises(SuspiciousFileOperation):
+            self.storage.hashed_name("images/photo.jpg", self.content, max_length=20)
+
+    def test_delete_skips_names_other_rows_refer_to(self):
+        name = "documents/report.{}.pdf".format(self.digest)
+        document = get_document_model().objects.create(title="report", file=name)
+        with mock.patch.object(HashedS3Storage, "client", new_callable=mock.PropertyMock) as client:
+            self.storage.delete(name)
+            client.return_value.delete_object.assert_not_called()
+            document.delete()
+            self.storage.delete(name)
+            client.return_value.delete_object.assert_called_once_with(Bucket="test", Key=name)
+
+
+@override_settings(
+    STORAGES={
+        "default": {"BACKEND": "page.storage.HashedS3Storage"},
+        "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+    },
+    AWS_STORAGE_BUCKET_NAME="test",
+    AWS_S3_ENDPOINT_URL="http://s3.test",
+    DOCUMENT_ACCEL_REDIRECT=None,
+)
+class DocumentServeTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(HashedS3Storage, "client", new_callable=mock.PropertyMock)
+        self.client_mock = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.client_mock.generate_presigned_url.return_value = "http://s3.test/test/signed"
+        self.collection = Collection.get_first_root_node().add_child(name="Private")
+        Document = get_document_model()
+        self.public = Document.objects.create(title="public", file="documents/public.pdf")
+        self.private = Document.objects.create(
+            title="private", file="documents/private.pdf", collection=self.collection
+        )
+        self.restriction = CollectionViewRestriction.objects.create(
+            collection=self.collection, restriction_type=CollectionViewRestriction.LOGIN
+        )
+
+    def test_public_documents_are_redirected_to_storage_from_the_cache(self):
+        url = self.public.url
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertRedirects(response, "http://s3.test/test/documents/public.pdf", fetch_redirect_response=False)
+
+    def test_wrong_filename_is_not_found(self):
+        response = self.client.get("/documents/{}/other.pdf".format(self.public.pk))
+        self.assertEqual(response.status_code, 404)
+
+    def test_document_served_is_sent(self):
+        received = []
+
+        def receiver(instance, request, **kwargs):
+            received.append(instance)
+
+        document_served.connect(receiver)
+        self.addCleanup(document_served.disconnect, receiver)
+        self.client.get(self.public.url)
+        self.assertEqual([(d.pk, d.title) for d in received], [(self.public.pk, "public")])
+
+    def test_restricted_documents_need_a_login(self):
+        response = self.client.get(self.private.url)
+        self.assertEqual(response.status_code, 302)
+        self.assertIn("login", response["Location"])
+        self.client_mock.generate_presigned_url.assert_not_called()
+
+    def test_restricted_documents_are_redirected_to_a_signed_url(self):
+        user = get_user_model().objects.create_user("reader", password="password")
+        self.client.force_login(user)
+        response = self.client.get(self.private.url)
+        self.assertRedirects(response, "http://s3.test/test/signed", fetch_redirect_response=False)
+        params = self.client_mock.generate_presigned_url.call_args.kwargs["Params"]
+        self.assertEqual(params["Key"], "documents/private.pdf")
+
+    @override_settings(DOCUMENT_ACCEL_REDIRECT="/protected/")
+    def test_accel_redirect(self):
+        response = self.client.get(self.public.url)
+        self.assertEqual(response["X-Accel-Redirect"], "/protected/documents/public.pdf")
+        self.assertEqual(response["Content-Type"], "application/pdf")
+
+    def acls(self):
+        return {
+            call.kwargs["Key"]: call.kwargs["ACL"]
+            for call in self.client_mock.put_object_acl.call_args_list
+        }
+
+    def test_restricted_files_are_private(self):
+        Document = get_document_model()
+        with self.captureOnCommitCallbacks(execute=True):
+            Document.objects.create(title="new", file="documents/new.pdf", collection=self.collection)
+        self.assertEqual(self.acls(), {"documents/new.pdf": "private"})
+
+    def test_files_are_public_again_when_the_restriction_goes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.restriction.delete()
+        self.assertEqual(self.acls(), {"documents/private.pdf": "public-read"})
+
+    def test_files_shared_with_a_public_document_stay_public(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            get_document_model().objects.create(title="copy", file="documents/private.pdf")
+            self.restriction.save()
+        self.assertEqual(self.acls(), {"documents/private.pdf": "public-read"})
+
+
+class SharedImageFileTests(MediaRootMixin, TestCase):
+    def replace_file(self, image, colour):
+        form = get_image_form(get_image_model())(
+            {"title": image.title, "collection": image.collection_id},
+            {"file": SimpleUploadedFile("new.png", get_test_image_file(colour=colour).file.getvalue())},
+            instance=image,
+        )
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+
+    def test_replacing_a_file_keeps_it_while_a_duplicate_uses_it(self):
+        Image = get_image_model()
+        first = Image.objects.create(title="first", file=get_test_image_file())
+        second = Image.objects.create(title="second", file=get_test_image_file())
+        shared = first.file.name
+        self.assertEqual(second.file.name, shared)
+
+        self.replace_file(first, "black")
+        self.assertTrue(default_storage.exists(shared))
+        self.replace_file(second, "red")
+        self.assertFalse(default_storage.exists(shared))
+
+    @override_settings(WAGTAILIMAGES_DEDUPLICATE_UPLOADS=False)
+    def test_dedupe_images_keeps_files_the_original_uses(self):
+        Image = get_image_model()
+        original = Image.objects.create(title="original", file=get_test_image_file())
+        duplicate = Image.objects.create(title="duplicate", file=get_test_image_file())
+        rendition = original.get_rendition("width-100")
+        # As with content-hashed storage, the duplicate's rendition shares
+        # the original's file.
+        duplicate.get_rendition("width-100")
+        duplicate.renditions.update(file=rendition.file.name)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("dedupe_images", stdout=io.StringIO())
+
+        self.assertFalse(Image.objects.filter(pk=duplicate.pk).exists())
+        self.assertFalse(default_storage.exists(duplicate.file.name))
+        self.assertTrue(default_storage.exists(original.file.name))
+        self.assertTrue(default_storage.exists(rendition.file.name))
+
+
+class StaticExportTests(SiteMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.output = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output)
+        self.exporter = StaticExporter(output=self.output, workers=1, bucket="")
+
+    def read(self, name):
+        with open(os.path.join(self.output, "testserver", name), "rb") as f:
+            return f.read()
+
+    def test_export_site_writes_pages_and_sitemap(self):
+        changed, removed, failed = self.exporter.export_site(self.site)
+        self.assertEqual(set(changed), {"index.html", "about/index.html", "sitemap.xml"})
+        self.assertEqual((removed, failed), ([], {}))
+        self.assertIn(b"About", self.read("about/index.html"))
+        self.assertIn(b"http://testserver/about/", self.read("sitemap.xml"))
+
+        changed, removed, failed = self.exporter.export_site(self.site)
+        self.assertEqual(changed, {})
+
+    @override_settings(PAGE_CACHE_TIMEOUT=60)
+    def test_export_bypasses_the_page_cache(self):
+        before = metrics.counter_values("page_cache_requests_total")
+        self.exporter.export_site(self.site)
+        self.assertEqual(metrics.counter_values("page_cache_requests_total"), before)
+
+    def test_failed_pages_are_recorded_and_keep_their_file(self):
+        self.exporter.export_site(self.site)
+        exported = self.read("about/index.html")
+
+        def serve(page, request, *args, **kwargs):
+            if page.pk == self.about.pk:
+                raise RuntimeError("broken")
+            return original_serve(page, request, *args, **kwargs)
+
+        original_serve = StandardPage.serve
+        with mock.patch.object(StandardPage, "serve", serve), self.assertLogs("django.request", "ERROR"):
+            changed, removed, failed = self.exporter.export_site(self.site)
+        self.assertEqual(failed, {"/about/": 500})
+        self.assertEqual(removed, [])
+        self.assertEqual(self.read("about/index.html"), exported)
+
+    def test_unpublished_pages_are_removed(self):
+        self.exporter.export_site(self.site)
+        self.about.unpublish()
+        changed, removed, failed = self.exporter.export_page(self.about, upload=False)["testserver"]
+        self.assertEqual(removed, ["about/index.html"])
+        self.assertFalse(os.path.exists(os.path.join(self.output, "testserver", "about/index.html")))
+
+
+@override_settings(PAGE_CACHE_TIMEOUT=60)
+class PageCacheMiddlewareTests(SiteMixin, TestCase):
+    def page_cache_requests(self):
+        counts = metrics.counter_values("page_cache_requests_total")
+        return counts.get((("result", "hit"),), 0), counts.get((("result", "miss"),), 0)
+
+    def test_anonymous_pages_are_served_from_the_cache(self):
+        hits, misses = self.page_cache_requests()
+        self.assertContains(self.client.get("/about/"), "About")
+        self.assertEqual(self.page_cache_requests(), (hits, misses + 1))
+        self.assertContains(self.client.get("/about/"), "About")
+        self.assertEqual(self.page_cache_requests(), (hits + 1, misses + 1))
+
+    def test_requests_with_a_session_skip_the_cache(self):
+        before = self.page_cache_requests()
+        self.client.cookies["sessionid"] = "x"
+        self.client.get("/about/")
+        self.assertEqual(self.page_cache_requests(), before)
+
+    def test_publishing_invalidates_cached_pages(self):
+        self.client.get("/about/")
+        self.about.title = "About us"
+        self.about.save_revision().publish()
+        self.assertContains(self.client.get("/about/"), "About us")
+
+    def test_query_parameters_share_the_cached_page(self):
+        self.client.get("/about/?utm_source=a")
+        hits, misses = self.page_cache_requests()
+        self.client.get("/about/?utm_source=b&fbclid=c")
+        self.assertEqual(self.page_cache_requests(), (hits + 1, misses))
+
+    def test_parameters_pages_read_skip_the_cache(self):
+        before = self.page_cache_requests()
+        self.client.get("/about/?missing_tag=x")
+        self.assertEqual(self.page_cache_requests(), before)
+
+
+@override_settings(PAGE_CACHE_TIMEOUT=0, EDGE_CACHE_CONTROL={
+    "default": "public, max-age=1",
+    "page.standardpage": "public, max-age=2, s-maxage=3",
+})
+class EdgeCacheHeaderTests(SiteMixin, TestCase):
+    def test_pages_get_their_policy_and_surrogate_keys(self):
+        response = self.client.get("/about/")
+        self.assertEqual(response["Cache-Control"], "public, max-age=2, s-maxage=3")
+        keys = response["Surrogate-Key"].split()
+        for key in ("page-{}".format(self.about.pk), "tree-{}".format(self.about.pk), "tree-{}".format(self.home.pk)):
+            self.assertIn(key, keys)
+
+    def test_private_responses_get_no_edge_headers(self):
+        self.client.force_login(get_user_model().objects.create_user("reader", password="password"))
+        response = self.client.get("/about/")
+        self.assertNotIn("Surrogate-Key", response)
+        self.assertNotIn("s-maxage", response.get("Cache-Control", ""))
+
+    def test_responses_setting_cookies_are_left_alone(self):
+        request = RequestFactory().get("/about/")
+        response = HttpResponse()
+        response.set_cookie("csrftoken", "x")
+        add_edge_cache_headers(request, response)
+        self.assertFalse(response.has_header("Cache-Control"))
+
+
+class RecordingBackend(edge_cache.BaseBackend):
+    batches = []
+
+    def purge(self, keys):
+        if "broken" in keys:
+            raise OSError("purge failed")
+        self.batches.append(list(keys))
+
+
+@override_settings(EDGE_PURGE={"BACKEND": "page.tests.RecordingBackend", "BATCH_SIZE": 2})
+class EdgePurgeTests(TestCase):
+    def setUp(self):
+        RecordingBackend.batches = []
+        patcher = mock.patch.multiple(edge_cache, _backend=None, PURGE_DELAY=0.1)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def wait_for_dispatch(self):
+        dispatcher = edge_cache._dispatcher
+        if dispatcher is not None:
+            dispatcher.join()
+
+    def test_keys_are_sent_in_batches(self):
+        edge_cache.send_purge(["a", "b", "c"])
+        self.assertEqual(RecordingBackend.batches, [["a", "b"], ["c"]])
+
+    def test_a_failed_batch_does_not_stop_the_rest(self):
+        errors = metrics.counter_values("edge_purges_total").get((("result", "error"),), 0)
+        with self.assertLogs("page.edge_cache", "WARNING"):
+            edge_cache.send_purge(["broken", "b", "c"])
+        self.assertEqual(RecordingBackend.batches, [["c"]])
+        self.assertEqual(metrics.counter_values("edge_purges_total")[(("result", "error"),)], errors + 1)
+
+    def test_purges_wait_for_the_commit_and_are_merged(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            edge_cache.purge("page-1", "navigation")
+            edge_cache.purge("page-1", "page-2")
+            self.assertEqual(RecordingBackend.batches, [])
+        self.wait_for_dispatch()
+        self.assertEqual(RecordingBackend.batches, [["navigation", "page-1"], ["page-2"]])
+
+    def test_rolled_back_purges_are_not_sent(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            edge_cache.purge("page-1")
+        self.wait_for_dispatch()
+        self.assertEqual(RecordingBackend.batches, [])
+
+
+@override_settings(PAGE_CACHE_TIMEOUT=0)
+class AnonymousMiddlewareTests(SiteMixin, TestCase):
+    def shareable(self, request, response):
+        return anonymous_middleware(lambda request: response)(request)
+
+    def test_anonymous_pages_do_not_vary_on_cookie(self):
+        response = self.client.get("/about/")
+        self.assertNotIn("cookie", response.get("Vary", "").lower())
+        self.assertNotIn("private", response.get("Cache-Control", ""))
+
+    def test_logged_in_pages_still_vary_on_cookie(self):
+        self.client.force_login(get_user_model().objects.create_user("reader", password="password"))
+        response = self.client.get("/about/")
+        self.assertIn("Cookie", response["Vary"])
+
+    def test_other_vary_headers_are_kept(self):
+        response = HttpResponse()
+        response["Vary"] = "Cookie, Accept-Encoding"
+        response = self.shareable(RequestFactory().get("/about/"), response)
+        self.assertEqual(response["Vary"], "Accept-Encoding")
+
+    def test_responses_setting_a_cookie_are_private(self):
+        response = HttpResponse()
+        response["Vary"] = "Cookie"
+        response.set_cookie("csrftoken", "x")
+        response = self.shareable(RequestFactory().get("/about/"), response)
+        self.assertEqual(response["Vary"], "Cookie")
+        self.assertIn("private", response["Cache-Control"])
+
+    def test_non_anonymous_requests_are_left_alone(self):
+        for request in (
+            RequestFactory().post("/about/"),
+            RequestFactory().get("/admin/"),
+            RequestFactory(HTTP_COOKIE="sessionid=x").get("/about/"),
+        ):
+            response = HttpResponse()
+            response["Vary"] = "Cookie"
+            self.assertEqual(self.shareable(request, response)["Vary"], "Cookie")
+
+
+@mock.patch("page.db.routers.replica_aliases", return_value=["replica_0"])
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        cache.delete(NAMESPACE_BUMPED_KEY)
+
+    def test_reads_go_to_the_chosen_replica_until_a_write(self, aliases):
+        self.assertEqual(self.router.db_for_read(Page), "default")
+        token = use_replica("replica_0")
+        try:
+            self.assertEqual(self.router.db_for_read(Page), "replica_0")
+            self.assertEqual(self.router.db_for_write(Page), "default")
+            self.assertEqual(self.router.db_for_read(Page), "default")
+        finally:
+            reset_replica(token)
+        self.assertEqual(self.router.db_for_read(Page), "default")
+
+    def test_only_the_primary_is_migrated(self, aliases):
+        self.assertTrue(self.router.allow_migrate("default", "page"))
+        self.assertFalse(self.router.allow_migrate("replica_0", "page"))
+
+    def test_replicas_are_skipped_right_after_a_bump(self, aliases):
+        self.assertEqual(choose_replica(), "replica_0")
+        self.assertEqual(async_to_sync(achoose_replica)(), "replica_0")
+        bump_namespace("page")
+        self.assertIsNone(choose_replica())
+        self.assertIsNone(async_to_sync(achoose_replica)())
+        with override_settings(DATABASE_REPLICA_PIN_SECONDS=0):
+            self.assertEqual(choose_replica(), "replica_0")
+
+    def test_without_replicas_everything_uses_the_primary(self, aliases):
+        aliases.return_value = []
+        self.assertIsNone(choose_replica())
+
+    def test_only_anonymous_requests_use_a_replica(self, aliases):
+        middleware = replica_middleware(lambda request: HttpResponse(self.router.db_for_read(Page)))
+        self.assertEqual(middleware(RequestFactory().get("/about/")).content, b"replica_0")
+        self.assertEqual(middleware(RequestFactory().post("/about/")).content, b"default")
+        self.assertEqual(middleware(RequestFactory(HTTP_COOKIE="sessionid=x").get("/about/")).content, b"default")
+        self.assertEqual(self.router.db_for_read(Page), "default")
+
+
+class StaticFilesApplicationTests(SimpleTestCase):
+    def setUp(self):
+        static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, static_root)
+        # Files come from the finders, as nothing is collected.
+        settings = override_settings(
+            STATIC_ROOT=static_root,
+            STORAGES=dict(django_settings.STORAGES, staticfiles={
+                "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+            }),
+            WHITENOISE_USE_FINDERS=True,
+            WHITENOISE_AUTOREFRESH=False,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.app_calls = []
+
+        async def app(scope, receive, send):
+            self.app_calls.append(scope["path"])
+
+        self.application = StaticFilesApplication(app)
+
+    def request(self, path, method="GET", headers=()):
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {"type": "http", "method": method, "path": path, "headers": list(headers)}
+        async_to_sync(self.application)(scope, None, send)
+        return messages
+
+    def test_static_files_are_served_without_django(self):
+        messages = self.request("/static/css/base.min.css")
+        self.assertEqual(messages[0]["status"], 200)
+        self.assertIn((b"content-type", b"text/css; charset=\"utf-8\""), messages[0]["headers"])
+        with open("static/css/base.min.css", "rb") as f:
+            self.assertEqual(b"".join(m["body"] for m in messages[1:]), f.read())
+        self.assertFalse(messages[-1].get("more_body"))
+        self.assertEqual(self.app_calls, [])
+
+    def test_head_requests_get_no_body(self):
+        messages = self.request("/static/css/base.min.css", method="HEAD")
+        self.assertEqual(messages[0]["status"], 200)
+        self.assertEqual(messages[1]["body"], b"")
+
+    def test_other_requests_go_to_django(self):
+        self.assertEqual(self.request("/about/"), [])
+        self.assertEqual(self.app_calls, ["/about/"])
+
+
+@override_settings(STORAGES={
+    "default": {"BACKEND": "page.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+})
+class StylesheetsTagTests(SimpleTestCase):
+    def render(self, critical_css):
+        with mock.patch("page.templatetags.asset_tags.critical_css", return_value=critical_css):
+            return Template("{% load asset_tags %}{% stylesheets %}", name="standard_page.html").render(Context())
+
+    def test_without_critical_css_only_bootstrap_blocks(self):
+        html = self.render("")
+        self.assertInHTML('<link rel="stylesheet" type="text/css" href="/static/vendor/bootstrap/css/bootstrap.min.css">', html)
+        self.assertInHTML(
+            '<link rel="stylesheet" type="text/css" href="/static/css/base.min.css" media="none" onload="media=\'all\'">',
+            html,
+        )
+        self.assertNotIn("<style>", html)
+
+    def test_critical_css_is_inlined_and_stylesheets_preloaded(self):
+        html = self.render("body{margin:0}")
+        self.assertIn("<style>body{margin:0}</style>", html)
+        self.assertEqual(html.count('rel="preload"'), 2)
+        self.assertNotIn('media="none"', html)
+
+
+@override_settings(CACHES={
+    "default": {"BACKEND": "page.cache.TieredCache", "OPTIONS": {"SHARED": "shared", "LOCAL_TIMEOUT": 60}},
+    "shared": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "tiered-tests"},
+})
+class TieredCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = caches["default"]
+        self.shared = caches["shared"]
+        self.cache.clear()
+
+    def test_local_tier_serves_values_until_deleted(self):
+        self.cache.set("key", "value")
+        self.shared.set("key", "changed elsewhere")
+        self.assertEqual(self.cache.get("key"), "value")
+        self.cache.delete("key")
+        self.assertIsNone(self.cache.get("key"))
+        self.assertIsNone(self.shared.get("key"))
+
+    def test_shared_hits_are_copied_locally(self):
+        self.shared.set("key", "value")
+        self.assertEqual(self.cache.get("key"), "value")
+        self.shared.delete("key")
+        self.assertEqual(self.cache.get("key"), "value")
+
+    def test_local_tier_is_keyed_by_version(self):
+        self.cache.set("key", "one", version=1)
+        self.cache.set("key", "two", version=2)
+        self.assertEqual(self.cache.get("key", version=1), "one")
+        self.assertEqual(self.cache.get("key", version=2), "two")
+        self.assertEqual(self.cache.get("key"), "one")
+        self.cache.delete("key", version=2)
+        self.assertIsNone(self.cache.get("key", version=2))
+        self.assertEqual(self.cache.get("key", version=1), "one")
+
+    def test_local_copies_are_not_shared(self):
+        self.cache.set("key", ["value"])
+        self.cache.get("key").append("mutated")
+        self.assertEqual(self.cache.get("key"), ["value"])
+
+    def test_local_tier_is_bounded(self):
+        cache = TieredCache("", {"OPTIONS": {"SHARED": "shared", "LOCAL_MAX_ENTRIES": 2}})
+        for key in "abc":
+            cache.set(key, key)
+        self.assertEqual(len(cache._local), 2)
+
+    def test_bump_namespace_invalidates_keys(self):
+        key = namespace_key("page", "a")
+        self.cache.set(key, "value")
+        bump_namespace("page")
+        self.assertNotEqual(namespace_key("page", "a"), key)
+        self.assertIsNone(self.cache.get(namespace_key("page", "a")))
+
+    def test_initial_namespace_version_is_cached_locally(self):
+        version = namespace_version("page")
+        self.shared.clear()
+        self.assertEqual(self.cache._local_get("ns:page"), version)
+        self.assertEqual(namespace_version("page"), version)
+
+    def test_lost_versions_are_not_reused(self):
+        version = namespace_version("page")
+        bump_namespace("page")
+        self.cache.clear()
+        with mock.patch("time.time", return_value=time.time() + 1):
+            self.assertGreater(namespace_version("page"), version + 1)
+
+    @override_settings(DEBUG=False, CACHE_URL="")
+    def test_shared_cache_is_required_outside_debug(self):
+        with self.assertRaises(ImproperlyConfigured):
+            require_shared_cache()
+        with self.settings(CACHE_URL="locmem://"):
+            require_shared_cache()
+        with self.settings(DEBUG=True):
+            require_shared_cache()
+
+
+class InlineThread:
+    def __init__(self, target):
+        self.target = target
+
+    def start(self):
+        self.target()
+
+    def join(self):
+        pass
+
+
+class WarmCacheTests(SiteMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        # Rendered in this thread, so the pages of the test's transaction
+        # can be seen and its connection isn't closed.
+        for target, new in (("threading.Thread", InlineThread), ("connections", mock.DEFAULT)):
+            patcher = mock.patch("page.management.commands.warm_cache." + target, new)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def use_shared_cache(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        settings = override_settings(PAGE_CACHE_TIMEOUT=60, CACHES={
+            "default": {"BACKEND": "page.cache.TieredCache", "OPTIONS": {"SHARED": "shared"}},
+            "shared": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": location},
+        })
+        settings.enable()
+        self.addCleanup(settings.disable)
+        bump_namespace(*PAGE_CONTENT_NAMESPACES)
+
+    def warm(self):
+        stdout = io.StringIO()
+        call_command("warm_cache", stdout=stdout, stderr=io.StringIO())
+        return stdout.getvalue()
+
+    def test_refuses_to_warm_a_local_memory_cache(self):
+        with self.assertRaisesMessage(CommandError, "local memory"):
+            self.warm()
+
+    def test_sitemap_pages_are_left_in_the_page_cache(self):
+        self.use_shared_cache()
+        self.assertIn("rendered=2 failed=0", self.warm())
+        hits = metrics.counter_values("page_cache_requests_total").get((("result", "hit"),), 0)
+        self.client.get("/about/")
+        self.assertEqual(metrics.counter_values("page_cache_requests_total")[(("result", "hit"),)], hits + 1)
+
+    def test_server_errors_fail_the_run(self):
+        self.use_shared_cache()
+
+        def serve(page, request, *args, **kwargs):
+            if page.pk == self.about.pk:
+                raise RuntimeError("broken")
+            return original_serve(page, request, *args, **kwargs)
+
+        original_serve = StandardPage.serve
+        with mock.patch.object(StandardPage, "serve", serve), self.assertLogs("django.request", "ERROR"):
+            with self.assertRaisesMessage(CommandError, "1 pages failed: http://testserver/about/"):
+                self.warm()
+
+
+class MenuTreeTests(SiteMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.about.show_in_menus = True
+        self.about.save_revision().publish()
+        self.team = self.about.add_child(instance=StandardPage(title="Team", slug="team", show_in_menus=True))
+
+    def test_menu_holds_pages_in_menus_with_their_children(self):
+        self.home.add_child(instance=StandardPage(title="Hidden", slug="hidden"))
+        menu = menu_tree(self.home)
+        self.assertEqual([item.title for item in menu], ["About"])
+        self.assertTrue(menu[0].show_dropdown)
+        self.assertEqual([child.title for child in menu[0].children], ["Team"])
+
+    def test_publishing_rebuilds_the_menu(self):
+        menu_tree(self.home)
+        contact = self.home.add_child(instance=StandardPage(title="Contact", slug="contact", show_in_menus=True))
+        self.assertEqual([item.title for item in menu_tree(self.home)], ["About"])
+        contact.save_revision().publish()
+        self.assertEqual([item.title for item in menu_tree(self.home)], ["About", "Contact"])
+
+    def test_menu_is_rendered_in_the_header(self):
+        self.assertContains(self.client.get("/"), 'href="/about/"')
+
+
+class RedirectMapTests(SiteMixin, TestCase):
+    def test_site_redirect_wins_over_global_redirect(self):
+        Redirect.objects.create(old_path="/old", redirect_link="https://example.com/global")
+        Redirect.objects.create(old_path="/old", site=self.site, redirect_link="https://example.com/site")
+        self.assertEqual(find_redirect(self.site.pk, "/old").redirect_link, "https://example.com/site")
+        self.assertEqual(find_redirect(None, "/old").redirect_link, "https://example.com/global")
+
+    def test_map_is_rebuilt_when_redirects_change(self):
+        self.assertIsNone(find_redirect(self.site.pk, "/old"))
+        redirect = Redirect.objects.create(old_path="/old", redirect_link="https://example.com/", is_permanent=False)
+        found = find_redirect(self.site.pk, "/old")
+        self.assertEqual(found.redirect_link, "https://example.com/")
+        self.assertFalse(found.is_permanent)
+        redirect.delete()
+        self.assertIsNone(find_redirect(self.site.pk, "/old"))
+
+    def test_encoded_paths_match(self):
+        Redirect.objects.create(old_path="/caf%C3%A9", redirect_link="https://example.com/")
+        self.assertIsNotNone(find_redirect(self.site.pk, "/café"))
+        self.assertIsNone(find_redirect(self.site.pk, "/old\0"))
+
+    def test_middleware_redirects_missing_pages(self):
+        Redirect.objects.create(old_path="/old", redirect_page=self.about)
+        response = self.client.get("/old/")
+        self.assertRedirects(response, "/about/", status_code=301)
+
+
+class ErrorPageTests(SiteMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.about.show_in_menus = True
+        self.about.save_revision().publish()
+        snapshot_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, snapshot_dir)
+        settings = override_settings(ERROR_PAGE_SNAPSHOT=os.path.join(snapshot_dir, "snapshot.json"))
+        settings.enable()
+        self.addCleanup(settings.disable)
+        errors.refresh_snapshot()
+        self.addCleanup(self.forget_snapshot)
+
+    def forget_snapshot(self):
+        errors._snapshot = {"created": 0, "sites": {}}
+        caches["default"].delete(errors.SNAPSHOT_CACHE_KEY)
+
+    def test_missing_pages_get_the_site_header(self):
+        response = self.client.get("/missing/")
+        self.assertContains(response, "Page not found", status_code=404)
+        self.assertContains(response, 'href="/about/"', status_code=404)
+
+    def test_error_pages_need_no_queries(self):
+        request = RequestFactory().get("/missing/", HTTP_HOST="testserver")
+        with self.assertNumQueries(0):
+            response = errors.error_response(request, "500.html", 500)
+        self.assertEqual(response.status_code, 500)
+        self.assertIn(b'href="/about/"', response.content)
+
+    def test_snapshot_is_read_from_disk_when_memory_and_cache_are_empty(self):
+        self.forget_snapshot()
+        self.assertIn("testserver", errors.load_snapshot()["sites"])
+
+    def test_unknown_hosts_get_the_default_site(self):
+        request = RequestFactory().get("/missing/", HTTP_HOST="elsewhere.example.com")
+        response = errors.error_response(request, "404.html", 404)
+        self.assertIn(b'href="/about/"', response.content)
@@ -0,0 +1,70 @@
+"""
+Plain text statistics of StreamField content, for listings.
+
+``stream_text_stats`` walks a StreamField value once and returns its word
+count, reading time and a plain text excerpt. Rich text and multi-line
+text count towards all three; headings, captions, tables and code count as
+words but are left out of the excerpt. Choices, links, choosers and raw
+HTML are skipped. Pages store the result when they are saved, so
+listings never have to load or walk a body, see ``ArticlePage.save``.
+"""
+import html
+import math
+import re
+
+from django.utils.html import strip_tags
+from django.utils.text import Truncator
+
+from wagtail.blocks import CharBlock, ListBlock, RichTextBlock, StreamBlock, StructBlock, TextBlock
+from wagtail.contrib.table_block.blocks import TableBlock
+from wagtailcodeblock.blocks import CodeBlock
+
+WORDS_PER_MINUTE = 230
+EXCERPT_LENGTH = 300
+
+WHITESPACE_RE = re.compile(r"\s+")
+
+
+def plain_text(markup):
+    # Block level tags end words too: "<p>a</p><p>b</p>" is two words.
+    return html.unescape(strip_tags(markup.replace("<", " <")))
+
+
+def _walk(block, value):
+    """Yields (is_prose, text) for the text in ``value``."""
+    if value is None:
+        return
+    if isinstance(block, CodeBlock):
+        yield False, value.get("code") or ""
+    elif isinstance(block, StreamBlock):
+        for child in value:
+            yield from _walk(child.block, child.value)
+    elif isinstance(block, StructBlock):
+        for name, child_block in block.child_blocks.items():
+            yield from _walk(child_block, value.get(name))
+    elif isinstance(block, ListBlock):
+        for item in value:
+            yield from _walk(block.child_block, item)
+    elif isinstance(block, RichTextBlock):
+        yield True, plain_text(value.source)
+    elif isinstance(block, TableBlock):
+        yield False, " ".join(str(cell) for row in value.get("data") or [] for cell in row if cell)
+    elif isinstance(block, TextBlock):
+        yield True, str(value)
+    elif isinstance(block, CharBlock):
+        yield False, str(value)
+
+
+def stream_text_stats(stream_value):
+    """Returns (word count, reading time in minutes, excerpt) of ``stream_value``."""
+    words = 0
+    prose = []
+    for is_prose, text in _walk(stream_value.stream_block, stream_value):
+        text = WHITESPACE_RE.sub(" ", text).strip()
+        if not text:
+            continue
+        words += len(text.split(" "))
+        if is_prose and sum(map(len, prose)) < EXCERPT_LENGTH:
+            prose.append(text)
+    excerpt = Truncator(" ".join(prose)).chars(EXCERPT_LENGTH)
+    return words, math.ceil(words / WORDS_PER_MINUTE), excerpt
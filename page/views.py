@@ -1,3 +1,84 @@
-from django.shortcuts import render
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
 
-# Create your views here.
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import Http404, HttpResponse
+
+from wagtail.views import serve as wagtail_serve
+
+from . import memory, metrics
+from .errors import error_response
+
+# Wagtail's serve() is synchronous. Under ASGI it runs here, so the number
+# of requests touching the database at once stays bounded no matter how
+# many connections the event loop holds open.
+_serve_executor = ThreadPoolExecutor(
+    max_workers=settings.ASYNC_SERVE_THREADS, thread_name_prefix="serve"
+)
+# Requests handed to the executor and not answered yet. Only changed on the
+# event loop's thread.
+_serve_pending = 0
+
+
+def _serve_sync(request, path):
+    close_old_connections()
+    try:
+        response = wagtail_serve(request, path)
+        # Templates query lazily, so render inside this thread too.
+        if hasattr(response, "render"):
+            response.render()
+        return response
+    finally:
+        close_old_connections()
+
+
+def _set_serve_queued():
+    metrics.set_gauge("serve_threads_queued", max(0, _serve_pending - settings.ASYNC_SERVE_THREADS))
+
+
+async def serve(request, path):
+    """Async counterpart of wagtail.views.serve, used by asgi.py."""
+    global _serve_pending
+    loop = asyncio.get_running_loop()
+    send = getattr(request, "scope", {}).get("early_hints")
+    if send is not None:
+        def send_early_hints(links):
+            # Called from the serve thread once the hero image is known.
+            message = {"type": "http.response.early_hint", "links": [link.encode() for link in links]}
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        request.send_early_hints = send_early_hints
+    context = contextvars.copy_context()
+    _serve_pending += 1
+    _set_serve_queued()
+    try:
+        return await loop.run_in_executor(
+            _serve_executor, functools.partial(context.run, _serve_sync, request, path)
+        )
+    finally:
+        _serve_pending -= 1
+        _set_serve_queued()
+
+
+def metrics_view(request):
+    token = settings.METRICS_TOKEN
+    if not token or request.headers.get("Authorization") != "Bearer {}".format(token):
+        raise Http404
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4")
+
+
+def memory_view(request):
+    if not settings.MEMORY_PROFILING or not request.user.is_staff:
+        raise Http404
+    return HttpResponse(memory.report(), content_type="text/plain")
+
+
+def page_not_found(request, exception=None):
+    return error_response(request, "404.html", 404)
+
+
+def server_error(request):
+    return error_response(request, "500.html", 500)
@@ -0,0 +1,25 @@
+from wagtail import hooks
+
+from .edge_cache import add_surrogate_keys, cache_control_for, page_keys
+from .preload import hero_preload_links, static_preload_links
+
+
+@hooks.register("before_serve_page")
+def record_page_model(page, request, serve_args, serve_kwargs):
+    # Groups requests by page type in page/memory.py
+    request.page_model = page._meta.label_lower
+
+
+@hooks.register("before_serve_page")
+def set_edge_cache_policy(page, request, serve_args, serve_kwargs):
+    request.cache_control = cache_control_for(page)
+    add_surrogate_keys(request, *page_keys(page))
+
+
+@hooks.register("before_serve_page")
+def preload_hero_image(page, request, serve_args, serve_kwargs):
+    links = hero_preload_links(page)
+    request.preload_links = list(static_preload_links()) + links
+    # The static links went out before the view ran, see asgi.py
+    if links and hasattr(request, "send_early_hints"):
+        request.send_early_hints(links)
@@ -41,6 +41,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "page.middleware.metrics_middleware",
+    "page.middleware.memory_middleware",
+    "page.middleware.page_cache_middleware",
+    "page.middleware.replica_middleware",
+    "page.middleware.site_middleware",
+    "page.middleware.preload_middleware",
+    "page.middleware.edge_cache_middleware",
+    "page.middleware.anonymous_middleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -49,7 +57,7 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
-    "wagtail.contrib.redirects.middleware.RedirectMiddleware",
+    "page.middleware.CachedRedirectMiddleware",
 ]
 
 sentry_dsn = os.environ.get("SENTRY_DSN", "")
@@ -88,9 +96,126 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "wsgi.application"
+ASGI_APPLICATION = "asgi.application"
+
+# Set by asgi.py: serve pages through the async view in page/views.py
+ASYNC_PAGE_SERVING = os.environ.get("ASYNC_PAGE_SERVING") == "True"
+ASYNC_SERVE_THREADS = int(os.environ.get("ASYNC_SERVE_THREADS", default="4"))
+if ASYNC_PAGE_SERVING:
+    # asgi.py serves static files before Django, as WhiteNoiseMiddleware is
+    # sync only and would send every request through a thread.
+    MIDDLEWARE.remove("whitenoise.middleware.WhiteNoiseMiddleware")
+
+# Seconds to cache whole pages for anonymous visitors, 0 to disable
+PAGE_CACHE_TIMEOUT = int(os.environ.get("PAGE_CACHE_TIMEOUT", default="60"))
+
+# Cache-Control for anonymous responses by page model, "default" for the
+# rest. Publishing purges pages at the edge, see page/edge_cache.py, so
+# s-maxage can be long; max-age is what browsers keep without asking.
+EDGE_CACHE_CONTROL = {
+    "default": "public, max-age=60, s-maxage=300",
+    "article.articlepage": "public, max-age=300, s-maxage=86400",
+    "article.articleindexpage": "public, max-age=60, s-maxage=3600",
+    "page.standardpage": "public, max-age=300, s-maxage=86400",
+}
+# Where surrogate key purges go: EDGE_PURGE_URL receives a PURGE request with
+# the keys in a Surrogate-Key header. Try it with `manage.py purge_standin`.
+EDGE_PURGE_URL = os.environ.get("EDGE_PURGE_URL", default="")
+if EDGE_PURGE_URL:
+    EDGE_PURGE = {
+        "BACKEND": "page.edge_cache.HTTPBackend",
+        "LOCATION": EDGE_PURGE_URL,
+        "METHOD": os.environ.get("EDGE_PURGE_METHOD", default="PURGE"),
+        "HEADERS": {"Authorization": os.environ["EDGE_PURGE_AUTHORIZATION"]}
+        if os.environ.get("EDGE_PURGE_AUTHORIZATION") else {},
+    }
+else:
+    EDGE_PURGE = None
+
+# Per-route RSS growth and tracemalloc snapshots every
+# MEMORY_SAMPLE_INTERVAL seconds, reported to staff at /memory. Slows every
+# allocation down, see page/memory.py.
+MEMORY_PROFILING = os.environ.get("MEMORY_PROFILING") == "True"
+MEMORY_SAMPLE_INTERVAL = int(os.environ.get("MEMORY_SAMPLE_INTERVAL", default="300"))
+MEMORY_TRACE_FRAMES = int(os.environ.get("MEMORY_TRACE_FRAMES", default="1"))
+
+# Bearer token for /metrics, the endpoint is disabled when unset
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", default="")
+
+# Shared cache for every process and replica: redis://, memcached://host:port
+# or file:///path. locmem:// keeps it in each process, which only works for a
+# single process; outside DEBUG wsgi.py and asgi.py refuse to start without
+# CACHE_URL, see page/cache.py
+CACHE_URL = os.environ.get("CACHE_URL", default="")
+if CACHE_URL.startswith(("redis://", "rediss://")):
+    SHARED_CACHE = {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": CACHE_URL}
+elif CACHE_URL.startswith("memcached://"):
+    SHARED_CACHE = {
+        "BACKEND": "django.core.cache.backends.memcached.PyMemcacheCache",
+        "LOCATION": CACHE_URL[len("memcached://"):],
+    }
+elif CACHE_URL.startswith("file://"):
+    SHARED_CACHE = {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": CACHE_URL[len("file://"):],
+    }
+else:
+    SHARED_CACHE = {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+
+# The default cache keeps a small LRU per process in front of the shared
+# one, see page/cache.py
+CACHES = {
+    "default": {
+        "BACKEND": "page.cache.TieredCache",
+        "OPTIONS": {
+            "SHARED": "shared",
+            "LOCAL_MAX_ENTRIES": int(os.environ.get("CACHE_LOCAL_MAX_ENTRIES", default="500")),
+            "LOCAL_TIMEOUT": float(os.environ.get("CACHE_LOCAL_TIMEOUT", default="5")),
+        },
+    },
+    "shared": SHARED_CACHE,
+}
+
+# Header and footer snapshot used by the 404 and 500 pages, see page/errors.py
+ERROR_PAGE_SNAPSHOT = os.environ.get("ERROR_PAGE_SNAPSHOT", default="/tmp/error_page_snapshot.json")
+ERROR_PAGE_SNAPSHOT_MAX_AGE = int(os.environ.get("ERROR_PAGE_SNAPSHOT_MAX_AGE", default="300"))
 
 DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite://:memory:")
-DATABASES = {"default": dj_database_url.parse(DATABASE_URL)}
+DATABASE_CONN_MAX_AGE = int(os.environ.get("DATABASE_CONN_MAX_AGE", default="600"))
+DATABASES = {
+    "default": dj_database_url.parse(
+        DATABASE_URL,
+        conn_max_age=DATABASE_CONN_MAX_AGE,
+        conn_health_checks=True,
+    )
+}
+
+# Comma separated read replicas of DATABASE_URL, see page/db/routers.py.
+# Anonymous GET requests read from one of them, except for
+# DATABASE_REPLICA_PIN_SECONDS after a publish, while caches are rebuilt.
+DATABASE_REPLICA_URLS = [url.strip() for url in os.environ.get("DATABASE_REPLICA_URLS", default="").split(",") if url.strip()]
+DATABASE_REPLICA_PIN_SECONDS = int(os.environ.get("DATABASE_REPLICA_PIN_SECONDS", default="10"))
+for i, url in enumerate(DATABASE_REPLICA_URLS):
+    DATABASES["replica_{}".format(i)] = dict(
+        dj_database_url.parse(url, conn_max_age=DATABASE_CONN_MAX_AGE, conn_health_checks=True),
+        TEST={"MIRROR": "default"},
+    )
+if DATABASE_REPLICA_URLS:
+    DATABASE_ROUTERS = ["page.db.routers.ReplicaRouter"]
+
+# Pool Postgres connections per process with psycopg_pool, see
+# page/db/postgresql/base.py. Connections go back to the pool after each
+# request instead of being held by a thread.
+DATABASE_POOL = os.environ.get("DATABASE_POOL") == "True"
+for database in DATABASES.values():
+    if DATABASE_POOL and database["ENGINE"] == "django.db.backends.postgresql":
+        database["ENGINE"] = "page.db.postgresql"
+        database["CONN_MAX_AGE"] = 0
+        database.setdefault("OPTIONS", {})["pool"] = {
+            "min_size": int(os.environ.get("DATABASE_POOL_MIN_SIZE", default="1")),
+            "max_size": int(os.environ.get("DATABASE_POOL_MAX_SIZE", default="4")),
+            "timeout": float(os.environ.get("DATABASE_POOL_TIMEOUT", default="10")),
+        }
 
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
@@ -132,6 +257,26 @@ AWS_S3_ENDPOINT_URL = os.environ.get("AWS_S3_ENDPOINT_URL", default=None)
 AWS_S3_FILE_OVERWRITE = False
 AWS_S3_SIGNATURE_VERSION = os.environ.get("AWS_S3_SIGNATURE_VERSION", default="s3v4")
 AWS_DEFAULT_ACL = "public-read"
+# Used by page.storage.HashedS3Storage: files from this size up are uploaded
+# in parts of AWS_S3_MULTIPART_CHUNKSIZE bytes, AWS_S3_MAX_CONCURRENCY at a time.
+AWS_S3_MULTIPART_THRESHOLD = int(os.environ.get("AWS_S3_MULTIPART_THRESHOLD", default=16 * 1024 * 1024))
+AWS_S3_MULTIPART_CHUNKSIZE = int(os.environ.get("AWS_S3_MULTIPART_CHUNKSIZE", default=8 * 1024 * 1024))
+AWS_S3_MAX_CONCURRENCY = int(os.environ.get("AWS_S3_MAX_CONCURRENCY", default=4))
+AWS_S3_MAX_POOL_CONNECTIONS = int(os.environ.get("AWS_S3_MAX_POOL_CONNECTIONS", default=20))
+
+# Document downloads, see page/documents.py. Restricted documents are kept
+# private and redirected to S3 URLs signed for DOCUMENT_URL_EXPIRY seconds. Set
+# DOCUMENT_ACCEL_REDIRECT to an internal nginx location (e.g. "/protected/")
+# to hand every download to the proxy with X-Accel-Redirect instead.
+DOCUMENT_URL_EXPIRY = int(os.environ.get("DOCUMENT_URL_EXPIRY", default=300))
+DOCUMENT_ACCEL_REDIRECT = os.environ.get("DOCUMENT_ACCEL_REDIRECT", default=None)
+
+# Static site export, see page/static_export.py
+STATIC_EXPORT_ROOT = os.environ.get("STATIC_EXPORT_ROOT", default="/data/static_export")
+STATIC_EXPORT_BUCKET = os.environ.get("STATIC_EXPORT_BUCKET", default=AWS_STORAGE_BUCKET_NAME)
+STATIC_EXPORT_PREFIX = os.environ.get("STATIC_EXPORT_PREFIX", default="site/")
+STATIC_EXPORT_CACHE_CONTROL = "public, max-age=300"
+STATIC_EXPORT_ON_PUBLISH = os.environ.get("STATIC_EXPORT_ON_PUBLISH") == "True"
 
 
 # Static files (CSS, JavaScript, Images)
@@ -145,13 +290,24 @@ STATIC_URL = "/static/"
 STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
 
 if DEBUG == True:
-    storage_backend = "django.core.files.storage.FileSystemStorage"
+    storage_backend = "page.storage.FileSystemStorage"
 else:
-    storage_backend = "storages.backends.s3boto3.S3Boto3Storage"
+    storage_backend = "page.storage.HashedS3Storage"
 
 STORAGES = {
     "default": {"BACKEND": storage_backend},
-    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+    # Content-hashed names plus gzip and brotli variants, written by
+    # collectstatic. WhiteNoise serves hashed files with immutable headers.
+    "staticfiles": {"BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage"},
+}
+
+# Compressed (brotli, else gzip) size limits in bytes, checked by
+# `manage.py check_static_budgets` after collectstatic.
+STATIC_ASSET_BUDGETS = {
+    "vendor/bootstrap/css/bootstrap.min.css": 30 * 1024,
+    "vendor/bootstrap/js/bootstrap.bundle.min.js": 30 * 1024,
+    "css/base.min.css": 20 * 1024,
+    "js/base.min.js": 10 * 1024,
 }
 
 # Media files
@@ -185,6 +341,8 @@ DEFAULT_AUTO_FIELD = "django.db.models.AutoField"
 # Make low-quality but small images
 WAGTAILIMAGES_JPEG_QUALITY = 40
 WAGTAILIMAGES_WEBP_QUALITY = 45
+# Reuse the stored file of an identical image instead of uploading a copy
+WAGTAILIMAGES_DEDUPLICATE_UPLOADS = True
 WAGTAIL_ENABLE_WHATS_NEW_BANNER = False
 WAGTAILEMBEDS_FINDERS = [{"class": "wagtail.embeds.finders.oembed"}]
 
@@ -8,11 +8,22 @@ from wagtail import urls as wagtail_urls
 from wagtail.documents import urls as wagtaildocs_urls
 from wagtail.contrib.sitemaps.views import sitemap
 
+from page import documents as page_documents
+from page import views as page_views
+
+# Rendered from a snapshot of the header and footer, see page/errors.py
+handler404 = page_views.page_not_found
+handler500 = page_views.server_error
+
 urlpatterns = [
     path('django-admin/', admin.site.urls),
+    path('metrics', page_views.metrics_view),
+    path('memory', page_views.memory_view),
     re_path(r'^robots\.txt', TemplateView.as_view(template_name='robots.txt', content_type='text/plain')),
     re_path(r'^sitemap\.xml$', sitemap),
     path('admin/', include(wagtailadmin_urls)),
+    # Matched before wagtaildocs_urls, see page/documents.py
+    re_path(r'^documents/(\d+)/(.*)$', page_documents.serve, name='wagtaildocs_serve'),
     path('documents/', include(wagtaildocs_urls)),
 ]
 
@@ -25,6 +36,13 @@ if settings.DEBUG:
     urlpatterns += staticfiles_urlpatterns()
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 
+if settings.ASYNC_PAGE_SERVING:
+    # Same pattern as wagtail.urls, matched first so pages are served by
+    # the async view when running under asgi.py.
+    urlpatterns += [
+        re_path(r"^((?:[\w\-]+/)*)$", page_views.serve, name="wagtail_serve"),
+    ]
+
 urlpatterns = urlpatterns + [
     # For anything not caught by a more specific rule above, hand over to
     # Wagtail's page serving mechanism. This should be the last pattern in
@@ -1,7 +1,35 @@
 import os
+import time
 
 from django.core.wsgi import get_wsgi_application
 
+started = time.perf_counter()
+
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "settings")
 
 application = get_wsgi_application()
+
+from page.cache import require_shared_cache  # noqa: E402
+
+require_shared_cache()
+
+if os.environ.get("PRELOAD_APP") == "True":
+    # uWSGI imports this module in the master and forks the workers from
+    # it, see page/startup.py.
+    import gc
+
+    from page.startup import warm_up
+
+    warm_up(started)
+    gc.freeze()
+
+    try:
+        from uwsgidecorators import postfork
+    except ImportError:
+        pass
+    else:
+        @postfork
+        def worker_started():
+            from page import metrics
+
+            metrics.set_gauge("worker_started_timestamp_seconds", time.time())